@@ -0,0 +1,366 @@
+"""
+JSON API (``/hospital/api/v1/``) for the high-traffic lists and for
+integrations such as the lab analysers and the pharmacy counter.
+
+Reads
+    Rows are plain ``values()`` dicts with names joined in SQL, paginated
+    with the same keyset cursors as the HTML lists (see ``listing.py``) and
+    fetched with the async ORM.  ``?fields=id,status`` selects columns; the
+    ordering columns are always included because the cursor is built from
+    them.
+
+Batched writes
+    ``POST .../<kind>/batch/`` creates and ``PATCH .../<kind>/batch/``
+    updates up to ``MAX_BATCH`` records, given as ``{"records": [...]}``.
+    A batch is all or nothing.  Every record is validated first, foreign
+    keys with one query per key for the whole batch.  The rows are then
+    written with one ``bulk_create`` or ``bulk_update`` in one transaction,
+    and the ``records_bulk_*`` signals bring search, rollups and caches up
+    to date.  A batch costs the same handful of queries whatever its size.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .exports import full_name
+from .listing import paginate_keyset
+from .models import NOTHING_OWNED, Appointment, Billing, InventoryItem, LabTest, Medicine, Patient
+from .signals import records_bulk_created, records_bulk_updated
+
+MAX_BATCH = 1000
+
+
+class BatchError(Exception):
+    """A rejected batch; ``errors`` is ``[{"index": i, "errors": {field: [messages]}}]``."""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid records')
+        self.errors = errors
+
+
+def _stamp_completion(instance, fields):
+    """A lab test reported as completed gets its completion time (see reports.py)."""
+    if 'status' in fields and instance.status == 'completed' and instance.completed_at is None:
+        instance.completed_at = timezone.now()
+        fields.add('completed_at')
+
+
+# kind -> model, ordering (last column unique), status field,
+# {output name: model field or expression}, and for writable kinds the
+# roles that may write and the fields accepted on create and on update.
+# Kinds with dashboard counters on row values (stats.TRACKED_FIELDS) must
+# stay read-only: bulk updates do not adjust counters.
+RESOURCES = {
+    'appointments': {
+        'model': Appointment,
+        'ordering': ('-appointment_date', '-id'),
+        'status_field': 'status',
+        'fields': {
+            'id': 'id',
+            'appointment_date': 'appointment_date',
+            'start_time': 'start_time',
+            'end_time': 'end_time',
+            'time_slot': 'time_slot',
+            'status': 'status',
+            'reason': 'reason',
+            'patient_id': 'patient_id',
+            'patient_name': full_name('patient__user'),
+            'doctor_id': 'doctor_id',
+            'doctor_name': full_name('doctor__user'),
+        },
+    },
+    'labtests': {
+        'model': LabTest,
+        'ordering': ('-test_date', '-id'),
+        'status_field': 'status',
+        'fields': {
+            'id': 'id',
+            'test_date': 'test_date',
+            'test_name': 'test_name',
+            'status': 'status',
+            'result': 'result',
+            'patient_id': 'patient_id',
+            'patient_name': full_name('patient__user'),
+            'doctor_id': 'doctor_id',
+            'doctor_name': full_name('doctor__user'),
+        },
+        'writers': {'admin', 'doctor', 'nurse'},
+        'create': {'patient_id', 'doctor_id', 'test_name', 'result', 'status'},
+        'update': {'test_name', 'result', 'status'},
+        'on_write': _stamp_completion,
+    },
+    'billing': {
+        'model': Billing,
+        'ordering': ('-payment_date', '-id'),
+        'status_field': 'payment_status',
+        'fields': {
+            'id': 'id',
+            'payment_date': 'payment_date',
+            'patient_id': 'patient_id',
+            'patient_name': full_name('patient__user'),
+            'appointment_id': 'appointment_id',
+            'amount': 'amount',
+            'tax': 'tax',
+            'discount': 'discount',
+            'total': 'total',
+            'payment_method': 'payment_method',
+            'payment_status': 'payment_status',
+        },
+    },
+    'patients': {
+        'model': Patient,
+        'ordering': ('-id',),
+        'status_field': None,
+        'fields': {
+            'id': 'id',
+            'name': full_name('user'),
+            'gender': 'gender',
+            'date_of_birth': 'date_of_birth',
+            'blood_group': 'blood_group',
+            'contact': 'contact',
+        },
+    },
+    'medicines': {
+        'model': Medicine,
+        'ordering': ('-id',),
+        'status_field': None,
+        'fields': {
+            'id': 'id',
+            'name': 'name',
+            'manufacturer': 'manufacturer',
+            'price': 'price',
+            'expiry_date': 'expiry_date',
+            'stock': 'stock',
+            'reorder_level': 'reorder_level',
+        },
+        'writers': {'admin', 'nurse'},
+        'create': {'name', 'description', 'manufacturer', 'price', 'expiry_date', 'stock', 'reorder_level'},
+        'update': {'price', 'expiry_date', 'stock', 'reorder_level'},
+    },
+    'inventory': {
+        'model': InventoryItem,
+        'ordering': ('-id',),
+        'status_field': None,
+        'fields': {
+            'id': 'id',
+            'name': 'name',
+            'category': 'category',
+            'quantity': 'quantity',
+            'unit': 'unit',
+            'expiry_date': 'expiry_date',
+            'reorder_level': 'reorder_level',
+        },
+        'writers': {'admin', 'nurse'},
+        'create': {'name', 'category', 'quantity', 'unit', 'expiry_date', 'reorder_level'},
+        'update': {'quantity', 'expiry_date', 'reorder_level'},
+    },
+}
+
+
+# ---------------------------------------------------------------------------
+# Reads
+# ---------------------------------------------------------------------------
+
+def selected_fields(kind, requested):
+    """
+    The output names asked for in ``?fields=`` (all when empty), plus the
+    ordering columns.  ``ValueError`` names any unknown field.
+    """
+    resource = RESOURCES[kind]
+    names = [name for name in (requested or '').split(',') if name]
+    if not names:
+        return list(resource['fields'])
+    unknown = [name for name in names if name not in resource['fields']]
+    if unknown:
+        raise ValueError(f'Unknown fields for {kind}: {", ".join(unknown)}.')
+    for column in resource['ordering']:
+        if column.lstrip('-') not in names:
+            names.append(column.lstrip('-'))
+    return names
+
+
+def resource_values(kind, queryset, status=None, fields=None):
+    """``queryset`` reduced to the resource's output columns (or ``fields`` of them)."""
+    resource = RESOURCES[kind]
+    if status and resource['status_field']:
+        queryset = queryset.filter(**{resource['status_field']: status})
+    wanted = {name: resource['fields'][name] for name in (fields or resource['fields'])}
+    columns = {
+        name: F(source) if isinstance(source, str) else source
+        for name, source in wanted.items()
+        if name != source
+    }
+    plain = [name for name, source in wanted.items() if name == source]
+    return queryset.values(*plain, **columns)
+
+
+async def apage(request, kind, queryset):
+    """
+    One page of ``kind`` as ``{"results": [...], "next": cursor}``.
+    ``ValueError`` for an unknown ``?fields=`` name.
+    """
+    resource = RESOURCES[kind]
+    fields = selected_fields(kind, request.GET.get('fields'))
+    values = resource_values(kind, queryset, request.GET.get('status'), fields)
+    page = paginate_keyset(request, values, resource['ordering'])
+    rows = await page.afetch()
+    return {'results': rows, 'next': page.next_cursor}
+
+
+# ---------------------------------------------------------------------------
+# Batched writes
+# ---------------------------------------------------------------------------
+
+def _field_errors(error):
+    return error.message_dict if hasattr(error, 'error_dict') else {'__all__': error.messages}
+
+
+def _assign(model, instance, record, allowed, errors):
+    """
+    Copy ``record`` onto ``instance``; foreign keys are converted but not
+    looked up.  Returns the attnames set.
+    """
+    columns = {field.attname: field for field in model._meta.concrete_fields}
+    touched = set()
+    for name, value in record.items():
+        if name == 'id':
+            continue
+        if name not in allowed:
+            errors.setdefault(name, []).append('This field cannot be written.')
+            continue
+        field = columns[name]
+        if field.is_relation and value is not None:
+            try:
+                value = field.target_field.to_python(value)
+            except ValidationError as exc:
+                errors.setdefault(name, []).extend(exc.messages)
+                continue
+        setattr(instance, name, value)
+        touched.add(name)
+    return touched
+
+
+def _check_foreign_keys(model, instances, errors_by_index):
+    """One ``pk__in`` query per foreign key, for the whole batch."""
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        wanted = {getattr(instance, field.attname) for _, instance in instances} - {None}
+        if not wanted:
+            continue
+        found = set(field.related_model._default_manager.filter(pk__in=wanted).values_list('pk', flat=True))
+        for index, instance in instances:
+            value = getattr(instance, field.attname)
+            if value is None and not field.null:
+                errors_by_index[index].setdefault(field.attname, []).append('This field is required.')
+            elif value is not None and value not in found:
+                errors_by_index[index].setdefault(field.attname, []).append(
+                    f'{field.related_model.__name__} {value} does not exist.'
+                )
+
+
+def _validate(model, resource, owner, instances, touched, errors_by_index):
+    """Field validation, ownership and foreign keys for ``[(index, instance)]``."""
+    concrete = model._meta.concrete_fields
+    relations = {field.name for field in concrete if field.is_relation}
+    for index, instance in instances:
+        errors = errors_by_index[index]
+        # New rows are validated whole, updated ones only in the fields sent;
+        # foreign keys are checked for the whole batch below.
+        exclude = set(relations)
+        if instance.pk is not None:
+            exclude.update(field.name for field in concrete if field.attname not in touched[index])
+        try:
+            instance.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            for name, messages in _field_errors(exc).items():
+                errors.setdefault(name, []).extend(messages)
+        for attname, value in owner.items():
+            if getattr(instance, attname) != value:
+                errors.setdefault(attname, []).append('You can only write your own records.')
+        if 'on_write' in resource and not errors:
+            resource['on_write'](instance, touched[index])
+    _check_foreign_keys(model, instances, errors_by_index)
+
+
+def _raise_errors(errors_by_index):
+    errors = [{'index': index, 'errors': errors} for index, errors in sorted(errors_by_index.items()) if errors]
+    if errors:
+        raise BatchError(errors)
+
+
+def _records(records):
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise BatchError([{'index': None, 'errors': {'records': ['Expected a list of objects.']}}])
+    if not 0 < len(records) <= MAX_BATCH:
+        raise BatchError([{'index': None, 'errors': {'records': [f'Send 1 to {MAX_BATCH} records.']}}])
+    return records
+
+
+def writable(kind, user):
+    resource = RESOURCES[kind]
+    return 'writers' in resource and (user.is_superuser or user.role in resource['writers'])
+
+
+def batch_create(kind, user, records):
+    """Create every record of ``records`` or none; returns the new ids in order."""
+    resource = RESOURCES[kind]
+    model = resource['model']
+    # A doctor may only write rows they could read back, i.e. their own;
+    # their own id is filled in when a record leaves it out.
+    owner = model.objects.owner_filters(user)
+    records = _records(records)
+    if owner == NOTHING_OWNED:
+        raise BatchError([{'index': None, 'errors': {'records': ['You cannot write these records.']}}])
+    errors_by_index, touched, instances = {}, {}, []
+    for index, record in enumerate(records):
+        errors_by_index[index] = {}
+        instance = model(**owner)
+        touched[index] = _assign(model, instance, record, resource['create'], errors_by_index[index])
+        instances.append((index, instance))
+    _validate(model, resource, owner, instances, touched, errors_by_index)
+    _raise_errors(errors_by_index)
+    with transaction.atomic():
+        created = model.objects.bulk_create([instance for _, instance in instances])
+        records_bulk_created.send(sender=model, instances=created)
+    return [instance.pk for instance in created]
+
+
+def batch_update(kind, user, records):
+    """
+    Apply every ``{"id": ..., field: value}`` in ``records`` or none;
+    returns the updated ids in order.  Rows the user cannot see are "not found".
+    """
+    resource = RESOURCES[kind]
+    model = resource['model']
+    records = _records(records)
+    owner = model.objects.owner_filters(user)
+    with transaction.atomic():
+        ids = [record.get('id') for record in records]
+        rows = model.objects.visible_to(user).select_for_update().in_bulk(
+            [pk for pk in ids if isinstance(pk, int)]
+        )
+        errors_by_index, touched, instances = {}, {}, []
+        for index, record in enumerate(records):
+            errors_by_index[index] = {}
+            instance = rows.get(record.get('id'))
+            if instance is None:
+                errors_by_index[index]['id'] = ['Not found.']
+                continue
+            touched[index] = _assign(model, instance, record, resource['update'], errors_by_index[index])
+            instances.append((index, instance))
+        _validate(model, resource, owner, instances, touched, errors_by_index)
+        _raise_errors(errors_by_index)
+        updated = [instance for _, instance in instances]
+        fields = set().union(*touched.values())
+        if fields:
+            # bulk_update() skips pre_save(), so auto_now columns are set here.
+            for field in model._meta.concrete_fields:
+                if getattr(field, 'auto_now', False):
+                    for instance in updated:
+                        field.pre_save(instance, add=False)
+                    fields.add(field.attname)
+            model.objects.bulk_update(updated, fields)
+            records_bulk_updated.send(sender=model, instances=updated, fields=fields)
+    return [instance.pk for instance in updated]
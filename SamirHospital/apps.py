@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SamirhospitalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'SamirHospital'
+
+    def ready(self):
+        from . import metrics  # noqa: F401  (instruments database connections)
+        from . import signals  # noqa: F401
+        from . import reports  # noqa: F401  (registers background job handlers)
@@ -0,0 +1,376 @@
+"""
+Time-partitioned archival of entry logs and completed appointments.
+
+``manage.py archive_records`` moves rows older than
+``settings.ARCHIVE_HORIZON_DAYS`` out of the live tables, one calendar month
+at a time.  Each batch becomes a gzip-compressed JSON Lines file under
+``settings.ARCHIVE_ROOT``::
+
+    appointments/2024-03/000120-004117.jsonl.gz
+
+Every file is catalogued in an :class:`ArchiveSegment` row that records its
+date span, row count and SHA-256.  Each batch is handled in a single
+transaction, which:
+
+* re-reads the rows and writes and syncs the file,
+* inserts the segment,
+* unlinks any bills from the archived appointments (their ids are kept in
+  the archive as ``bill_ids``, and the doctor on the bill as
+  ``archived_doctor``), and
+* deletes the rows with a raw ``DELETE``.
+
+No ``post_delete`` receivers fire, so the dashboard counters, search index
+and reporting rollups are left alone.  ``stats.compute_counters`` adds
+archived appointments back in from the segment catalogue, and the rollups
+of archived days are frozen (see ``rollups.py``).
+
+List views read the archive through :func:`render_range`.  It merges live
+rows and archived rows for a date range into one keyset-paginated page.
+Only the segments that overlap the range are opened.
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Min, Q, prefetch_related_objects
+from django.shortcuts import render
+from django.utils import timezone
+
+from . import rollups
+from .caching import bump_version
+from .exports import date_bounds
+from .listing import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, KeysetPage, _list_context, decode_cursor,
+    keyset_filter, related_paths,
+)
+from .models import Appointment, ArchiveSegment, Billing, EntryLog
+from .slots import slot_index
+
+SEGMENT_ROWS = 5000
+HASH_CHUNK_SIZE = 64 * 1024
+
+ARCHIVES = {
+    'entrylogs': {
+        'model': EntryLog,
+        'date_field': 'time_in',
+        'eligible': Q(),
+    },
+    'appointments': {
+        'model': Appointment,
+        'date_field': 'appointment_date',
+        'eligible': Q(status='completed'),
+    },
+}
+
+
+def archive_root():
+    return Path(settings.ARCHIVE_ROOT)
+
+
+def horizon(kind, today=None):
+    """First day that stays live for ``kind``."""
+    today = today or timezone.localdate()
+    return today - datetime.timedelta(days=settings.ARCHIVE_HORIZON_DAYS[kind])
+
+
+def _day(value):
+    """The local calendar day of a date or an aware datetime."""
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).date()
+    return value
+
+
+def _next_month(day):
+    return (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+class _ArchiveEncoder(DjangoJSONEncoder):
+    """``DjangoJSONEncoder`` that keeps full microsecond precision."""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+def _write_segment(path, rows):
+    """Write ``rows`` to ``path`` atomically; returns ``(size, checksum)``."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.tmp')
+    try:
+        with open(temp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as output:
+                for row in rows:
+                    output.write(json.dumps(row, cls=_ArchiveEncoder).encode())
+                    output.write(b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    return path.stat().st_size, _sha256(path)
+
+
+def _archive_batch(kind, month, ids, using=DEFAULT_DB_ALIAS):
+    spec = ARCHIVES[kind]
+    model = spec['model']
+    date_field = spec['date_field']
+    attnames = [field.attname for field in model._meta.concrete_fields]
+    root = archive_root()
+    path = None
+    try:
+        with transaction.atomic(using=using):
+            # Re-read under the write lock, so a row edited since ``ids`` were
+            # picked is either archived as it is now or left live.
+            rows = list(
+                model.objects.using(using).select_for_update()
+                .filter(spec['eligible'], pk__in=ids).order_by('pk').values(*attnames)
+            )
+            if not rows:
+                return None
+            ids = [row['id'] for row in rows]
+            if model is Appointment:
+                bills = {}
+                for appointment_id, bill_id in (Billing.objects.using(using)
+                                                .filter(appointment_id__in=ids)
+                                                .values_list('appointment_id', 'pk')):
+                    bills.setdefault(appointment_id, []).append(bill_id)
+                for row in rows:
+                    row['bill_ids'] = bills.get(row['id'], [])
+
+            relative = f'{kind}/{month:%Y-%m}/{ids[0]:06d}-{ids[-1]:06d}.jsonl.gz'
+            path = root / relative
+            size, checksum = _write_segment(path, rows)
+            days = [_day(row[date_field]) for row in rows]
+            segment = ArchiveSegment.objects.using(using).create(
+                kind=kind, month=month, path=relative, row_count=len(rows),
+                first_date=min(days), last_date=max(days), size=size, checksum=checksum,
+            )
+            if model is Appointment:
+                by_doctor = {}
+                for row in rows:
+                    by_doctor.setdefault(row['doctor_id'], []).append(row['id'])
+                for doctor_id, appointment_ids in by_doctor.items():
+                    Billing.objects.using(using).filter(appointment_id__in=appointment_ids).update(
+                        appointment=None, archived_doctor_id=doctor_id,
+                    )
+                bump_version(Billing)
+            model.objects.using(using).filter(pk__in=ids)._raw_delete(using)
+            bump_version(model)
+            bump_version(ArchiveSegment)
+    except BaseException:
+        if path is not None and path.exists():
+            path.unlink()
+        raise
+    return segment
+
+
+def archive(kind, before=None, batch_size=SEGMENT_ROWS, dry_run=False, log=None):
+    """
+    Archive every eligible ``kind`` row dated before ``before`` (default: the
+    configured horizon).  Returns ``(segments written, rows archived)``; with
+    ``dry_run`` nothing is written and the segments figure is an estimate.
+    """
+    log = log or (lambda message: None)
+    spec = ARCHIVES[kind]
+    model = spec['model']
+    date_field = spec['date_field']
+    before = before or horizon(kind)
+    eligible = model.objects.filter(spec['eligible'])
+    oldest = eligible.filter(
+        **date_bounds(model, date_field, None, before - datetime.timedelta(days=1))
+    ).aggregate(oldest=Min(date_field))['oldest']
+    if oldest is None:
+        return 0, 0
+
+    if model is Appointment and not dry_run:
+        # Archived days are frozen in the reporting rollups; settle them
+        # while their appointments are still live.
+        for rollup, spec in rollups.ROLLUPS.items():
+            if spec['frozen_by_archive']:
+                rollups.refresh(rollup, None, before - datetime.timedelta(days=1))
+
+    segments = archived = 0
+    month = _day(oldest).replace(day=1)
+    while month < before:
+        last_day = min(_next_month(month), before) - datetime.timedelta(days=1)
+        ids = list(
+            eligible.filter(**date_bounds(model, date_field, month, last_day))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            if dry_run:
+                segments += 1
+                archived += len(batch)
+                continue
+            segment = _archive_batch(kind, month, batch)
+            if segment is not None:
+                segments += 1
+                archived += segment.row_count
+                log(f'{segment.path}: {segment.row_count} rows, {segment.size} bytes')
+        month = _next_month(month)
+
+    if archived and model is Appointment and not dry_run:
+        slot_index.invalidate()
+    return segments, archived
+
+
+def verify(kind=None):
+    """Segments whose file is missing or no longer matches its checksum."""
+    segments = ArchiveSegment.objects.order_by('pk')
+    if kind:
+        segments = segments.filter(kind=kind)
+    damaged = []
+    for segment in segments:
+        path = archive_root() / segment.path
+        if not path.exists() or _sha256(path) != segment.checksum:
+            damaged.append(segment)
+    return damaged
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def segments_for(kind, date_from=None, date_to=None):
+    """Segments of ``kind`` that overlap the inclusive range, newest first."""
+    segments = ArchiveSegment.objects.filter(kind=kind)
+    if date_from:
+        segments = segments.filter(last_date__gte=date_from)
+    if date_to:
+        segments = segments.filter(first_date__lte=date_to)
+    return segments.order_by('-last_date', '-first_date', '-pk')
+
+
+def read_segment(segment):
+    """Yield the archived rows of ``segment`` as unsaved model instances."""
+    model = ARCHIVES[segment.kind]['model']
+    fields = [(field.attname, field) for field in model._meta.concrete_fields]
+    with gzip.open(archive_root() / segment.path, 'rt') as source:
+        for line in source:
+            data = json.loads(line)
+            obj = model(**{attname: field.to_python(data[attname]) for attname, field in fields})
+            obj._state.adding = False
+            obj._state.db = DEFAULT_DB_ALIAS
+            obj.archived = True
+            if 'bill_ids' in data:
+                obj.archived_bill_ids = data['bill_ids']
+            yield obj
+
+
+class RangePage(KeysetPage):
+    """A :class:`KeysetPage` of already merged rows; never fragment-cached."""
+
+    def __init__(self, queryset, ordering, per_page, params, rows):
+        super().__init__(queryset, ordering, per_page, params)
+        self._set_rows(rows)
+
+    @property
+    def cache_key(self):
+        return None
+
+    async def acache_key(self):
+        return None
+
+
+def _in_range(day, date_from, date_to):
+    return (date_from is None or day >= date_from) and (date_to is None or day <= date_to)
+
+
+def _archived_rows(kind, date_from, date_to, filters, after, limit):
+    """
+    Up to ``limit`` archived rows newest first, matching ``filters`` and
+    sorting strictly after the ``after`` key (``(date, id)``) if given.
+    """
+    date_field = ARCHIVES[kind]['date_field']
+    key = lambda obj: (getattr(obj, date_field), obj.pk)
+    segments = segments_for(kind, date_from, date_to)
+    if after:
+        segments = segments.filter(first_date__lte=_day(after[0]))
+    rows = []
+    for segment in segments:
+        # Segments are visited by descending last_date: once the page is full
+        # and this whole segment is older than its oldest row, stop.
+        if len(rows) >= limit and segment.last_date < _day(key(rows[-1])[0]):
+            break
+        for obj in read_segment(segment):
+            if not _in_range(_day(getattr(obj, date_field)), date_from, date_to):
+                continue
+            if after and key(obj) >= tuple(after):
+                continue
+            if any(getattr(obj, name) != value for name, value in filters.items()):
+                continue
+            rows.append(obj)
+        rows.sort(key=key, reverse=True)
+        del rows[limit:]
+    return rows
+
+
+def range_page(request, template_name, context_name, kind, queryset, date_from=None, date_to=None,
+               filters=None, per_page=DEFAULT_PAGE_SIZE):
+    """
+    One page of live ``queryset`` rows and archived ``kind`` rows in the
+    date range, newest first.  ``filters`` are equality filters on concrete
+    columns (``doctor_id``, ``status``...) applied to both sources.
+    """
+    spec = ARCHIVES[kind]
+    model = spec['model']
+    date_field = spec['date_field']
+    ordering = (f'-{date_field}', '-id')
+    filters = filters or {}
+    try:
+        per_page = int(request.GET.get('per_page', per_page))
+    except ValueError:
+        pass
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+
+    after = None
+    if request.GET.get('cursor'):
+        try:
+            after = decode_cursor(request.GET['cursor'], model, ordering)
+        except InvalidCursor:
+            after = None
+
+    select, prefetch = related_paths(template_name, context_name, model)
+    live = queryset.filter(**filters, **date_bounds(model, date_field, date_from, date_to))
+    if after:
+        live = live.filter(keyset_filter(model, ordering, after))
+    live = live.select_related(*select).prefetch_related(*prefetch).order_by(*ordering)
+    live_rows = list(live[:per_page + 1])
+
+    archived = _archived_rows(kind, date_from, date_to, filters, after, per_page + 1)
+    rows = sorted(live_rows + archived, key=lambda obj: (getattr(obj, date_field), obj.pk),
+                  reverse=True)[:per_page + 1]
+    shown = [obj for obj in rows[:per_page] if getattr(obj, 'archived', False)]
+    if shown:
+        prefetch_related_objects(shown, *select, *prefetch)
+    return RangePage(live, ordering, per_page, request.GET, rows)
+
+
+def render_range(request, template_name, context_name, kind, queryset, date_from=None, date_to=None,
+                 filters=None, per_page=DEFAULT_PAGE_SIZE, extra_context=None):
+    page = range_page(request, template_name, context_name, kind, queryset, date_from, date_to,
+                      filters, per_page)
+    context = _list_context(context_name, page, None, extra_context)
+    return render(request, template_name, context)
@@ -0,0 +1,116 @@
+"""
+Typeahead search for the large pick lists (patients, appointments, users).
+
+Every lookup is a prefix match written as a half-open range
+(``column >= 'abc' AND column < 'abc\\U0010ffff'``) on an indexed column, so
+it is an index range scan on any database.  ``LIKE 'abc%'`` would not be:
+SQLite's case-insensitive ``LIKE`` cannot use a plain B-tree index.
+
+Patients and appointments are looked up among the rows the user may see
+(their ``ROW_POLICY``), so a doctor only finds their own patients.
+"""
+from django.db.models import Q
+
+from .models import Appointment, CustomUser, Doctor, Patient
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Sorts after every real character, closing the prefix range.
+_RANGE_END = '\U0010ffff'
+
+
+def prefix(column, value):
+    return Q(**{f'{column}__gte': value, f'{column}__lt': value + _RANGE_END})
+
+
+def _visible(model, user):
+    """``model``'s rows that ``user`` may see; every row without a user."""
+    return model.objects.all() if user is None else model.objects.visible_to(user)
+
+
+def _merge(limit, *querysets):
+    """Concatenate small per-index result sets, dropping duplicates."""
+    seen, results = set(), []
+    for queryset in querysets:
+        for obj in queryset[:limit]:
+            if obj.pk not in seen:
+                seen.add(obj.pk)
+                results.append(obj)
+            if len(results) >= limit:
+                return results
+    return results
+
+
+def search_patients(term, limit, user):
+    patients = _visible(Patient, user).select_related('user')
+    hits = _merge(
+        limit,
+        patients.filter(prefix('user__name_key', term.lower())).order_by('user__name_key'),
+        patients.filter(prefix('contact', term)).order_by('contact'),
+        patients.filter(prefix('user__username', term)).order_by('user__username'),
+    )
+    return [
+        {'id': patient.pk, 'text': f"{patient.user.get_full_name() or patient.user.username} ({patient.contact})"}
+        for patient in hits
+    ]
+
+
+def search_doctors(term, limit, user):
+    doctors = Doctor.objects.select_related('user', 'department')
+    hits = _merge(
+        limit,
+        doctors.filter(prefix('user__name_key', term.lower())).order_by('user__name_key'),
+        doctors.filter(prefix('user__username', term)).order_by('user__username'),
+    )
+    return [
+        {'id': doctor.pk, 'text': f"Dr. {doctor.user.get_full_name()} ({doctor.department or '-'})"}
+        for doctor in hits
+    ]
+
+
+def search_appointments(term, limit, user):
+    appointments = _visible(Appointment, user).select_related('patient__user', 'doctor__user')
+    hits = _merge(
+        limit,
+        appointments.filter(prefix('patient__user__name_key', term.lower())).order_by('-appointment_date'),
+        appointments.filter(prefix('patient__contact', term)).order_by('-appointment_date'),
+    )
+    return [
+        {'id': appointment.pk, 'text': str(appointment)}
+        for appointment in hits
+    ]
+
+
+def search_users(term, limit, user):
+    hits = _merge(
+        limit,
+        CustomUser.objects.filter(prefix('username', term)).order_by('username'),
+        CustomUser.objects.filter(prefix('name_key', term.lower())).order_by('name_key'),
+    )
+    return [
+        {'id': user.pk, 'text': f"{user.username} ({user.get_full_name() or user.role})"}
+        for user in hits
+    ]
+
+
+SEARCHES = {
+    'patients': search_patients,
+    'doctors': search_doctors,
+    'appointments': search_appointments,
+    'users': search_users,
+}
+
+# Roles allowed to look up each kind; doctors are public to every user.
+ALLOWED_ROLES = {
+    'patients': {'admin', 'doctor', 'nurse'},
+    'appointments': {'admin', 'doctor', 'nurse'},
+    'users': {'admin'},
+}
+
+
+def search(kind, term, limit=DEFAULT_LIMIT, user=None):
+    term = term.strip()
+    if not term:
+        return []
+    return SEARCHES[kind](term, max(1, min(limit, MAX_LIMIT)), user)
@@ -0,0 +1,220 @@
+"""
+Benchmark harness for views and key ORM queries.
+
+Run it against a seeded database (see ``manage.py seed_synthetic``)::
+
+    manage.py run_benchmarks --output baseline.json      # on the main branch
+    manage.py run_benchmarks --baseline baseline.json    # on your branch
+
+Views are requested in-process through the test ``Client``, logged in as
+one user per role.  The figures therefore include middleware, ORM and
+template rendering, but no network or web server.  Use ``load_benchmark``
+against a running server to measure concurrency.
+
+Every case is warmed up and then timed ``iterations`` times, one after
+another.  Compared with a baseline, a case counts as a regression when:
+
+* its chosen latency (``p50`` by default) grows by more than ``tolerance``
+  and by more than ``min_slack_ms``, or
+* it runs more SQL queries, or
+* its HTTP status changed.
+
+Query counts are exact, so they catch N+1 regressions that noisy timings
+would hide.
+"""
+import datetime
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import autocomplete, search
+from .exports import ledger_rows
+from .models import Appointment, Billing, CustomUser, Doctor, EntryLog, LabTest, Patient
+from .slots import available_slots
+from .stats import compute_counters
+
+# name -> (role, url name, url args, query string)
+VIEW_CASES = {
+    'view.dashboard.patient': ('patient', 'dashboard', None, {}),
+    'view.admin_dashboard': ('admin', 'admin_dashboard', None, {}),
+    'view.appointment_list.admin': ('admin', 'appointment_list', None, {}),
+    'view.appointment_list.doctor': ('doctor', 'appointment_list', None, {}),
+    'view.appointment_list.patient': ('patient', 'appointment_list', None, {}),
+    'view.labtest_list.admin': ('admin', 'labtest_list', None, {}),
+    'view.billing_list.admin': ('admin', 'billing_list', None, {}),
+    'view.patient_list.admin': ('admin', 'patient_list', None, {}),
+    'view.doctor_list.admin': ('admin', 'doctor_list', None, {}),
+    'view.medicine_list.admin': ('admin', 'medicine_list', None, {}),
+    'view.entrylog_list.admin': ('admin', 'entrylog_list', None, {}),
+    'view.api_appointments.doctor': ('doctor', 'api_list', ['appointments'], {}),
+    'view.api_dashboard.admin': ('admin', 'api_dashboard', None, {}),
+    'view.search.doctor': ('doctor', 'search', None, {'q': 'diabetes'}),
+    'view.autocomplete_patients.doctor': ('doctor', 'autocomplete', ['patients'], {'q': 'sh'}),
+}
+
+
+def _orm_cases():
+    today = timezone.localdate()
+    doctor_ids = list(Doctor.objects.order_by('pk').values_list('pk', flat=True)[:20])
+    return {
+        'orm.appointment_page': lambda: list(
+            Appointment.objects.select_related('patient__user', 'doctor__user')
+            .order_by('-appointment_date', '-id')[:25]
+        ),
+        'orm.dashboard_counters_full_scan': compute_counters,
+        'orm.full_text_search': lambda: search.search('diabetes'),
+        'orm.autocomplete_patients': lambda: autocomplete.search('patients', 'sh'),
+        'orm.available_slots_week': lambda: available_slots(doctor_ids, today, today + datetime.timedelta(days=6)),
+        'orm.billing_ledger_1000_rows': lambda: list(itertools.islice(ledger_rows('billing'), 1001)),
+    }
+
+
+def _users():
+    """One account per role that has its profile row, or ``None``."""
+    return {
+        'admin': CustomUser.objects.filter(role='admin').order_by('pk').first(),
+        'doctor': CustomUser.objects.filter(role='doctor', doctor__isnull=False).order_by('pk').first(),
+        'patient': CustomUser.objects.filter(role='patient', patient__isnull=False).order_by('pk').first(),
+    }
+
+
+def _summary(timings, queries, status=None):
+    ordered = sorted(timings)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 3)
+
+    result = {
+        'iterations': len(timings),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+        'ops_per_second': round(len(timings) / sum(timings), 1) if sum(timings) else None,
+        'queries': queries,
+    }
+    if status is not None:
+        result['status'] = status
+    return result
+
+
+def measure(call, iterations, warmup):
+    """Time ``call`` ``iterations`` times; the last run's query count is recorded."""
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(iterations - 1):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        outcome = call()
+        timings.append(time.perf_counter() - started)
+    return timings, len(captured), outcome
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        'timestamp': timezone.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'rows': {
+            model._meta.model_name: model.objects.count()
+            for model in (Patient, Doctor, Appointment, Billing, LabTest, EntryLog)
+        },
+    }
+
+
+def run(iterations=50, warmup=5, only=None, cold=False, log=None):
+    """Run every case whose name contains one of ``only``; returns the result document."""
+    log = log or (lambda message: None)
+    selected = (lambda name: any(part in name for part in only)) if only else (lambda name: True)
+    results = {}
+    settings = {'ALLOWED_HOSTS': ['localhost']}
+    if cold:
+        settings['HOSPITAL_CACHE_TIMEOUT'] = 0
+    with override_settings(**settings):
+        clients = {}
+        for role, user in _users().items():
+            if user is not None:
+                clients[role] = Client(SERVER_NAME='localhost')
+                clients[role].force_login(user)
+
+        for name, (role, url_name, args, query) in VIEW_CASES.items():
+            if not selected(name):
+                continue
+            if role not in clients:
+                log(f'{name}: skipped, no {role} account')
+                continue
+            url = reverse(url_name, args=args)
+            timings, queries, response = measure(
+                lambda: clients[role].get(url, query), iterations, warmup,
+            )
+            results[name] = _summary(timings, queries, response.status_code)
+            log(_line(name, results[name]))
+
+        for name, call in _orm_cases().items():
+            if not selected(name):
+                continue
+            timings, queries, _ = measure(call, iterations, warmup)
+            results[name] = _summary(timings, queries)
+            log(_line(name, results[name]))
+    return {'environment': environment(), 'settings': {'iterations': iterations, 'cold': cold},
+            'results': results}
+
+
+def _line(name, result):
+    return (f'{name:<40} p50 {result["p50_ms"]:>9.2f} ms  p95 {result["p95_ms"]:>9.2f} ms  '
+            f'{result["ops_per_second"] or 0:>8.1f}/s  {result["queries"]:>3} queries')
+
+
+def compare(current, baseline, tolerance=0.25, min_slack_ms=1.0, metric='p50_ms'):
+    """
+    ``(name, baseline value, current value, verdict)`` for every case in both
+    documents; the verdict is ``'regression'``, ``'improvement'`` or ``'ok'``.
+    """
+    rows = []
+    for name, now in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        verdict = 'ok'
+        slower = now[metric] - before[metric]
+        if slower > max(before[metric] * tolerance, min_slack_ms):
+            verdict = 'regression'
+        elif -slower > max(before[metric] * tolerance, min_slack_ms):
+            verdict = 'improvement'
+        if now['queries'] > before['queries'] or now.get('status') != before.get('status'):
+            verdict = 'regression'
+        rows.append((name, before, now, verdict))
+    return rows
+
+
+def load(path):
+    with open(path) as source:
+        return json.load(source)
+
+
+def save(document, path):
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2, sort_keys=True)
+        output.write('\n')
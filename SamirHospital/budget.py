@@ -0,0 +1,85 @@
+"""
+Per-request query budgets.
+
+Decorate a view with ``@query_budget(n)`` to declare how many SQL queries its
+body (including template rendering) may run.  When ``QUERY_BUDGET_STRICT`` is
+on — the default under ``DEBUG`` and in the test suite — going over budget
+raises :class:`QueryBudgetExceeded`, so a test that renders the view fails the
+moment someone introduces an N+1 loop.  Otherwise the overrun is only logged.
+
+Async views are supported too.  Their ORM calls run on the request's
+thread-sensitive sync thread, so the counter is installed on that thread's
+connection rather than the event loop's.
+"""
+import logging
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """``connection.execute_wrapper`` callable that records every statement."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+def _check(view_func, counter, limit):
+    if len(counter) > limit:
+        message = '%s ran %d queries (budget %d):\n%s' % (
+            view_func.__name__, len(counter), limit, '\n'.join(counter.queries)
+        )
+        if getattr(settings, 'QUERY_BUDGET_STRICT', settings.DEBUG):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def _install(counter):
+    connection.execute_wrappers.append(counter)
+
+
+def _uninstall(counter):
+    connection.execute_wrappers.remove(counter)
+
+
+def query_budget(limit):
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                counter = QueryCounter()
+                await sync_to_async(_install)(counter)
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                finally:
+                    await sync_to_async(_uninstall)(counter)
+                _check(view_func, counter, limit)
+                return response
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    response = view_func(request, *args, **kwargs)
+                _check(view_func, counter, limit)
+                return response
+
+        _wrapped_view.query_budget = limit
+        return _wrapped_view
+
+    return decorator
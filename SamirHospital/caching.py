@@ -0,0 +1,256 @@
+"""
+Model-versioned caching.
+
+Every model has a version number stored in the cache.  Cached values are
+keyed by the versions of all models they were built from, and the receivers
+in ``signals.py`` bump a model's version whenever one of its rows is saved,
+deleted or bulk-created.  Nothing is ever deleted explicitly: a bump simply
+makes the old keys unreachable and they expire on their own.
+
+Versions are timestamps rather than counters so that a version evicted from
+the cache can never come back with a value that was used before.
+"""
+import datetime
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django import forms
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.lookups import Lookup
+from django.db.models.sql import Query
+
+VERSION_PREFIX = 'hospital:modelver:'
+VALUE_PREFIX = 'hospital:cached:'
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Process-local hit/miss counters, per namespace."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def record(self, namespace, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[namespace] += 1
+
+    def snapshot(self):
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            return {name: {'hits': self.hits[name], 'misses': self.misses[name]} for name in names}
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+stats = CacheStats()
+
+
+def cache_timeout():
+    return getattr(settings, 'HOSPITAL_CACHE_TIMEOUT', 300)
+
+
+def _version_key(model):
+    return VERSION_PREFIX + model._meta.label_lower
+
+
+def model_versions(*models):
+    """Current version of each model, in order; missing versions are created."""
+    keys = [_version_key(model) for model in models]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return tuple(versions)
+
+
+def bump_version(model):
+    """
+    Invalidate everything cached from ``model``.  Bumped once now and once
+    more on commit, so nothing cached from the pre-commit state survives.
+    """
+    key = _version_key(model)
+    cache.set(key, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(key, time.time_ns(), None))
+
+
+def key_for_versions(namespace, versions, *parts):
+    raw = repr((versions, parts))
+    return f'{VALUE_PREFIX}{namespace}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def versioned_key(namespace, models, *parts):
+    return key_for_versions(namespace, model_versions(*models), *parts)
+
+
+def version_time(versions):
+    """When the newest of ``versions`` was set, as an aware datetime."""
+    return datetime.datetime.fromtimestamp(max(versions) / 1e9, tz=datetime.timezone.utc)
+
+
+def cached(namespace, models, builder, *parts, timeout=None):
+    """
+    Return ``builder()`` cached under ``namespace``/``parts`` until any of
+    ``models`` changes.
+    """
+    timeout = cache_timeout() if timeout is None else timeout
+    if not timeout:
+        return builder()
+    key = versioned_key(namespace, models, *parts)
+    value = cache.get(key, _MISSING)
+    stats.record(namespace, value is not _MISSING)
+    if value is _MISSING:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def amodel_versions(*models):
+    """Async :func:`model_versions`."""
+    keys = [_version_key(model) for model in models]
+    found = await cache.aget_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, time.time_ns(), None)
+            found[key] = await cache.aget(key)
+        versions.append(found[key])
+    return tuple(versions)
+
+
+async def aversioned_key(namespace, models, *parts):
+    return key_for_versions(namespace, await amodel_versions(*models), *parts)
+
+
+async def acached(namespace, models, builder, *parts, timeout=None):
+    """Async :func:`cached`; ``builder`` is a coroutine function."""
+    timeout = cache_timeout() if timeout is None else timeout
+    if not timeout:
+        return await builder()
+    key = await aversioned_key(namespace, models, *parts)
+    value = await cache.aget(key, _MISSING)
+    stats.record(namespace, value is not _MISSING)
+    if value is _MISSING:
+        value = await builder()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def _table_models():
+    return {model._meta.db_table: model for model in apps.get_models()}
+
+
+def _query_tables(query):
+    """Tables ``query`` joins, including those of subqueries in its filters and annotations."""
+    tables = set()
+    queries = [query]
+    while queries:
+        query = queries.pop()
+        tables.update(alias.table_name for alias in query.alias_map.values())
+        nodes = [query.where, *query.annotations.values()]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, Query):
+                queries.append(node)
+            elif isinstance(getattr(node, 'query', None), Query):  # Subquery, Exists
+                queries.append(node.query)
+            elif hasattr(node, 'children'):  # WhereNode
+                nodes.extend(node.children)
+            elif isinstance(node, Lookup):
+                nodes.extend((node.lhs, node.rhs))
+            elif hasattr(node, 'get_source_expressions'):
+                nodes.extend(node.get_source_expressions())
+    return tables
+
+
+def queryset_models(queryset):
+    """
+    Every model ``queryset`` reads from: its own, the tables its filters join
+    or read in subqueries, and the ones pulled in by ``select_related``.
+    ``None`` when that cannot be determined (bare ``select_related()`` or
+    ``prefetch_related``), or for ``none()``, which has no SQL to key on and
+    costs nothing to evaluate.
+    """
+    select = queryset.query.select_related
+    if select is True or queryset._prefetch_related_lookups or queryset.query.is_empty():
+        return None
+    tables = _table_models()
+    models = {queryset.model}
+    models.update(tables[table] for table in _query_tables(queryset.query) if table in tables)
+    stack = [(queryset.model, select or {})]
+    while stack:
+        model, tree = stack.pop()
+        for name, subtree in tree.items():
+            related = model._meta.get_field(name).related_model
+            models.add(related)
+            stack.append((related, subtree))
+    return sorted(models, key=lambda m: m._meta.label_lower)
+
+
+def cached_queryset(queryset, namespace='queryset', timeout=None):
+    """Evaluate ``queryset`` through the cache, keyed by its SQL and versions."""
+    models = queryset_models(queryset)
+    if models is None:
+        return list(queryset)
+    sql, params = queryset.query.sql_with_params()
+    return cached(namespace, models, lambda: list(queryset), sql, params, timeout=timeout)
+
+
+async def acached_queryset(queryset, namespace='queryset', timeout=None, chunk_size=2000):
+    """Async :func:`cached_queryset`, reading rows with ``aiterator()``."""
+    async def build():
+        return [obj async for obj in queryset.aiterator(chunk_size=chunk_size)]
+
+    models = queryset_models(queryset)
+    if models is None:
+        return await build()
+    sql, params = queryset.query.sql_with_params()
+    return await acached(namespace, models, build, sql, params, timeout=timeout)
+
+
+# ---------------------------------------------------------------------------
+# Form choices
+# ---------------------------------------------------------------------------
+
+class CachedModelChoiceIterator(forms.models.ModelChoiceIterator):
+    """Render choices from a cached ``[(pk, label), ...]`` list."""
+
+    def _cached_choices(self):
+        field = self.field
+        # Labels usually come from related rows (Doctor -> user name), so give
+        # the field a select_related queryset and those tables version it too.
+        return cached(
+            'choices', queryset_models(field.queryset) or [field.queryset.model],
+            lambda: [(obj.pk, field.label_from_instance(obj)) for obj in field.queryset],
+            str(field.queryset.query),
+        )
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for pk, label in self._cached_choices():
+            yield (forms.models.ModelChoiceIteratorValue(pk, None), label)
+
+    def __len__(self):
+        return len(self._cached_choices()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self._cached_choices())
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """``ModelChoiceField`` whose ``<select>`` is rendered without a query."""
+    iterator = CachedModelChoiceIterator
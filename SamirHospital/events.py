@@ -0,0 +1,306 @@
+"""
+Live updates for reception and ward screens, sent as Server-Sent Events.
+
+When an Appointment, LabTest or EntryLog is saved or deleted, a small delta
+is published once the transaction commits.  The delta carries the row's id
+and the few columns the list pages show.  ``/hospital/events/`` streams
+these deltas to every subscribed screen as ``text/event-stream``, so a
+screen no longer has to reload the whole list to notice a check-in.
+
+The :class:`Broker` is in-process.  Each worker fans out only what its own
+requests wrote, and a management command run elsewhere is not seen at all.
+To share events across workers, put a channel such as Redis pub/sub behind
+:meth:`Broker.publish`.  The subscriber side does not change.
+
+An idle subscription is one asyncio queue and a heartbeat timer.  It holds
+no thread and no database connection: ``hospitalapp/asgi.py`` runs the
+setup of every stream on one shared thread.  So one ASGI worker can keep
+thousands of screens open; ``manage.py load_events`` measures this.
+
+Flow control:
+
+* A heartbeat comment is sent every ``HOSPITAL_EVENTS_HEARTBEAT`` seconds,
+  so proxies keep idle streams open.
+* A screen that falls ``HOSPITAL_EVENTS_QUEUE`` events behind is sent
+  ``reset`` and dropped.  It reloads the page.
+* A reconnecting screen sends ``Last-Event-ID``.  It is replayed what it
+  missed from the recent history, or sent ``reset`` when the history no
+  longer goes back that far.
+
+What a screen receives follows the models' ``ROW_POLICY``.  For example, a
+doctor's stream only carries their own appointments and lab tests.  Entry
+logs go only to admins and nurses.
+"""
+import asyncio
+import itertools
+import json
+import os
+import threading
+from collections import deque
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import NOTHING_OWNED, Appointment, Doctor, EntryLog, LabTest
+
+# kind -> (model, columns sent with each delta besides id and action)
+STREAMS = {
+    'appointment': (Appointment, ('status', 'appointment_date', 'time_slot', 'doctor_id', 'patient_id')),
+    'labtest': (LabTest, ('status', 'test_name', 'doctor_id', 'patient_id')),
+    'entrylog': (EntryLog, ('person_name', 'purpose', 'time_in', 'time_out')),
+}
+# EntryLog has no row policy; only the front desk follows it.
+ENTRYLOG_ROLES = {'admin', 'nurse'}
+
+# Event ids restart with the process; the prefix tells a reconnecting
+# screen's Last-Event-ID from another worker's (or an earlier run's).
+BOOT = os.urandom(4).hex()
+
+RETRY_FRAME = b'retry: 3000\n\n'
+HEARTBEAT_FRAME = b': keep-alive\n\n'
+RESET_FRAME = b'event: reset\ndata: {}\n\n'
+
+
+def heartbeat_seconds():
+    return getattr(settings, 'HOSPITAL_EVENTS_HEARTBEAT', 15)
+
+
+def queue_size():
+    return getattr(settings, 'HOSPITAL_EVENTS_QUEUE', 100)
+
+
+def history_size():
+    return getattr(settings, 'HOSPITAL_EVENTS_HISTORY', 1000)
+
+
+class Event:
+    """One published delta, encoded once for every subscriber."""
+
+    __slots__ = ('seq', 'kind', 'data', 'frame')
+
+    def __init__(self, seq, kind, data):
+        self.seq, self.kind, self.data = seq, kind, data
+        payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        self.frame = f'id: {BOOT}-{seq}\nevent: {kind}\ndata: {payload}\n\n'.encode()
+
+
+# Queued in place of events for a subscriber that fell too far behind.
+RESET = object()
+
+
+class Subscription:
+    """
+    One open stream: the kinds it follows, the row policy for each kind as
+    column filters, and optionally the doctors it is limited to.  Lives on
+    the event loop that created it.
+    """
+
+    def __init__(self, kinds, owners, doctor_ids=None):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size())
+        self.kinds = frozenset(kinds)
+        self.owners = owners
+        self.doctor_ids = doctor_ids
+        self.after = 0  # events up to this seq were handled when subscribing
+
+    def wants(self, event):
+        if event.kind not in self.kinds:
+            return False
+        data = event.data
+        if self.doctor_ids is not None and data.get('doctor_id') not in self.doctor_ids:
+            return False
+        return all(data.get(column) == value for column, value in self.owners[event.kind].items())
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+            return False
+
+
+class Broker:
+    """
+    Fans published events out to subscriptions.  ``publish`` may be called
+    from any thread; delivery happens on each subscriber's event loop, one
+    callback per loop rather than per subscriber.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # event loop -> set of Subscription
+        self._history = deque(maxlen=history_size())
+        self._seq = itertools.count(1)
+
+    def subscribe(self, subscription, last_event_id=None):
+        """
+        Register ``subscription``.  Returns the events it missed since
+        ``last_event_id`` (none without one), or None if the history no
+        longer holds all of them.
+        """
+        with self._lock:
+            self._subscribers.setdefault(subscription.loop, set()).add(subscription)
+            latest = self._history[-1].seq if self._history else 0
+            oldest = self._history[0].seq if self._history else latest + 1
+            # Events up to here are replayed or were published before it subscribed.
+            subscription.after = latest
+            if not last_event_id:
+                return []
+            boot, _, seq = last_event_id.partition('-')
+            if boot != BOOT or not seq.isdigit() or not oldest - 1 <= int(seq) <= latest:
+                return None
+            return [event for event in self._history if event.seq > int(seq) and subscription.wants(event)]
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.loop)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.loop]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, deltas):
+        """Send ``(kind, data)`` deltas to everyone following them."""
+        with self._lock:
+            events = [Event(next(self._seq), kind, data) for kind, data in deltas]
+            self._history.extend(events)
+            loops = list(self._subscribers)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop, events)
+            except RuntimeError:  # the loop has been closed
+                pass
+        return events
+
+    def _deliver(self, loop, events):
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(loop, ()))
+        for subscription in subscribers:
+            for event in events:
+                if event.seq <= subscription.after or not subscription.wants(event):
+                    continue
+                if not subscription.offer(event):
+                    self.unsubscribe(subscription)
+                    break
+
+
+broker = Broker()
+
+
+# ---------------------------------------------------------------------------
+# Publishing (from the receivers in signals.py)
+# ---------------------------------------------------------------------------
+
+def delta(kind, instance, action):
+    """``(kind, data)`` for one changed row; reads only loaded columns."""
+    data = {'id': instance.pk, 'action': action}
+    for column in STREAMS[kind][1]:
+        data[column] = getattr(instance, column)
+    return kind, data
+
+
+def publish_on_commit(kind, instances, action='saved'):
+    """Publish ``instances`` once the current transaction commits."""
+    deltas = [delta(kind, instance, action) for instance in instances]
+    if deltas:
+        transaction.on_commit(partial(broker.publish, deltas), robust=True)
+
+
+# ---------------------------------------------------------------------------
+# Subscribing (from the events view)
+# ---------------------------------------------------------------------------
+
+def _int_param(params, name):
+    value = params.get(name) or None
+    if value is not None and not value.isdigit():
+        raise ValueError(f'{name} must be an id.')
+    return int(value) if value is not None else None
+
+
+def _subscription_filters(user, params):
+    """``(kinds, owners, doctor_ids)`` for ``user``; may run one query."""
+    requested = [kind for kind in params.get('kinds', '').split(',') if kind] or list(STREAMS)
+    unknown = sorted(set(requested) - set(STREAMS))
+    if unknown:
+        raise ValueError(f'Unknown kinds: {", ".join(unknown)}.')
+    doctor, department = _int_param(params, 'doctor'), _int_param(params, 'department')
+
+    kinds, owners = [], {}
+    for kind in requested:
+        model = STREAMS[kind][0]
+        if model is EntryLog:
+            allowed = user.is_superuser or user.role in ENTRYLOG_ROLES
+            filters = {}
+        else:
+            filters = model.objects.owner_filters(user)
+            allowed = filters != NOTHING_OWNED
+        if allowed:
+            kinds.append(kind)
+            owners[kind] = filters
+
+    doctor_ids = None
+    if department is not None:
+        doctor_ids = frozenset(Doctor.objects.filter(department_id=department).values_list('pk', flat=True))
+    if doctor is not None:
+        doctor_ids = frozenset({doctor}) if doctor_ids is None else doctor_ids & {doctor}
+    return kinds, owners, doctor_ids
+
+
+async def open_stream(user, params, last_event_id=None):
+    """
+    Subscribe ``user`` with the filters in ``params`` (``kinds``, ``doctor``,
+    ``department``).  Returns ``(subscription, replay)``; ``replay`` is the
+    missed events, or None if the screen must reload.  The subscription is
+    None if the user may follow none of the requested kinds.  Raises
+    ``ValueError`` for bad filters.
+    """
+    kinds, owners, doctor_ids = await sync_to_async(_subscription_filters)(user, params)
+    if not kinds:
+        return None, []
+    subscription = Subscription(kinds, owners, doctor_ids)
+    return subscription, broker.subscribe(subscription, last_event_id)
+
+
+class EventStream:
+    """
+    The ``text/event-stream`` body for ``subscription``.  Closing the
+    response (or the iterator) unsubscribes it.
+    """
+
+    def __init__(self, subscription, replay):
+        self.subscription, self.replay = subscription, replay
+
+    def close(self):
+        broker.unsubscribe(self.subscription)
+
+    async def __aiter__(self):
+        try:
+            yield RETRY_FRAME
+            if self.replay is None:
+                yield RESET_FRAME
+            else:
+                for event in self.replay:
+                    yield event.frame
+            queue = self.subscription.queue
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat_seconds())
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_FRAME
+                    continue
+                if event is RESET:
+                    yield RESET_FRAME
+                    return
+                yield event.frame
+        finally:
+            self.close()
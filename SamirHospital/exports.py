@@ -0,0 +1,229 @@
+"""
+Streaming ledger exports (billing and appointments) as CSV or XLSX.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` — names are
+joined in SQL, no model instances are built — and written out as they
+arrive, so memory use does not depend on the size of the export.
+
+Every export is ordered by ``id`` and the first column is that id.  An
+interrupted download is resumed by repeating the request with
+``after=<last id received>``.
+"""
+import csv
+import datetime
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Concat, Trim
+from django.utils import timezone
+
+from .models import Appointment, Billing
+
+CHUNK_SIZE = 2000
+
+
+def full_name(prefix):
+    """``first_name last_name`` of the user at ``prefix``, joined in SQL."""
+    return Trim(Concat(F(f'{prefix}__first_name'), Value(' '), F(f'{prefix}__last_name')))
+
+
+# kind -> model, date field, status field, [(header, expression or field)]
+LEDGERS = {
+    'billing': {
+        'model': Billing,
+        'date_field': 'payment_date',
+        'status_field': 'payment_status',
+        'columns': [
+            ('id', 'id'),
+            ('payment_date', 'payment_date'),
+            ('patient', full_name('patient__user')),
+            ('appointment', 'appointment_id'),
+            ('doctor', full_name('appointment__doctor__user')),
+            ('amount', 'amount'),
+            ('tax', 'tax'),
+            ('discount', 'discount'),
+            ('total', 'total'),
+            ('payment_method', 'payment_method'),
+            ('payment_status', 'payment_status'),
+        ],
+    },
+    'appointments': {
+        'model': Appointment,
+        'date_field': 'appointment_date',
+        'status_field': 'status',
+        'columns': [
+            ('id', 'id'),
+            ('appointment_date', 'appointment_date'),
+            ('time_slot', 'time_slot'),
+            ('patient', full_name('patient__user')),
+            ('doctor', full_name('doctor__user')),
+            ('department', 'doctor__department__name'),
+            ('status', 'status'),
+            ('reason', 'reason'),
+        ],
+    },
+}
+
+
+def date_bounds(model, date_field, date_from, date_to):
+    """Filters for an inclusive date range, as index-friendly column ranges."""
+    filters = {}
+    is_datetime = isinstance(model._meta.get_field(date_field), DateTimeField)
+    if date_from:
+        filters[f'{date_field}__gte'] = _start_of_day(date_from) if is_datetime else date_from
+    if date_to:
+        if is_datetime:
+            filters[f'{date_field}__lt'] = _start_of_day(date_to + datetime.timedelta(days=1))
+        else:
+            filters[f'{date_field}__lte'] = date_to
+    return filters
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def ledger_rows(kind, date_from=None, date_to=None, status=None, after=None, queryset=None):
+    """Yield the header, then one tuple per ledger row in ``id`` order."""
+    ledger = LEDGERS[kind]
+    model = ledger['model']
+    if queryset is None:
+        queryset = model.objects.all()
+    queryset = queryset.filter(**date_bounds(model, ledger['date_field'], date_from, date_to))
+    if status:
+        queryset = queryset.filter(**{ledger['status_field']: status})
+    if after:
+        queryset = queryset.filter(id__gt=after)
+
+    names, fields, expressions = [], [], {}
+    for header, source in ledger['columns']:
+        names.append(header)
+        if isinstance(source, str):
+            fields.append(source)
+        else:
+            expressions[f'export_{header}'] = source
+            fields.append(f'export_{header}')
+
+    yield tuple(names)
+    rows = queryset.annotate(**expressions).order_by('id').values_list(*fields)
+    yield from rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+# ---------------------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------------------
+
+class Echo:
+    """File-like object whose ``write`` just hands the line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+# ---------------------------------------------------------------------------
+# XLSX
+# ---------------------------------------------------------------------------
+
+class _Sink:
+    """Unseekable sink that ``ZipFile`` writes into and the generator drains."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Ledger" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+# XML 1.0 forbids most control characters; drop them from cell text.
+_ILLEGAL_XML = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    text = escape(str(value).translate(_ILLEGAL_XML))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_stream(rows, flush_every=500):
+    """Stream a single-sheet workbook; the archive is never held in memory."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetData>'
+            )
+            for number, row in enumerate(rows, start=1):
+                sheet.write(('<row>%s</row>' % ''.join(map(_cell, row))).encode())
+                if number % flush_every == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'xlsx': (xlsx_stream, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
@@ -2,10 +2,13 @@ from django import forms
 from .models import (
     Appointment, LabTest, MedicineSale, Billing,
     InventoryItem, SecurityStaff, EntryLog,
-    CustomUser, Doctor, Patient, Department , Medicine
+    CustomUser, Doctor, Patient, Department , Medicine, FeeSchedule
 )
 from django.contrib.auth.forms import UserCreationForm
 
+from .caching import CachedModelChoiceField
+from .widgets import AutocompleteSelect
+
 
 # ----------------------------
 # User Registration Form
@@ -44,18 +47,27 @@ class DoctorForm(forms.ModelForm):
     class Meta:
         model = Doctor
         fields = ['department', 'specialization', 'phone', 'qualification', 'experience_years']
+        field_classes = {'department': CachedModelChoiceField}
 
 
 # ----------------------------
 # Appointment Form
 # ----------------------------
 class AppointmentForm(forms.ModelForm):
+    # Patients book for themselves: the view fills in ``patient``.
     class Meta:
         model = Appointment
-        fields = ['patient', 'doctor', 'appointment_date', 'time_slot', 'reason', 'status']
+        fields = ['doctor', 'appointment_date', 'start_time', 'reason']
         widgets = {
             'appointment_date': forms.DateInput(attrs={'type': 'date'}),
+            'start_time': forms.TimeInput(attrs={'type': 'time'}),
         }
+        field_classes = {'doctor': CachedModelChoiceField}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = Doctor.objects.select_related('user')
+        self.fields['start_time'].required = True
 
 
 # ----------------------------
@@ -65,11 +77,30 @@ class LabTestForm(forms.ModelForm):
     class Meta:
         model = LabTest
         fields = ['patient', 'doctor', 'test_name', 'result', 'report_file', 'status']
+        widgets = {'patient': AutocompleteSelect('patients')}
+        field_classes = {'doctor': CachedModelChoiceField}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['patient'].queryset = Patient.objects.select_related('user')
+        self.fields['doctor'].queryset = Doctor.objects.select_related('user')
 # ------------------------
 # Medicine Form
 # ------------------------
 
-class MedicineForm(forms.ModelForm):
+class ReorderLevelMixin:
+    """``reorder_level`` may be left empty; it then takes the model default (0, never alert)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['reorder_level'].required = False
+
+    def clean_reorder_level(self):
+        value = self.cleaned_data.get('reorder_level')
+        return self._meta.model._meta.get_field('reorder_level').default if value is None else value
+
+
+class MedicineForm(ReorderLevelMixin, forms.ModelForm):
     class Meta:
         model = Medicine
         fields = '__all__' 
@@ -80,6 +111,31 @@ class MedicineSaleForm(forms.ModelForm):
     class Meta:
         model = MedicineSale
         fields = ['patient', 'medicine', 'quantity']
+        widgets = {'patient': AutocompleteSelect('patients')}
+
+
+# ----------------------------
+# Pharmacy Checkout (patient + cart lines)
+# ----------------------------
+class MedicineCheckoutForm(forms.Form):
+    patient = forms.ModelChoiceField(
+        queryset=Patient.objects.select_related('user'), widget=AutocompleteSelect('patients'),
+    )
+    payment_method = forms.ChoiceField(choices=Billing.PAYMENT_METHODS)
+
+
+class MedicineCartLineForm(forms.ModelForm):
+    class Meta:
+        model = MedicineSale
+        fields = ['medicine', 'quantity']
+        field_classes = {'medicine': CachedModelChoiceField}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['medicine'].queryset = Medicine.objects.filter(stock__gt=0)
+
+
+MedicineCartFormSet = forms.formset_factory(MedicineCartLineForm, extra=5)
 
 
 # ----------------------------
@@ -89,15 +145,47 @@ class BillingForm(forms.ModelForm):
     class Meta:
         model = Billing
         fields = ['patient', 'appointment', 'amount', 'tax', 'discount', 'payment_method', 'payment_status', 'description']
+        widgets = {
+            'patient': AutocompleteSelect('patients'),
+            'appointment': AutocompleteSelect('appointments'),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['patient'].queryset = Patient.objects.select_related('user')
+        self.fields['appointment'].queryset = Appointment.objects.select_related('patient__user', 'doctor__user')
+
+
+# ----------------------------
+# Fee Schedule & Bulk Billing Forms
+# ----------------------------
+class FeeScheduleForm(forms.ModelForm):
+    class Meta:
+        model = FeeSchedule
+        fields = ['department', 'doctor', 'fee', 'tax_rate', 'discount_rate']
+        help_texts = {
+            'tax_rate': 'A fraction: 0.13 is 13%.',
+            'discount_rate': 'A fraction: 0.10 is 10%.',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].queryset = Doctor.objects.select_related('user')
+
+
+class GenerateBillsForm(forms.Form):
+    until = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}),
+                            help_text='Bill completed appointments up to this day (default: all).')
+    payment_method = forms.ChoiceField(choices=Billing.PAYMENT_METHODS)
 
 
 # ----------------------------
 # Inventory Item Form
 # ----------------------------
-class InventoryItemForm(forms.ModelForm):
+class InventoryItemForm(ReorderLevelMixin, forms.ModelForm):
     class Meta:
         model = InventoryItem
-        fields = ['name', 'category', 'quantity', 'unit', 'expiry_date']
+        fields = ['name', 'category', 'quantity', 'unit', 'reorder_level', 'expiry_date']
         widgets = {
             'expiry_date': forms.DateInput(attrs={'type': 'date'}),
         }
@@ -110,6 +198,7 @@ class SecurityStaffForm(forms.ModelForm):
     class Meta:
         model = SecurityStaff
         fields = ['user', 'shift_start', 'shift_end', 'phone', 'assigned_gate']
+        widgets = {'user': AutocompleteSelect('users')}
 
 
 # ----------------------------
@@ -122,3 +211,15 @@ class EntryLogForm(forms.ModelForm):
         widgets = {
             'time_out': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
         }
+
+
+# ----------------------------
+# Bulk Import Form
+# ----------------------------
+class ImportRecordsForm(forms.Form):
+    kind = forms.ChoiceField(choices=[
+        ('patients', 'Patients'),
+        ('medicines', 'Medicines'),
+        ('inventory', 'Inventory items'),
+    ])
+    file = forms.FileField(help_text='CSV with a header row, or JSON Lines (.jsonl).')
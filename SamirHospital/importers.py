@@ -0,0 +1,219 @@
+"""
+Bulk import of patients, medicines and inventory items.
+
+Rows are streamed from CSV or JSON Lines one at a time, validated with the
+same ``ModelForm`` the single-record pages use, and written with
+``bulk_create`` in chunks of ``batch_size``, one transaction per chunk.  An
+invalid row is recorded in the report and skipped; it never aborts the run,
+even when only the database finds it invalid.
+"""
+import csv
+import json
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+
+from .forms import PatientForm, MedicineForm, InventoryItemForm
+from .models import CustomUser
+from .signals import records_bulk_created
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 200
+
+IMPORT_KINDS = {
+    'patients': PatientForm,
+    'medicines': MedicineForm,
+    'inventory': InventoryItemForm,
+}
+
+# Extra columns a patient row needs to create its login account.
+PATIENT_USER_FIELDS = ['username', 'first_name', 'last_name', 'email']
+
+
+class RecordImportError(Exception):
+    pass
+
+
+def peak_memory_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.peak_memory_kb = None
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, errors))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        self.peak_memory_kb = peak_memory_kb()
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        memory = f'{self.peak_memory_kb / 1024:.1f} MiB' if self.peak_memory_kb else 'n/a'
+        return (
+            f'{self.kind}: {self.rows} rows read, {self.created} created, '
+            f'{self.error_count} rejected in {self.elapsed:.2f}s '
+            f'({self.rows_per_second:.0f} rows/s, peak memory {memory})'
+        )
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield ``(line_number, dict)`` from a text stream without loading it whole.
+    Unparseable JSON lines come back as ``None``.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+    elif fmt == 'json':
+        # A JSON array has to be parsed in one go; prefer JSON Lines for big files.
+        for number, row in enumerate(json.load(stream), start=1):
+            yield number, row
+    else:
+        raise RecordImportError(f'Unsupported format: {fmt}')
+
+
+def guess_format(filename):
+    for suffix, fmt in (('.csv', 'csv'), ('.jsonl', 'jsonl'), ('.ndjson', 'jsonl'), ('.json', 'json')):
+        if filename.lower().endswith(suffix):
+            return fmt
+    return 'csv'
+
+
+def _write_chunk(kind, chunk, report):
+    """
+    Insert one chunk of validated ``(line, instance, extra)`` rows atomically.
+    If the database rejects the chunk (a username taken since it was checked,
+    a value too long for the column), retry it row by row and report the rows
+    that fail.
+    """
+    try:
+        _insert(kind, chunk)
+    except (IntegrityError, DataError):
+        for row in chunk:
+            try:
+                _insert(kind, [row])
+            except (IntegrityError, DataError) as error:
+                report.add_error(row[0], {'__all__': [f'The database rejected this row: {error}']})
+            else:
+                report.created += 1
+        return
+    report.created += len(chunk)
+
+
+def _insert(kind, chunk):
+    instances = [instance for _, instance, _ in chunk]
+    with transaction.atomic():
+        if kind == 'patients':
+            users = CustomUser.objects.bulk_create([
+                CustomUser(role='patient', password=make_password(None), **extra) for _, _, extra in chunk
+            ])
+            for instance, user in zip(instances, users):
+                instance.user = user
+            records_bulk_created.send(sender=CustomUser, instances=users)
+        model = type(instances[0])
+        model.objects.bulk_create(instances)
+        records_bulk_created.send(sender=model, instances=instances)
+
+
+def _patient_extra(line, row, seen_usernames, report):
+    extra = {field: (row.get(field) or '').strip() for field in PATIENT_USER_FIELDS}
+    if not extra['username']:
+        report.add_error(line, {'username': ['This field is required.']})
+        return None
+    if extra['username'] in seen_usernames:
+        report.add_error(line, {'username': ['Duplicate username in this file.']})
+        return None
+    # The account's own validators (allowed characters, lengths, email
+    # format); uniqueness is checked per chunk in _drop_taken_usernames.
+    try:
+        CustomUser(role='patient', **extra).full_clean(
+            exclude=['password'], validate_unique=False, validate_constraints=False,
+        )
+    except ValidationError as error:
+        report.add_error(line, error.message_dict)
+        return None
+    seen_usernames.add(extra['username'])
+    return extra
+
+
+def _drop_taken_usernames(chunk, report):
+    usernames = [extra['username'] for _, _, extra in chunk]
+    taken = set(CustomUser.objects.filter(username__in=usernames).values_list('username', flat=True))
+    kept = []
+    for line, instance, extra in chunk:
+        if extra['username'] in taken:
+            report.add_error(line, {'username': ['A user with that username already exists.']})
+        else:
+            kept.append((line, instance, extra))
+    return kept
+
+
+def import_records(kind, stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE):
+    """Import every row of ``stream`` as ``kind`` and return an :class:`ImportReport`."""
+    if kind not in IMPORT_KINDS:
+        raise RecordImportError(f'Unknown record type: {kind}')
+    form_class = IMPORT_KINDS[kind]
+    report = ImportReport(kind)
+    seen_usernames = set()
+    chunk = []
+
+    def flush():
+        pending = _drop_taken_usernames(chunk, report) if kind == 'patients' else chunk
+        if pending:
+            _write_chunk(kind, pending, report)
+        chunk.clear()
+
+    for line, row in iter_rows(stream, fmt):
+        report.rows += 1
+        if not isinstance(row, dict):
+            report.add_error(line, {'__all__': ['Not a JSON object.']})
+            continue
+        extra = None
+        if kind == 'patients':
+            extra = _patient_extra(line, row, seen_usernames, report)
+            if extra is None:
+                continue
+        form = form_class(data=row)
+        if not form.is_valid():
+            report.add_error(line, {field: list(errors) for field, errors in form.errors.items()})
+            continue
+        chunk.append((line, form.save(commit=False), extra))
+        if len(chunk) >= batch_size:
+            flush()
+    if chunk:
+        flush()
+    return report.finish()
@@ -0,0 +1,148 @@
+"""
+Batch invoicing of completed appointments.
+
+:func:`generate_bills` bills every completed appointment that has no bill
+yet.  Each one is priced from the most specific :class:`FeeSchedule` rule:
+the doctor's, then the department's, then the default.
+
+Appointments are taken in ``id`` order, in chunks.  Each chunk is one
+transaction that:
+
+* locks its appointments,
+* re-checks that they are still unbilled,
+* prices the whole chunk at once, and
+* inserts the bills with a single ``bulk_create``.
+
+``bulk_create`` skips ``Billing.save()``, so ``total`` is set here.
+``records_bulk_created`` then brings the counters, rollups and caches up to
+date.  The ``unique_bill_per_appointment`` constraint is the final guard,
+so re-running the job, even concurrently, never bills an appointment twice.
+"""
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, Billing, FeeSchedule
+from .signals import records_bulk_created
+
+DEFAULT_CHUNK_SIZE = 1000
+CENTS = Decimal('0.01')
+
+
+@dataclass
+class InvoiceReport:
+    created: int = 0
+    total: Decimal = Decimal('0.00')
+    unpriced: list = field(default_factory=list)  # appointment ids with no fee rule
+
+    def __str__(self):
+        text = f'Created {self.created} bills totalling Rs. {self.total}.'
+        if self.unpriced:
+            text += f' {len(self.unpriced)} appointments have no fee rule.'
+        return text
+
+
+class FeeTable:
+    """All fee rules, loaded once and looked up per (doctor, department)."""
+
+    def __init__(self, rules):
+        self.by_doctor, self.by_department, self.default = {}, {}, None
+        for rule in rules:
+            if rule.doctor_id is not None:
+                self.by_doctor[rule.doctor_id] = rule
+            elif rule.department_id is not None:
+                self.by_department[rule.department_id] = rule
+            elif self.default is None:
+                self.default = rule
+
+    @classmethod
+    def load(cls):
+        return cls(FeeSchedule.objects.order_by('pk'))
+
+    def rule_for(self, doctor_id, department_id):
+        return self.by_doctor.get(doctor_id) or self.by_department.get(department_id) or self.default
+
+
+def _money(value):
+    return value.quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def price(rules):
+    """``(amount, tax, discount, total)`` for each rule, in order."""
+    amounts = [rule.fee for rule in rules]
+    taxes = [_money(rule.fee * rule.tax_rate) for rule in rules]
+    discounts = [_money(rule.fee * rule.discount_rate) for rule in rules]
+    totals = [amount + tax - discount for amount, tax, discount in zip(amounts, taxes, discounts)]
+    return list(zip(amounts, taxes, discounts, totals))
+
+
+def _unbilled(until):
+    appointments = Appointment.objects.filter(status='completed', billing__isnull=True)
+    if until is not None:
+        appointments = appointments.filter(appointment_date__lte=until)
+    return appointments
+
+
+COLUMNS = ('pk', 'patient_id', 'doctor_id', 'doctor__department_id', 'appointment_date')
+
+
+def _priceable(rows, fees, report):
+    """Split ``COLUMNS`` rows into those with a fee rule and their rules."""
+    priced, rules = [], []
+    for row in rows:
+        rule = fees.rule_for(row[2], row[3])
+        if rule is None:
+            report.unpriced.append(row[0])
+        else:
+            priced.append(row)
+            rules.append(rule)
+    return priced, rules
+
+
+def _bill_chunk(ids, fees, until, payment_method, report):
+    with transaction.atomic():
+        # ``of`` keeps the lock off the outer-joined billing table (PostgreSQL).
+        rows = _unbilled(until).select_for_update(of=('self',)).filter(pk__in=ids).order_by('pk')
+        priced, rules = _priceable(rows.values_list(*COLUMNS), fees, report)
+        if not priced:
+            return
+        now = timezone.now()
+        bills = Billing.objects.bulk_create([
+            Billing(
+                appointment_id=appointment_id, patient_id=patient_id, amount=amount, tax=tax,
+                discount=discount, total=total, payment_method=payment_method,
+                payment_status='pending', payment_date=now,
+                description=f'Consultation on {day:%Y-%m-%d}',
+            )
+            for (appointment_id, patient_id, _, _, day), (amount, tax, discount, total)
+            in zip(priced, price(rules))
+        ])
+        records_bulk_created.send(sender=Billing, instances=bills)
+    report.created += len(bills)
+    report.total += sum((bill.total for bill in bills), Decimal('0.00'))
+
+
+def generate_bills(until=None, chunk_size=DEFAULT_CHUNK_SIZE, payment_method='cash', dry_run=False):
+    """
+    Bill every completed, unbilled appointment dated on or before ``until``
+    (all of them by default).  Returns an :class:`InvoiceReport`; with
+    ``dry_run`` nothing is written.
+    """
+    report = InvoiceReport()
+    fees = FeeTable.load()
+    last_id = 0
+    while True:
+        ids = list(
+            _unbilled(until).filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return report
+        last_id = ids[-1]
+        if dry_run:
+            _, rules = _priceable(_unbilled(until).filter(pk__in=ids).values_list(*COLUMNS), fees, report)
+            report.created += len(rules)
+            report.total += sum((total for *_, total in price(rules)), Decimal('0.00'))
+        else:
+            _bill_chunk(ids, fees, until, payment_method, report)
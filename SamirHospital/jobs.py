@@ -0,0 +1,157 @@
+"""
+Database-backed background jobs.
+
+:func:`enqueue` stores a ``Job`` row, and ``manage.py run_workers`` runs
+them.  No broker is needed.
+
+A worker claims a job with a conditional ``UPDATE ... WHERE id = ? AND
+<still claimable>``.  The database lets exactly one worker win, on any
+backend.  A claim sets ``locked_until`` (the visibility timeout).  If the
+worker dies, the job becomes claimable again once that passes.  A job that
+raises is retried with exponential back-off until ``max_attempts``, then
+marked ``failed``.
+"""
+import logging
+import os
+import socket
+import statistics
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VISIBILITY_TIMEOUT = 300
+RETRY_BASE_SECONDS = 10
+CLAIM_CANDIDATES = 10
+
+TASKS = {}
+
+
+def task(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, run_at=None, max_attempts=3):
+    """
+    Queue ``name`` to run with ``**payload``.  Called inside a transaction,
+    the job only becomes visible to workers once that commits.
+    """
+    if name not in TASKS:
+        raise KeyError(f'No task registered as {name!r}.')
+    return Job.objects.create(
+        name=name, payload=payload or {}, max_attempts=max_attempts,
+        run_at=run_at or timezone.now(),
+    )
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _claimable(now):
+    # Queued and due, or running on a worker whose visibility timeout lapsed.
+    return (
+        Q(status='queued', run_at__lte=now)
+        | Q(status='running', locked_until__lt=now)
+    )
+
+
+def claim(worker, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Take the oldest claimable job for ``worker``, or return ``None``."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(_claimable(now)).order_by('run_at', 'id')
+        .values_list('id', flat=True)[:CLAIM_CANDIDATES]
+    )
+    for job_id in candidates:
+        claimed = Job.objects.filter(_claimable(now), pk=job_id).update(
+            status='running', locked_by=worker, started_at=now,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _finish(job, **fields):
+    """Record the outcome, unless the job was reclaimed after its lock expired."""
+    return Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        locked_until=None, **fields,
+    )
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome; returns the final status."""
+    try:
+        handler = TASKS[job.name]
+        with transaction.atomic():
+            handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s failed (attempt %d/%d):\n%s', job, job.attempts, job.max_attempts, error)
+        if job.attempts >= job.max_attempts:
+            _finish(job, status='failed', last_error=error, finished_at=timezone.now())
+            return 'failed'
+        retry_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        _finish(job, status='queued', last_error=error, run_at=retry_at)
+        return 'queued'
+    _finish(job, status='done', finished_at=timezone.now())
+    return 'done'
+
+
+def work(worker=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_jobs=None):
+    """Run jobs until the queue is empty or ``max_jobs`` ran; returns the count."""
+    worker = worker or worker_id()
+    count = 0
+    while max_jobs is None or count < max_jobs:
+        job = claim(worker, visibility_timeout)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def latency_summary(since=None):
+    """
+    Per task name: job counts plus p50/p95 queue wait and run time, in
+    seconds, over jobs finished since ``since`` (default: the last day).
+    """
+    since = since or timezone.now() - timedelta(days=1)
+    jobs = Job.objects.filter(finished_at__gte=since).only(
+        'name', 'status', 'created_at', 'run_at', 'started_at', 'finished_at',
+    )
+    samples = {}
+    for job in jobs.iterator():
+        entry = samples.setdefault(job.name, {'done': 0, 'failed': 0, 'wait': [], 'run': []})
+        entry[job.status] = entry.get(job.status, 0) + 1
+        entry['wait'].append(job.wait_seconds)
+        entry['run'].append(job.run_seconds)
+    summary = {}
+    for name, entry in sorted(samples.items()):
+        summary[name] = {
+            'done': entry['done'],
+            'failed': entry['failed'],
+            'wait_p50': _quantile(entry['wait'], 0.50),
+            'wait_p95': _quantile(entry['wait'], 0.95),
+            'run_p50': _quantile(entry['run'], 0.50),
+            'run_p95': _quantile(entry['run'], 0.95),
+        }
+    return summary
+
+
+def _quantile(values, fraction):
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method='inclusive')[round(fraction * 100) - 1]
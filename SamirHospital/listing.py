@@ -0,0 +1,374 @@
+"""
+Shared machinery for the list pages.
+
+Every ``*_list`` view goes through :func:`render_list`, which
+
+* derives the ``select_related`` / ``prefetch_related`` paths from the
+  variables the template actually touches inside its ``{% for %}`` loop, so a
+  template change can never silently reintroduce an N+1 query, and
+* paginates with an opaque keyset cursor instead of ``OFFSET``, so page
+  10 000 costs the same indexed range scan as page 1, and
+* hands the template a ``list_cache_key`` for ``{% cache %}`` that is tied to
+  the page query, the viewer's role and the versions of every model it
+  reads, and
+* sends an ETag and Last-Modified built from the same versions, so a client
+  revalidating an unchanged page gets ``304 Not Modified`` for a few cache
+  lookups, without a query or any rendering.
+
+Async views use :func:`arender_list`, which fetches the page with the async
+ORM before rendering so the template never touches the database.
+"""
+import hashlib
+from calendar import timegm
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.template.defaulttags import ForNode
+from django.template.base import VariableNode
+from django.template.loader import get_template
+
+from .caching import (
+    acached_queryset, amodel_versions, cache_timeout, cached_queryset, key_for_versions,
+    model_versions, queryset_models, version_time,
+)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+CURSOR_SALT = 'SamirHospital.listing.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Eager loading derived from templates
+# ---------------------------------------------------------------------------
+
+def _forward_relation(model, name):
+    """Return ``(field, many)`` for relation ``name`` on ``model`` or ``None``."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Reverse relations are reached through their accessor (``labtest_set``).
+        for rel in model._meta.related_objects:
+            if rel.get_accessor_name() == name:
+                return rel, True
+        return None
+    if not field.is_relation:
+        return None
+    return field, bool(field.many_to_many or field.one_to_many)
+
+
+def _paths_for_lookups(model, lookups):
+    """Split a dotted template lookup into a select path and a prefetch path."""
+    select, prefetch = [], []
+    current = model
+    for name in lookups:
+        found = _forward_relation(current, name)
+        if found is None:
+            break
+        field, many = found
+        if many or prefetch:
+            prefetch.append(name)
+        else:
+            select.append(name)
+        current = field.related_model
+    return '__'.join(select), '__'.join(select + prefetch) if prefetch else ''
+
+
+def _template_lookups(nodelist, loopvar):
+    for node in nodelist.get_nodes_by_type(VariableNode):
+        var = node.filter_expression.var
+        lookups = getattr(var, 'lookups', None)
+        if lookups and lookups[0] == loopvar and len(lookups) > 1:
+            yield lookups[1:]
+    for node in nodelist.get_nodes_by_type(ForNode):
+        lookups = getattr(node.sequence.var, 'lookups', None)
+        if lookups and lookups[0] == loopvar and len(lookups) > 1:
+            yield lookups[1:]
+
+
+@lru_cache(maxsize=None)
+def related_paths(template_name, context_name, model):
+    """
+    Return ``(select_related, prefetch_related)`` tuples for the rows that
+    ``template_name`` renders from ``context_name``.
+    """
+    nodelist = get_template(template_name).template.nodelist
+    select, prefetch = set(), set()
+    for loop in nodelist.get_nodes_by_type(ForNode):
+        if getattr(loop.sequence.var, 'lookups', None) != (context_name,):
+            continue
+        for loopvar in loop.loopvars:
+            for lookups in _template_lookups(loop.nodelist_loop, loopvar):
+                select_path, prefetch_path = _paths_for_lookups(model, lookups)
+                if select_path:
+                    select.add(select_path)
+                if prefetch_path:
+                    prefetch.add(prefetch_path)
+    return tuple(sorted(select)), tuple(sorted(prefetch))
+
+
+def with_related(queryset, template_name, context_name):
+    select, prefetch = related_paths(template_name, context_name, queryset.model)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+# ---------------------------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------------------------
+
+class KeysetPage:
+    """
+    One page of rows plus the cursor that continues after its last row.
+
+    The rows are fetched on first use, so a template whose cached fragment
+    is still valid never runs the page query at all.
+    """
+
+    def __init__(self, queryset, ordering, per_page, params):
+        self.queryset = queryset[:per_page + 1]
+        self.ordering = ordering
+        self.per_page = per_page
+        self._params = params
+        self._rows = None
+
+    def _set_rows(self, rows):
+        self._next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            self._next_cursor = encode_cursor(rows[-1], self.ordering, self.queryset.model)
+        self._rows = rows
+
+    def _fetch(self):
+        if self._rows is None:
+            self._set_rows(cached_queryset(self.queryset, namespace='list'))
+        return self._rows
+
+    async def afetch(self):
+        """Fetch the rows with the async ORM; later access needs no query."""
+        if self._rows is None:
+            self._set_rows(await acached_queryset(self.queryset, namespace='list'))
+        return self._rows
+
+    @property
+    def object_list(self):
+        return self._fetch()
+
+    @property
+    def next_cursor(self):
+        self._fetch()
+        return self._next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    # Role the page is rendered for; templates show role-specific links and
+    # columns, so it is part of the fragment key.
+    scope = ''
+    # Versions of the models behind the page, set by ``cache_key``.
+    versions = None
+
+    @property
+    def cache_key(self):
+        """Fragment cache key: changes with the page query, the role and the data behind it."""
+        models = queryset_models(self.queryset)
+        if models is None:
+            return None
+        self.versions = model_versions(*models)
+        sql, params = self.queryset.query.sql_with_params()
+        return key_for_versions('fragment', self.versions, sql, params, self.scope)
+
+    async def acache_key(self):
+        models = queryset_models(self.queryset)
+        if models is None:
+            return None
+        self.versions = await amodel_versions(*models)
+        sql, params = self.queryset.query.sql_with_params()
+        return key_for_versions('fragment', self.versions, sql, params, self.scope)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def next_query(self):
+        """Current query string with ``cursor`` advanced to the next page."""
+        params = self._params.copy()
+        params['cursor'] = self.next_cursor
+        return params.urlencode()
+
+
+def _ordering_fields(model, ordering):
+    fields = []
+    for name in ordering:
+        descending = name.startswith('-')
+        attr = name.lstrip('-')
+        field = model._meta.pk if attr == 'pk' else model._meta.get_field(attr)
+        fields.append((field, descending))
+    return fields
+
+
+def encode_cursor(obj, ordering, model=None):
+    """Cursor after ``obj``: a model instance, or a ``values()`` dict of ``model``."""
+    model = model or type(obj)
+    if isinstance(obj, dict):
+        obj = model(**{field.attname: obj[field.name] for field, _ in _ordering_fields(model, ordering)})
+    values = [
+        field.value_to_string(obj)
+        for field, _ in _ordering_fields(model, ordering)
+    ]
+    return signing.dumps(values, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        values = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor(cursor)
+    fields = _ordering_fields(model, ordering)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor(cursor)
+    return [field.to_python(value) for (field, _), value in zip(fields, values)]
+
+
+def keyset_filter(model, ordering, values):
+    """
+    ``WHERE`` clause selecting the rows strictly after ``values`` in
+    ``ordering``, i.e. ``(a < x) OR (a = x AND b < y) OR ...``.
+    """
+    condition = Q()
+    equal = {}
+    for (field, descending), value in zip(_ordering_fields(model, ordering), values):
+        op = 'lt' if descending else 'gt'
+        condition |= Q(**equal, **{f'{field.name}__{op}': value})
+        equal[field.name] = value
+    return condition
+
+
+def paginate_keyset(request, queryset, ordering=('-pk',), per_page=DEFAULT_PAGE_SIZE):
+    """
+    Fetch one page of ``queryset`` ordered by ``ordering``.
+
+    The last ordering column must be unique (normally ``pk``) so the cursor
+    identifies exactly one position.
+    """
+    try:
+        per_page = int(request.GET.get('per_page', per_page))
+    except ValueError:
+        pass
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    queryset = queryset.order_by(*ordering)
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            values = decode_cursor(cursor, queryset.model, ordering)
+        except InvalidCursor:
+            values = None
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(queryset.model, ordering, values))
+
+    return KeysetPage(queryset, ordering, per_page, request.GET)
+
+
+def _list_context(context_name, page, cache_key, extra_context):
+    context = {
+        context_name: page,
+        'page': page,
+        'list_cache_key': cache_key,
+        'list_cache_timeout': cache_timeout() if cache_key else 0,
+    }
+    if extra_context:
+        context.update(extra_context)
+    return context
+
+
+def _validators(request, page, cache_key):
+    """
+    ``(etag, last_modified)`` for a list page, or ``(None, None)`` when it
+    cannot be revalidated.
+
+    The ETag covers the page query and model versions (through the fragment
+    key), the URL, and the user the navigation is rendered for.
+    Last-Modified is the newest model version, or the user's last login if
+    that is later, so a different user on the same browser never gets a 304
+    for someone else's page.  Pages with pending messages are not validated,
+    so the messages get rendered.
+    """
+    if cache_key is None or request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None, None
+    user = request.user
+    raw = repr((cache_key, request.get_full_path(), user.pk, user.get_username(),
+                request.COOKIES.get(settings.CSRF_COOKIE_NAME)))
+    last_modified = version_time(page.versions)
+    if getattr(user, 'last_login', None) and user.last_login > last_modified:
+        last_modified = user.last_login
+    return hashlib.md5(raw.encode()).hexdigest(), timegm(last_modified.utctimetuple())
+
+
+def _not_modified(request, etag, last_modified):
+    """A ``304 Not Modified`` response if the client's copy is current, else None."""
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+
+
+def _with_validators(response, etag, last_modified):
+    if etag is not None:
+        response.headers['ETag'] = quote_etag(etag)
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # Per-user pages: browsers keep them but must revalidate every time.
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _scope(user):
+    return getattr(user, 'role', '')
+
+
+def render_list(request, template_name, context_name, queryset, ordering=('-pk',),
+                per_page=DEFAULT_PAGE_SIZE, extra_context=None):
+    queryset = with_related(queryset, template_name, context_name)
+    page = paginate_keyset(request, queryset, ordering, per_page)
+    page.scope = _scope(request.user)
+    cache_key = page.cache_key
+    etag, last_modified = _validators(request, page, cache_key)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    context = _list_context(context_name, page, cache_key, extra_context)
+    return _with_validators(render(request, template_name, context), etag, last_modified)
+
+
+async def arender_list(request, template_name, context_name, queryset, ordering=('-pk',),
+                       per_page=DEFAULT_PAGE_SIZE, extra_context=None):
+    """:func:`render_list` for async views."""
+    queryset = with_related(queryset, template_name, context_name)
+    page = paginate_keyset(request, queryset, ordering, per_page)
+    page.scope = _scope(await request.auser())
+    cache_key = await page.acache_key()
+    etag, last_modified = _validators(request, page, cache_key)
+    not_modified = _not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    await page.afetch()
+    context = _list_context(context_name, page, cache_key, extra_context)
+    return _with_validators(render(request, template_name, context), etag, last_modified)
@@ -0,0 +1,45 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from SamirHospital.archive import ARCHIVES, SEGMENT_ROWS, archive, horizon, verify
+
+
+class Command(BaseCommand):
+    help = 'Move old entry logs and completed appointments into compressed monthly archive files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(ARCHIVES) + ['all'])
+        parser.add_argument('--older-than-days', type=int,
+                            help='Archive rows older than this (default: ARCHIVE_HORIZON_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=SEGMENT_ROWS,
+                            help='Most rows per archive file.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived.')
+        parser.add_argument('--verify', action='store_true',
+                            help='Check every archive file against its checksum instead.')
+
+    def handle(self, *args, **options):
+        kinds = sorted(ARCHIVES) if options['kind'] == 'all' else [options['kind']]
+        if options['verify']:
+            damaged = [segment for kind in kinds for segment in verify(kind)]
+            for segment in damaged:
+                self.stderr.write(f'{segment.path}: missing or checksum mismatch')
+            if damaged:
+                raise CommandError(f'{len(damaged)} damaged archive files.')
+            self.stdout.write(self.style.SUCCESS('All archive files match their checksums.'))
+            return
+
+        for kind in kinds:
+            if options['older_than_days'] is not None:
+                before = timezone.localdate() - datetime.timedelta(days=options['older_than_days'])
+            else:
+                before = horizon(kind)
+            segments, rows = archive(
+                kind, before, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                log=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+            verb = 'Would archive' if options['dry_run'] else 'Archived'
+            self.stdout.write(self.style.SUCCESS(
+                f'{kind}: {verb} {rows} rows before {before} into {segments} files.'
+            ))
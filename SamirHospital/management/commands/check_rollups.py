@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from SamirHospital.rollups import ROLLUPS, check, frozen_through, refresh
+
+MAX_REPORTED = 20
+
+
+class Command(BaseCommand):
+    help = 'Re-derive the reporting rollups from the raw rows and report any that differ.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(ROLLUPS) + ['all'], default='all')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat)
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat)
+        parser.add_argument('--fix', action='store_true', help='Refresh the days that differ.')
+
+    def handle(self, *args, **options):
+        kinds = sorted(ROLLUPS) if options['kind'] == 'all' else [options['kind']]
+        unfixed = 0
+        for kind in kinds:
+            frozen = frozen_through(kind)
+            if frozen:
+                self.stdout.write(f'{kind}: days up to {frozen} hold archived appointments; not checked.')
+            differences = check(kind, options['date_from'], options['date_to'])
+            for key, stored, derived in differences[:MAX_REPORTED]:
+                self.stdout.write(f'{kind} {key}: stored {stored}, derived {derived}')
+            if len(differences) > MAX_REPORTED:
+                self.stdout.write(f'... and {len(differences) - MAX_REPORTED} more')
+            if differences and options['fix']:
+                days = sorted({key[0] for key, _, _ in differences})
+                for day in days:
+                    refresh(kind, day, day)
+                self.stdout.write(f'{kind}: refreshed {len(days)} days.')
+            elif differences:
+                unfixed += len(differences)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{kind}: consistent.'))
+        if unfixed:
+            raise CommandError(f'{unfixed} rollup rows differ from the raw data; run with --fix.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from SamirHospital.stockwatch import DEFAULT_HORIZON_DAYS, check_stock
+
+
+class Command(BaseCommand):
+    help = 'Raise alerts for expired, soon-to-expire and low-stock medicines and inventory items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=DEFAULT_HORIZON_DAYS,
+                            help='Warn about items expiring within this many days.')
+
+    def handle(self, *args, **options):
+        report = check_stock(options['days'])
+        self.stdout.write(self.style.SUCCESS(str(report)))
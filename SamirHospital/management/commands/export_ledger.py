@@ -0,0 +1,37 @@
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand
+
+from SamirHospital.exports import FORMATS, LEDGERS, ledger_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream the billing or appointment ledger to a CSV / XLSX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(LEDGERS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat, help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--status')
+        parser.add_argument('--after', type=int, default=0, help='Resume after this record id.')
+        parser.add_argument('--output', help='File to write; defaults to stdout.')
+
+    def handle(self, *args, **options):
+        rows = ledger_rows(
+            options['kind'], options['date_from'], options['date_to'],
+            options['status'], options['after'],
+        )
+        stream, _ = FORMATS[options['format']]
+        binary = options['format'] == 'xlsx'
+        if options['output']:
+            out = open(options['output'], 'wb') if binary else open(options['output'], 'w', newline='')
+        else:
+            out = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for chunk in stream(rows):
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from SamirHospital.reports import GC_GRACE, collect_garbage, recount
+
+
+class Command(BaseCommand):
+    help = 'Delete lab report blobs that no lab test references any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=GC_GRACE.total_seconds() / 3600,
+                            help='Keep blobs released (or files written) more recently than this.')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the lab tests first.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f'Corrected {recount()} reference counts.')
+        deleted, reclaimed = collect_garbage(
+            grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run'],
+        )
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} files, {reclaimed / (1024 * 1024):.1f} MiB.'
+        ))
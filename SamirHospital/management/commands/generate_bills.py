@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from SamirHospital.invoicing import DEFAULT_CHUNK_SIZE, generate_bills
+from SamirHospital.models import Billing
+
+
+class Command(BaseCommand):
+    help = 'Bill every completed appointment that has no bill yet, priced from the fee schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--until', type=datetime.date.fromisoformat,
+                            help='Only appointments on or before this day (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Appointments billed per transaction.')
+        parser.add_argument('--payment-method', choices=[code for code, _ in Billing.PAYMENT_METHODS],
+                            default='cash')
+        parser.add_argument('--dry-run', action='store_true', help='Only price the bills.')
+
+    def handle(self, *args, **options):
+        report = generate_bills(
+            options['until'], chunk_size=options['chunk_size'],
+            payment_method=options['payment_method'], dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Would create {report.created} bills totalling Rs. {report.total}.')
+        else:
+            self.stdout.write(self.style.SUCCESS(str(report)))
+        if report.unpriced:
+            self.stderr.write('No fee rule for appointments: '
+                              + ', '.join(map(str, report.unpriced[:20]))
+                              + (' ...' if len(report.unpriced) > 20 else ''))
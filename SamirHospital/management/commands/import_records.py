@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from SamirHospital.importers import (
+    IMPORT_KINDS, DEFAULT_BATCH_SIZE, RecordImportError, guess_format, import_records
+)
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load patients, medicines or inventory items from a CSV / JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORT_KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl', 'json'],
+                            help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = import_records(options['kind'], stream, fmt, options['batch_size'])
+        except (OSError, RecordImportError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for line, errors in report.errors:
+            details = '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items())
+            self.stderr.write(f'line {line}: {details}')
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'... {report.error_count - len(report.errors)} more rejected rows')
+        self.stdout.write(self.style.SUCCESS(report.summary()))
@@ -0,0 +1,180 @@
+"""
+Closed-loop HTTP load generator for comparing WSGI and ASGI deployments.
+
+Start the server under test against the same database, for example::
+
+    gunicorn hospitalapp.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+    uvicorn hospitalapp.asgi:application --workers 4 --port 8000
+
+then run ``manage.py load_benchmark --label wsgi`` (or ``asgi``).  Each of
+``--concurrency`` clients keeps one keep-alive connection open and sends its
+next request as soon as the previous response arrives, for ``--duration``
+seconds per level.  Requests are authenticated with a session created here
+for ``--user``.
+"""
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from SamirHospital.models import CustomUser
+
+DEFAULT_PATHS = ['appointment_list', 'api_list:appointments', 'api_dashboard']
+
+
+def default_paths():
+    paths = []
+    for name in DEFAULT_PATHS:
+        name, _, arg = name.partition(':')
+        paths.append(reverse(name, args=[arg] if arg else None))
+    return paths
+
+
+def login_cookie(username):
+    """Session cookie for ``username``, stored in the shared database."""
+    try:
+        user = CustomUser.objects.get(username=username)
+    except CustomUser.DoesNotExist:
+        raise CommandError(f'No user named {username!r}.')
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns ``(status, keep_alive)``."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(host, port, requests, deadline, latencies, errors):
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        request = requests[index % len(requests)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+            errors['connection'] += 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.05)
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_level(host, port, requests, concurrency, duration):
+    latencies, errors = [], {'connection': 0}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        client(host, port, requests, deadline, latencies, errors) for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'errors': {name: count for name, count in errors.items() if count},
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure requests/second of a running server at several concurrency levels.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable); defaults to the list and API endpoints.')
+        parser.add_argument('--concurrency', default='50,200,1000',
+                            help='Comma-separated client counts.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per level.')
+        parser.add_argument('--user', default='admin', help='Username the requests are made as.')
+        parser.add_argument('--label', default='', help='Deployment name for the report, e.g. wsgi.')
+        parser.add_argument('--json', dest='json_path', help='Append the results to this JSON Lines file.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['base_url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--base-url must be a plain http:// URL.')
+        host, port = url.hostname, url.port or 80
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma-separated list of integers.')
+        cookie = login_cookie(options['user'])
+        requests = [
+            (f'GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nCookie: {cookie}\r\n'
+             f'Connection: keep-alive\r\n\r\n').encode()
+            for path in options['paths'] or default_paths()
+        ]
+
+        self.stdout.write(f'{"clients":>8} {"requests":>9} {"req/s":>9} {"p50 ms":>8} '
+                          f'{"p95 ms":>8} {"p99 ms":>8}  errors')
+        for concurrency in levels:
+            result = asyncio.run(run_level(host, port, requests, concurrency, options['duration']))
+            result['label'] = options['label']
+            self.stdout.write(
+                f'{result["concurrency"]:>8} {result["requests"]:>9} {result["requests_per_second"]:>9} '
+                f'{result["p50_ms"]:>8} {result["p95_ms"]:>8} {result["p99_ms"]:>8}  '
+                f'{result["errors"] or "-"}'
+            )
+            if options['json_path']:
+                with open(options['json_path'], 'a') as output:
+                    output.write(json.dumps(result) + '\n')
@@ -0,0 +1,195 @@
+"""
+Idle-subscriber load test for the live updates stream (events.py).
+
+Opens ``--subscribers`` streams on ``/hospital/events/`` through the
+project's ASGI application in this process.  Each stream goes through the
+full middleware stack and is authenticated with a session created for
+``--user``.  The streams then idle for ``--idle`` seconds.  After that,
+``--events`` appointment changes are saved, one at a time, and the command
+times how long each takes to reach every stream.
+
+Events are published in-process (see the note in events.py).  The writes
+therefore have to happen here, so no network server is involved.  The
+report gives:
+
+* what one worker spends per idle stream, in memory and threads;
+* the fan-out latency from commit to the last stream.
+
+``load_benchmark`` covers the request/response side against a real server.
+"""
+import asyncio
+import os
+import resource
+import statistics
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from hospitalapp.asgi import application
+from SamirHospital import events
+from SamirHospital.management.commands.load_benchmark import login_cookie, percentile
+from SamirHospital.models import Appointment
+
+
+def rss_kb():
+    """Resident set size of this process in KB (Linux), else the peak."""
+    try:
+        with open(f'/proc/{os.getpid()}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Stream:
+    """One subscriber: an ASGI ``http`` connection that reads events until closed."""
+
+    def __init__(self, path, query, cookie, index, round_state):
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 10000 + index), 'server': ('localhost', 80),
+        }
+        self.closed = asyncio.Event()
+        self.requested = False
+        self.status = None
+        self.round = round_state
+        self.frames = 0
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            return
+        body = message.get('body', b'')
+        self.frames += body.count(b'\n\n')
+        if b'\nevent: appointment\n' in body or body.startswith(b'event: appointment\n'):
+            self.round.arrived(time.perf_counter())
+
+    async def run(self):
+        await application(self.scope, self.receive, self.send)
+
+
+class Round:
+    """Arrival times of the event being fanned out."""
+
+    def __init__(self):
+        self.expected = 0
+        self.latencies = []
+        self.started = None
+        self.done = asyncio.Event()
+        self.count = 0
+
+    def start(self, expected):
+        self.expected, self.count = expected, 0
+        self.done.clear()
+        self.started = time.perf_counter()
+
+    def arrived(self, now):
+        if self.started is None:
+            return
+        self.latencies.append(now - self.started)
+        self.count += 1
+        if self.count >= self.expected:
+            self.done.set()
+
+
+def touch(appointment_id):
+    """Save one appointment (flip scheduled/completed); publishes on commit."""
+    appointment = Appointment.objects.get(pk=appointment_id)
+    appointment.status = 'completed' if appointment.status == 'scheduled' else 'scheduled'
+    appointment.save(update_fields=['status'])
+
+
+async def run(subscribers, event_count, idle, cookie, appointment_id, ramp, out):
+    round_state = Round()
+    path = reverse('live_events')
+    streams = [Stream(path, 'kinds=appointment', cookie, index, round_state) for index in range(subscribers)]
+
+    threads_before, rss_before = threading.active_count(), rss_kb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = []
+    for first in range(0, subscribers, ramp):
+        batch = streams[first:first + ramp]
+        tasks += [asyncio.create_task(stream.run()) for stream in batch]
+        # Wait for the response headers; a failed stream finishes its task.
+        while any(stream.status is None for stream in batch) and not any(task.done() for task in tasks):
+            await asyncio.sleep(0.01)
+    connect_seconds = time.perf_counter() - started
+    failed = [stream.status for stream in streams if stream.status != 200]
+    if failed:
+        for stream in streams:
+            stream.closed.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise CommandError(f'{len(failed)} streams failed to open (status {failed[0]}).')
+
+    await asyncio.sleep(idle)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    threads, rss = threading.active_count() - threads_before, rss_kb() - rss_before
+    frames_idle = sum(stream.frames for stream in streams)
+
+    rounds = []
+    for _ in range(event_count):
+        round_state.start(subscribers)
+        await sync_to_async(touch, thread_sensitive=False)(appointment_id)
+        try:
+            await asyncio.wait_for(round_state.done.wait(), 30)
+        except asyncio.TimeoutError:
+            pass
+        rounds.append((round_state.count, time.perf_counter() - round_state.started))
+
+    for stream in streams:
+        stream.closed.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = sorted(round_state.latencies)
+    delivered = sum(count for count, _ in rounds)
+    out.write(f'Subscribers:         {subscribers} open in {connect_seconds:.2f}s')
+    out.write(f'Idle for:            {idle:.0f}s ({frames_idle} frames sent, heartbeats included)')
+    out.write(f'Memory per stream:   {traced / subscribers / 1024:.1f} KB Python heap, '
+              f'{rss / subscribers:.1f} KB RSS')
+    out.write(f'Threads per stream:  {threads / subscribers:.2f}')
+    out.write(f'Delivered:           {delivered}/{subscribers * event_count} events')
+    if latencies:
+        out.write(f'Commit to stream:    p50 {percentile(latencies, 0.50) * 1000:.1f} ms, '
+                  f'p95 {percentile(latencies, 0.95) * 1000:.1f} ms, '
+                  f'p99 {percentile(latencies, 0.99) * 1000:.1f} ms')
+        out.write(f'Commit to last:      mean {statistics.fmean(t for _, t in rounds) * 1000:.1f} ms')
+    out.write(f'Left subscribed:     {events.broker.subscriber_count()}')
+
+
+class Command(BaseCommand):
+    help = 'Hold thousands of idle live-update streams in this process and time event fan-out.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=2000)
+        parser.add_argument('--events', type=int, default=20, help='Appointment changes to publish.')
+        parser.add_argument('--idle', type=float, default=5.0, help='Seconds to idle before publishing.')
+        parser.add_argument('--ramp', type=int, default=200, help='Streams opened at a time.')
+        parser.add_argument('--user', default='admin', help='Username the streams are opened as.')
+
+    def handle(self, *args, **options):
+        if options['subscribers'] < 1:
+            raise CommandError('--subscribers must be positive.')
+        appointment_id = Appointment.objects.order_by('pk').values_list('pk', flat=True).first()
+        if appointment_id is None:
+            raise CommandError('No appointments to change; run seed_synthetic first.')
+        cookie = login_cookie(options['user'])
+        asyncio.run(run(options['subscribers'], options['events'], options['idle'], cookie,
+                        appointment_id, options['ramp'], self.stdout))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from SamirHospital.stats import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute every admin dashboard counter from the live tables.'
+
+    def handle(self, *args, **options):
+        for name, value in rebuild_counters().items():
+            self.stdout.write(f'{name:<24} {value}')
+        self.stdout.write(self.style.SUCCESS('Dashboard counters rebuilt.'))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from SamirHospital.search import REBUILD_BATCH_SIZE, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search documents for every patient and lab test.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} documents in {time.perf_counter() - started:.2f}s.'
+        ))
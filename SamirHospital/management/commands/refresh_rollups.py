@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from SamirHospital.rollups import ROLLUPS, refresh
+
+
+class Command(BaseCommand):
+    help = 'Recompute the reporting rollups from the billing, appointment and lab test tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(ROLLUPS) + ['all'], default='all')
+        parser.add_argument('--from', dest='date_from', type=datetime.date.fromisoformat,
+                            help='First day to refresh (YYYY-MM-DD); default: the beginning.')
+        parser.add_argument('--to', dest='date_to', type=datetime.date.fromisoformat,
+                            help='Last day to refresh (YYYY-MM-DD); default: the end.')
+        parser.add_argument('--days', type=int,
+                            help='Only refresh the last N days up to today (for a periodic job).')
+
+    def handle(self, *args, **options):
+        date_from, date_to = options['date_from'], options['date_to']
+        if options['days'] is not None:
+            date_to = timezone.localdate()
+            date_from = date_to - datetime.timedelta(days=options['days'] - 1)
+        kinds = sorted(ROLLUPS) if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            rows = refresh(kind, date_from, date_to)
+            self.stdout.write(self.style.SUCCESS(f'{kind}: {rows} rollup rows written.'))
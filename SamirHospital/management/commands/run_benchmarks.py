@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from SamirHospital import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time views and key ORM queries, optionally failing on regressions against a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--case', action='append', dest='only',
+                            help='Only run cases whose name contains this (repeatable).')
+        parser.add_argument('--cold', action='store_true', help='Disable the versioned cache.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compare against this earlier --output file.')
+        parser.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown before a case regresses.')
+        parser.add_argument('--min-slack-ms', type=float, default=1.0,
+                            help='Slowdowns smaller than this never count as regressions.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = benchmarks.load(options['baseline'])
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read baseline: {exc}')
+
+        document = benchmarks.run(
+            iterations=options['iterations'], warmup=options['warmup'],
+            only=options['only'], cold=options['cold'], log=self.stdout.write,
+        )
+        if options['output']:
+            benchmarks.save(document, options['output'])
+            self.stdout.write(f'Results written to {options["output"]}.')
+        if baseline is None:
+            return
+
+        metric = options['metric']
+        regressions = 0
+        self.stdout.write(f'\n{"case":<40} {"baseline":>10} {"current":>10} {"queries":>9}  verdict')
+        for name, before, now, verdict in benchmarks.compare(
+            document, baseline, options['tolerance'], options['min_slack_ms'], metric,
+        ):
+            line = (f'{name:<40} {before[metric]:>10.2f} {now[metric]:>10.2f} '
+                    f'{before["queries"]:>4}->{now["queries"]:<4}  {verdict}')
+            if verdict == 'regression':
+                regressions += 1
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError(f'{regressions} case(s) regressed against {options["baseline"]}.')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
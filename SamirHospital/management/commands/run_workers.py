@@ -0,0 +1,86 @@
+import logging
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from SamirHospital.jobs import DEFAULT_VISIBILITY_TIMEOUT, claim, latency_summary, logger, run_job, worker_id
+
+
+def worker_loop(visibility_timeout, poll_interval, burst, stopping):
+    worker = worker_id()
+    while not stopping.is_set():
+        close_old_connections()
+        job = claim(worker, visibility_timeout)
+        if job is None:
+            if burst:
+                return
+            stopping.wait(poll_interval)
+            continue
+        started = time.perf_counter()
+        status = run_job(job)
+        logger.info('%s %s #%s %s in %.3fs (attempt %d, waited %.3fs)', worker, job.name, job.pk, status,
+                    time.perf_counter() - started, job.attempts, job.wait_seconds)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs from the database queue in N worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Worker processes to start.')
+        parser.add_argument('--visibility-timeout', type=int, default=DEFAULT_VISIBILITY_TIMEOUT,
+                            help='Seconds before a job claimed by a dead worker is retried.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print per-task latency for the last day and exit.')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            return self.print_stats()
+        if not logger.hasHandlers():
+            # No LOGGING configured for the app: report jobs on the console.
+            # Worker processes inherit the handler.
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO if options['verbosity'] >= 1 else logging.WARNING)
+        args = (options['visibility_timeout'], options['poll_interval'], options['burst'])
+        if options['concurrency'] <= 1:
+            stopping = multiprocessing.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+            try:
+                worker_loop(*args, stopping)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Children must open their own database connections.
+        connections.close_all()
+        stopping = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(target=worker_loop, args=(*args, stopping), daemon=True)
+            for _ in range(options['concurrency'])
+        ]
+        for process in processes:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            stopping.set()
+            for process in processes:
+                process.join()
+
+    def print_stats(self):
+        self.stdout.write(f'{"task":<24} {"done":>6} {"failed":>6} {"wait p50":>9} {"wait p95":>9} '
+                          f'{"run p50":>8} {"run p95":>8}')
+        for name, row in latency_summary().items():
+            cells = [f'{row[key]:.3f}' if row[key] is not None else '-'
+                     for key in ('wait_p50', 'wait_p95', 'run_p50', 'run_p95')]
+            self.stdout.write(f'{name:<24} {row["done"]:>6} {row["failed"]:>6} {cells[0]:>9} {cells[1]:>9} '
+                              f'{cells[2]:>8} {cells[3]:>8}')
@@ -0,0 +1,332 @@
+"""
+Request-level performance metrics.
+
+:class:`MetricsMiddleware` measures every request and files the result
+under the view's URL name.  Each of the following goes into a fixed-bucket
+histogram:
+
+* wall time
+* SQL query count
+* SQL time
+* template render time
+* response size
+
+A request that runs the same SQL statement more than
+``METRICS_N_PLUS_ONE_THRESHOLD`` times is flagged as a likely N+1 loop.
+Django keeps parameters out of the SQL text, so identical text means
+identical query shape.
+
+SQL is timed by an execute wrapper installed on every connection.
+Templates are timed by :class:`TimedDjangoTemplates`, the template backend
+configured in ``settings.TEMPLATES``.  Both report to the current request
+through a context variable.  That variable follows async views into the
+ORM's ``sync_to_async`` threads.
+
+The histograms are process-local, like ``caching.stats``.  When several
+worker processes run, each one serves its own figures on ``/metrics``.
+Prometheus aggregates them.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name -> (buckets, help text)
+HISTOGRAMS = {
+    'request_duration_seconds': (DURATION_BUCKETS, 'Wall time per request.'),
+    'db_queries': (QUERY_BUCKETS, 'SQL queries per request.'),
+    'db_duration_seconds': (DURATION_BUCKETS, 'Time spent in SQL per request.'),
+    'template_duration_seconds': (DURATION_BUCKETS, 'Template render time per request.'),
+    'response_size_bytes': (SIZE_BUCKETS, 'Response body size (when known).'),
+}
+
+PREFIX = 'hospital_'
+UNRESOLVED = '<unresolved>'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style; not thread-safe on its own."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, result = 0, []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def quantile(self, fraction):
+        """Estimate by linear interpolation inside the bucket holding ``fraction``."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class RequestSample:
+    """What one request did; filled in by the execute wrapper and template backend."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def add_query(self, sql, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        self.statements[sql] += 1
+
+    def repeated_statement(self):
+        """``(sql, times)`` of the most repeated statement, or ``(None, 0)``."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.histograms = defaultdict(
+            lambda: {name: Histogram(buckets) for name, (buckets, _) in HISTOGRAMS.items()}
+        )
+        self.requests = Counter()
+        self.n_plus_one = Counter()
+        self.n_plus_one_examples = {}
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+    def record(self, view, method, status, sample, size=None):
+        duration = time.perf_counter() - sample.started
+        statement, repeats = sample.repeated_statement()
+        flagged = repeats > settings.METRICS_N_PLUS_ONE_THRESHOLD
+        with self._lock:
+            histograms = self.histograms[view]
+            histograms['request_duration_seconds'].observe(duration)
+            histograms['db_queries'].observe(sample.queries)
+            histograms['db_duration_seconds'].observe(sample.db_seconds)
+            histograms['template_duration_seconds'].observe(sample.template_seconds)
+            if size is not None:
+                histograms['response_size_bytes'].observe(size)
+            self.requests[view, method, status] += 1
+            if flagged:
+                self.n_plus_one[view] += 1
+                self.n_plus_one_examples[view] = (statement, repeats)
+        if flagged:
+            logger.warning('%s ran the same query %d times (likely N+1):\n%s', view, repeats, statement)
+
+    def report(self):
+        """One row per view for the HTML report, slowest p95 first."""
+        rows = []
+        with self._lock:
+            for view, histograms in self.histograms.items():
+                duration = histograms['request_duration_seconds']
+                statement, repeats = self.n_plus_one_examples.get(view, (None, 0))
+                rows.append({
+                    'view': view,
+                    'requests': duration.count,
+                    'p50_ms': _ms(duration.quantile(0.50)),
+                    'p95_ms': _ms(duration.quantile(0.95)),
+                    'p99_ms': _ms(duration.quantile(0.99)),
+                    'mean_queries': histograms['db_queries'].mean,
+                    'p95_queries': histograms['db_queries'].quantile(0.95),
+                    'mean_db_ms': _ms(histograms['db_duration_seconds'].mean),
+                    'mean_template_ms': _ms(histograms['template_duration_seconds'].mean),
+                    'mean_size_kb': _kb(histograms['response_size_bytes'].mean),
+                    'n_plus_one': self.n_plus_one[view],
+                    'n_plus_one_sql': statement,
+                    'n_plus_one_repeats': repeats,
+                })
+        return sorted(rows, key=lambda row: row['p95_ms'] or 0, reverse=True)
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (buckets, help_text) in HISTOGRAMS.items():
+                metric = PREFIX + name
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for view, histograms in sorted(self.histograms.items()):
+                    histogram = histograms[name]
+                    label = f'view="{_escape(view)}"'
+                    bounds = [_number(bound) for bound in buckets] + ['+Inf']
+                    for bound, count in zip(bounds, histogram.cumulative()):
+                        lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{metric}_sum{{{label}}} {_number(histogram.sum)}')
+                    lines.append(f'{metric}_count{{{label}}} {histogram.count}')
+
+            metric = PREFIX + 'requests_total'
+            lines += [f'# HELP {metric} Requests by view, method and status.', f'# TYPE {metric} counter']
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'{metric}{{view="{_escape(view)}",method="{_escape(method)}",'
+                             f'status="{status}"}} {count}')
+
+            metric = PREFIX + 'n_plus_one_total'
+            lines += [f'# HELP {metric} Requests that repeated one SQL statement past the threshold.',
+                      f'# TYPE {metric} counter']
+            for view, count in sorted(self.n_plus_one.items()):
+                lines.append(f'{metric}{{view="{_escape(view)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _kb(size):
+    return None if size is None else round(size / 1024, 1)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+_current = ContextVar('hospital_request_metrics', default=None)
+
+
+# ---------------------------------------------------------------------------
+# SQL and template instrumentation
+# ---------------------------------------------------------------------------
+
+def record_query(execute, sql, params, many, context):
+    """``execute_wrapper`` on every connection; a no-op outside a measured request."""
+    sample = _current.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.add_query(sql, time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(instrument_connection)
+
+
+class TimedTemplate(Template):
+    """Backend template whose outermost render is timed; includes aren't added twice."""
+
+    def render(self, context=None, request=None):
+        sample = _current.get()
+        if sample is None:
+            return super().render(context, request)
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_depth -= 1
+            if not sample.template_depth:
+                sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose renders are added to the current request's metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+def _response_size(response):
+    if not response.streaming:
+        return len(response.content)
+    length = response.get('Content-Length')
+    return int(length) if length else None
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = RequestSample()
+        token = _current.set(sample)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, sample)
+        return response
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current.set(sample)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, sample)
+        return response
+
+    def record(self, request, response, sample):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else UNRESOLVED
+        registry.record(view, request.method, response.status_code, sample, _response_size(response))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0004_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicinesale',
+            name='billing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='medicine_sales', to='SamirHospital.billing'),
+        ),
+        migrations.AddField(
+            model_name='medicinesale',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:15
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0005_medicinesale_price_snapshot'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='name_key',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(django.db.models.functions.text.Concat('first_name', models.Value(' '), 'last_name')), output_field=models.CharField(max_length=301)),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='contact',
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['name_key'], name='user_name_key_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENTS = 'SamirHospital_searchdocument'
+FTS = 'SamirHospital_searchfts'
+
+SQLITE_FORWARD = [
+    # External-content FTS5 table: the text lives in the documents table only.
+    f"""CREATE VIRTUAL TABLE "{FTS}" USING fts5(
+        title, body, content='{DOCUMENTS}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER "{FTS}_ai" AFTER INSERT ON "{DOCUMENTS}" BEGIN
+        INSERT INTO "{FTS}"(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+    f"""CREATE TRIGGER "{FTS}_ad" AFTER DELETE ON "{DOCUMENTS}" BEGIN
+        INSERT INTO "{FTS}"("{FTS}", rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    f"""CREATE TRIGGER "{FTS}_au" AFTER UPDATE ON "{DOCUMENTS}" BEGIN
+        INSERT INTO "{FTS}"("{FTS}", rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO "{FTS}"(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END""",
+]
+SQLITE_BACKWARD = [
+    f'DROP TRIGGER IF EXISTS "{FTS}_au"',
+    f'DROP TRIGGER IF EXISTS "{FTS}_ad"',
+    f'DROP TRIGGER IF EXISTS "{FTS}_ai"',
+    f'DROP TABLE IF EXISTS "{FTS}"',
+]
+
+POSTGRES_FORWARD = [
+    f"""ALTER TABLE "{DOCUMENTS}" ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+    ) STORED""",
+    f'CREATE INDEX "{DOCUMENTS}_vector_idx" ON "{DOCUMENTS}" USING GIN (search_vector)',
+]
+POSTGRES_BACKWARD = [
+    f'DROP INDEX IF EXISTS "{DOCUMENTS}_vector_idx"',
+    f'ALTER TABLE "{DOCUMENTS}" DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+create_text_index = _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+drop_text_index = _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0006_autocomplete_prefix_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('patient', 'Patient'), ('labtest', 'Lab test')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='SamirHospital.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_document')],
+            },
+        ),
+        # Other databases get no text index; search.py falls back to icontains.
+        migrations.RunPython(create_text_index, drop_text_index),
+    ]
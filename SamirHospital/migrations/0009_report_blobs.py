@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:25
+
+import SamirHospital.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0008_background_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='labtest',
+            name='report_file',
+            field=models.FileField(blank=True, null=True, storage=SamirHospital.storage.report_storage, upload_to='lab_reports/'),
+        ),
+        migrations.CreateModel(
+            name='ReportBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('digest', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('released_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'released_at'], name='reportblob_gc_idx')],
+            },
+        ),
+    ]
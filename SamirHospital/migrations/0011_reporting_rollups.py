@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0010_archive_segments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_method', models.CharField(max_length=10)),
+                ('bills', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('department', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.department')),
+                ('doctor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.doctor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'department', 'doctor', 'payment_method'), name='unique_revenue_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TurnaroundRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tests', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('turnaround_seconds', models.BigIntegerField(default=0)),
+                ('department', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.department')),
+                ('doctor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.doctor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'department', 'doctor'), name='unique_turnaround_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UtilisationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('cancelled', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.department')),
+                ('doctor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='SamirHospital.doctor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'department', 'doctor'), name='unique_utilisation_rollup')],
+            },
+        ),
+    ]
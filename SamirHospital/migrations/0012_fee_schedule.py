@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0011_reporting_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fee', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('tax_rate', models.DecimalField(decimal_places=4, default=0, max_digits=5)),
+                ('discount_rate', models.DecimalField(decimal_places=4, default=0, max_digits=5)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='billing',
+            constraint=models.UniqueConstraint(condition=models.Q(('appointment__isnull', False)), fields=('appointment',), name='unique_bill_per_appointment'),
+        ),
+        migrations.AddField(
+            model_name='feeschedule',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='SamirHospital.department'),
+        ),
+        migrations.AddField(
+            model_name='feeschedule',
+            name='doctor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='SamirHospital.doctor'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeschedule',
+            constraint=models.UniqueConstraint(condition=models.Q(('doctor__isnull', False)), fields=('doctor',), name='unique_doctor_fee'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeschedule',
+            constraint=models.UniqueConstraint(condition=models.Q(('department__isnull', False), ('doctor__isnull', True)), fields=('department',), name='unique_department_fee'),
+        ),
+    ]
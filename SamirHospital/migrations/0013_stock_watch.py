@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0012_fee_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_type', models.CharField(choices=[('medicine', 'Medicine'), ('inventory', 'Inventory item')], max_length=10)),
+                ('item_id', models.PositiveIntegerField()),
+                ('reason', models.CharField(choices=[('expired', 'Expired'), ('expiring', 'Expiring soon'), ('low_stock', 'Low stock')], max_length=10)),
+                ('item_name', models.CharField(max_length=100)),
+                ('detail', models.CharField(max_length=200)),
+                ('due_date', models.DateField()),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='reorder_level',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='medicine',
+            name='reorder_level',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('expiry_date__isnull', False)), fields=['expiry_date'], name='inventory_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('quantity__lte', models.F('reorder_level'))), fields=['id'], name='inventory_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['expiry_date'], name='medicine_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('stock__lte', models.F('reorder_level'))), fields=['id'], name='medicine_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['due_date', 'id'], name='stockalert_open_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockalert',
+            constraint=models.UniqueConstraint(fields=('item_type', 'item_id', 'reason'), name='unique_stock_alert'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('SamirHospital', '0013_stock_watch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billing',
+            name='archived_doctor',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='SamirHospital.doctor'),
+        ),
+    ]
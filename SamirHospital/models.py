@@ -1,8 +1,98 @@
 # models.py
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Concat, Lower
 from django.utils import timezone
 
+from .storage import report_storage
+
+# ROW_POLICY values for "every row" and "no rows" (see VisibleQuerySet).
+ALL_ROWS = object()
+NO_ROWS = None
+# owner_filters() for a user who sees no rows; matches nothing.
+NOTHING_OWNED = {'pk': None}
+
+
+class VisibleQuerySet(models.QuerySet):
+    """
+    Row-level access, compiled into SQL.
+
+    A model using this manager declares ``ROW_POLICY``, mapping each role to
+    the rows that role may see:
+
+    * ``ALL_ROWS`` - everything;
+    * a lookup path to the owning user, e.g. ``'doctor__user'``;
+    * a function of the user returning a ``Q``.
+
+    Roles missing from the policy see nothing; superusers see everything.
+    ``visible_to(user)`` adds the rule as a ``WHERE`` clause, so access costs
+    no extra query and follows the same indexes as the owner lookups.  When
+    the user carries a cached principal (see ``principal.py``), a
+    ``'doctor__user'`` rule becomes ``doctor_id = <id>`` and skips the join.
+    """
+
+    def _rule(self, user):
+        if user.is_superuser:
+            return ALL_ROWS
+        return self.model.ROW_POLICY.get(user.role, NO_ROWS)
+
+    def _known_owner(self, user, rule):
+        """
+        ``rule`` as a filter on this model's own column, if no query is
+        needed.  The value is None for a user without the profile row the
+        rule goes through (a doctor-role user with no Doctor), who owns
+        nothing.
+        """
+        field_name, _, owner_path = rule.partition('__')
+        field = self.model._meta.get_field(field_name)
+        if not owner_path:
+            return {field.attname: user.pk}
+        principal = getattr(user, 'principal', None)
+        if principal is not None and owner_path == 'user':
+            return {field.attname: principal.profile_id(field.related_model)}
+        return None
+
+    def visible_to(self, user):
+        rule = self._rule(user)
+        if rule is ALL_ROWS:
+            return self.all()
+        if rule is NO_ROWS:
+            return self.none()
+        if callable(rule):
+            return self.filter(rule(user))
+        known = self._known_owner(user, rule)
+        if known is None:
+            return self.filter(**{rule: user})
+        # ``doctor_id = None`` would match every row without a doctor.
+        if None in known.values():
+            return self.none()
+        return self.filter(**known)
+
+    def owner_filters(self, user):
+        """
+        The policy for ``user`` as equality filters on this model's own
+        columns, e.g. ``{'doctor_id': 7}``, for rows that are not in the
+        database (archived ones), or ``NOTHING_OWNED`` when the user sees
+        no rows.  Costs one query for an owner rule unless the user's
+        principal is cached.
+        """
+        rule = self._rule(user)
+        if rule is ALL_ROWS:
+            return {}
+        if rule is NO_ROWS:
+            return dict(NOTHING_OWNED)
+        if callable(rule):
+            raise TypeError(f'{self.model.__name__} policy for {user.role} is not a plain owner path.')
+        known = self._known_owner(user, rule)
+        if known is None:
+            field_name, _, owner_path = rule.partition('__')
+            field = self.model._meta.get_field(field_name)
+            owner = field.related_model._default_manager.filter(**{owner_path: user})
+            known = {field.attname: owner.values_list('pk', flat=True).first()}
+        if None in known.values():
+            return dict(NOTHING_OWNED)
+        return known
+
 class CustomUser(AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
@@ -11,6 +101,18 @@ class CustomUser(AbstractUser):
         ('nurse', 'Nurse'),
     ]
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    # Lower-cased "first last", maintained by the database and indexed so
+    # name typeahead is an index range scan (see autocomplete.py).
+    name_key = models.GeneratedField(
+        expression=Lower(Concat('first_name', models.Value(' '), 'last_name')),
+        output_field=models.CharField(max_length=301),
+        db_persist=True,
+    )
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['name_key'], name='user_name_key_idx'),
+        ]
 
 class Department(models.Model):
     name = models.CharField(max_length=100)
@@ -34,14 +136,50 @@ class Patient(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     date_of_birth = models.DateField()
     gender = models.CharField(max_length=10)
-    contact = models.CharField(max_length=15)
+    contact = models.CharField(max_length=15, db_index=True)
     address = models.TextField()
     blood_group = models.CharField(max_length=5)
     medical_history = models.TextField(blank=True)
 
+    objects = VisibleQuerySet.as_manager()
+
+    ROW_POLICY = {
+        'admin': ALL_ROWS,
+        'nurse': ALL_ROWS,
+        # Patients the doctor has seen or will see.
+        'doctor': lambda user: models.Q(pk__in=Appointment.objects.filter(doctor__user=user).values('patient')),
+        'patient': 'user',
+    }
+
     def __str__(self):
         return self.user.get_full_name()
 
+class DoctorSchedule(models.Model):
+    """Weekly working hours of a doctor, cut into fixed-length slots."""
+    WEEKDAYS = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='schedules')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'weekday'], name='unique_doctor_weekday'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} {self.get_weekday_display()} {self.start_time}-{self.end_time}"
+
 class Appointment(models.Model):
     STATUS_CHOICES = [
         ('scheduled', 'Scheduled'),
@@ -53,9 +191,36 @@ class Appointment(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     appointment_date = models.DateField()
     time_slot = models.CharField(max_length=20)
+    # Structured slot boundaries; ``time_slot`` keeps the display label.
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
     reason = models.TextField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='scheduled')
 
+    objects = VisibleQuerySet.as_manager()
+
+    ROW_POLICY = {
+        'admin': ALL_ROWS,
+        'nurse': ALL_ROWS,
+        'doctor': 'doctor__user',
+        'patient': 'patient__user',
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date', 'status'], name='appt_doctor_date_status_idx'),
+            models.Index(fields=['patient', 'appointment_date'], name='appt_patient_date_idx'),
+            models.Index(fields=['appointment_date'], name='appt_date_idx'),
+        ]
+        constraints = [
+            # A doctor can hold only one live booking per slot start.
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'start_time'],
+                condition=~models.Q(status='cancelled'),
+                name='unique_doctor_slot',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.get_full_name()} with Dr. {self.doctor.user.last_name} on {self.appointment_date}"
     
@@ -71,8 +236,29 @@ class LabTest(models.Model):
     test_name = models.CharField(max_length=100)
     test_date = models.DateField(auto_now_add=True)
     result = models.TextField(blank=True, null=True)
-    report_file = models.FileField(upload_to='lab_reports/', blank=True, null=True)
+    report_file = models.FileField(upload_to='lab_reports/', storage=report_storage, blank=True, null=True)
     status = models.CharField(max_length=10, choices=TEST_STATUS, default='pending')
+    # Filled in by the ``process_lab_report`` background job.
+    report_checksum = models.CharField(max_length=64, blank=True)
+    report_preview = models.FileField(upload_to='lab_reports/previews/', blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    objects = VisibleQuerySet.as_manager()
+
+    ROW_POLICY = {
+        'admin': ALL_ROWS,
+        'nurse': ALL_ROWS,
+        'doctor': 'doctor__user',
+        'patient': 'patient__user',
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'test_date'], name='labtest_status_date_idx'),
+            models.Index(fields=['patient', 'test_date'], name='labtest_patient_date_idx'),
+            models.Index(fields=['doctor', 'test_date'], name='labtest_doctor_date_idx'),
+            models.Index(fields=['test_date'], name='labtest_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.test_name} for {self.patient.user.get_full_name()}"
@@ -84,6 +270,20 @@ class Medicine(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2)
     expiry_date = models.DateField()
     stock = models.PositiveIntegerField()
+    # check_stock raises a low-stock alert once stock falls to this level.
+    reorder_level = models.PositiveIntegerField(default=0)
+
+    objects = VisibleQuerySet.as_manager()
+
+    # Stock is shown to every signed-in user (medicine_list, inventory_list).
+    ROW_POLICY = {'admin': ALL_ROWS, 'nurse': ALL_ROWS, 'doctor': ALL_ROWS, 'patient': ALL_ROWS}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expiry_date'], name='medicine_expiry_idx'),
+            models.Index(fields=['id'], condition=models.Q(stock__lte=models.F('reorder_level')),
+                         name='medicine_low_stock_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -93,8 +293,14 @@ class MedicineSale(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     sale_date = models.DateTimeField(auto_now_add=True)
+    # Price at the time of sale; empty only for sales recorded before it existed.
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
+    billing = models.ForeignKey('Billing', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='medicine_sales')
 
     def get_total_price(self):
+        if self.unit_price is not None:
+            return self.quantity * self.unit_price
         return self.quantity * self.medicine.price
 
     def __str__(self):
@@ -109,6 +315,21 @@ class InventoryItem(models.Model):
     added_date = models.DateField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
     expiry_date = models.DateField(blank=True, null=True)  # if applicable
+    # check_stock raises a low-stock alert once quantity falls to this level.
+    reorder_level = models.PositiveIntegerField(default=0)
+
+    objects = VisibleQuerySet.as_manager()
+
+    # Stock is shown to every signed-in user (medicine_list, inventory_list).
+    ROW_POLICY = {'admin': ALL_ROWS, 'nurse': ALL_ROWS, 'doctor': ALL_ROWS, 'patient': ALL_ROWS}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expiry_date'], condition=models.Q(expiry_date__isnull=False),
+                         name='inventory_expiry_idx'),
+            models.Index(fields=['id'], condition=models.Q(quantity__lte=models.F('reorder_level')),
+                         name='inventory_low_stock_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.quantity} {self.unit})"
@@ -130,6 +351,11 @@ class EntryLog(models.Model):
     time_out = models.DateTimeField(blank=True, null=True)
     handled_by = models.ForeignKey(SecurityStaff, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['time_in'], name='entrylog_time_in_idx'),
+        ]
+
     def __str__(self):
         return f"{self.person_name} - {self.purpose} ({self.time_in})"
 
@@ -145,6 +371,10 @@ class Billing(models.Model):
 
     patient = models.ForeignKey('Patient', on_delete=models.CASCADE)
     appointment = models.ForeignKey('Appointment', on_delete=models.SET_NULL, null=True, blank=True)
+    # The appointment's doctor, kept when archiving unlinks the appointment
+    # (archive.py), so revenue rollups still attribute the bill.
+    archived_doctor = models.ForeignKey('Doctor', on_delete=models.SET_NULL, null=True, blank=True,
+                                        editable=False, related_name='+')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     tax = models.DecimalField(max_digits=6, decimal_places=2, default=0)
     discount = models.DecimalField(max_digits=6, decimal_places=2, default=0)
@@ -155,10 +385,292 @@ class Billing(models.Model):
     payment_date = models.DateTimeField(default=timezone.now)
     description = models.TextField(blank=True)
 
+    objects = VisibleQuerySet.as_manager()
+
+    ROW_POLICY = {
+        'admin': ALL_ROWS,
+        'nurse': ALL_ROWS,
+        # Bills raised for the doctor's own appointments.
+        'doctor': 'appointment__doctor__user',
+        'patient': 'patient__user',
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_status', 'payment_date'], name='bill_status_date_idx'),
+            models.Index(fields=['patient', 'payment_date'], name='bill_patient_date_idx'),
+            models.Index(fields=['payment_date'], name='bill_date_idx'),
+        ]
+        constraints = [
+            # One bill per appointment, so generate_bills can be re-run safely.
+            models.UniqueConstraint(fields=['appointment'], condition=models.Q(appointment__isnull=False),
+                                    name='unique_bill_per_appointment'),
+        ]
+
     def save(self, *args, **kwargs):
         self.total = self.amount + self.tax - self.discount
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Bill #{self.id} - {self.patient.user.get_full_name()} - Rs. {self.total}"
-  
\ No newline at end of file
+  
+
+class FeeSchedule(models.Model):
+    """
+    Consultation price used by ``manage.py generate_bills``.  The most
+    specific rule wins: the doctor's, then the department's, then the
+    default rule that names neither.
+    """
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, null=True, blank=True)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, null=True, blank=True)
+    fee = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=4, default=0)  # 0.1300 = 13%
+    discount_rate = models.DecimalField(max_digits=5, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor'], condition=models.Q(doctor__isnull=False),
+                                    name='unique_doctor_fee'),
+            models.UniqueConstraint(fields=['department'],
+                                    condition=models.Q(doctor__isnull=True, department__isnull=False),
+                                    name='unique_department_fee'),
+        ]
+
+    def __str__(self):
+        scope = self.doctor or self.department or 'Default'
+        return f"{scope}: Rs. {self.fee}"
+
+
+class StockAlert(models.Model):
+    """
+    An expired, expiring or low-stock medicine or inventory item found by
+    ``manage.py check_stock``.  There is one row per item and reason, reused
+    across runs; ``resolved_at`` is set once a run no longer finds the
+    problem.  See ``stockwatch.py``.
+    """
+    ITEM_TYPES = [
+        ('medicine', 'Medicine'),
+        ('inventory', 'Inventory item'),
+    ]
+    REASONS = [
+        ('expired', 'Expired'),
+        ('expiring', 'Expiring soon'),
+        ('low_stock', 'Low stock'),
+    ]
+
+    item_type = models.CharField(max_length=10, choices=ITEM_TYPES)
+    item_id = models.PositiveIntegerField()
+    reason = models.CharField(max_length=10, choices=REASONS)
+    item_name = models.CharField(max_length=100)
+    detail = models.CharField(max_length=200)
+    due_date = models.DateField()  # expiry date, or the day stock ran low
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item_type', 'item_id', 'reason'], name='unique_stock_alert'),
+        ]
+        indexes = [
+            models.Index(fields=['due_date', 'id'], condition=models.Q(resolved_at__isnull=True),
+                         name='stockalert_open_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_reason_display()}: {self.item_name}"
+
+
+class DashboardCounter(models.Model):
+    """
+    Materialised dashboard statistics, one row per counter.
+
+    Kept current by the signal receivers in ``signals.py`` and rebuilt from
+    scratch by ``manage.py rebuild_dashboard_counters``.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class SearchDocument(models.Model):
+    """
+    Shadow copy of the free text clinicians search, one row per patient or
+    lab test.  The full-text index (FTS5 on SQLite, a GIN ``tsvector`` on
+    PostgreSQL) is built over this table by migration 0007; see ``search.py``.
+    """
+    KINDS = [
+        ('patient', 'Patient'),
+        ('labtest', 'Lab test'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    patient = models.ForeignKey('Patient', on_delete=models.CASCADE, related_name='search_documents')
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.title}"
+
+
+class Job(models.Model):
+    """
+    A background task waiting in, or taken from, the database-backed queue.
+
+    Workers started by ``manage.py run_workers`` claim jobs with a
+    conditional ``UPDATE``; see ``jobs.py``.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_status_locked_idx'),
+            models.Index(fields=['name', 'finished_at'], name='job_name_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+    @property
+    def wait_seconds(self):
+        """Time from enqueue (or the scheduled retry) to the last start."""
+        if self.started_at is None:
+            return None
+        return max(0.0, (self.started_at - max(self.created_at, self.run_at)).total_seconds())
+
+    @property
+    def run_seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+
+class ReportBlob(models.Model):
+    """
+    One stored lab report file, shared by every ``LabTest`` that uploaded the
+    same bytes.  ``refcount`` is kept by the receivers in ``signals.py``;
+    ``manage.py gc_reports`` deletes blobs nobody references.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    released_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'released_at'], name='reportblob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+class ArchiveSegment(models.Model):
+    """
+    One gzip-compressed JSON Lines file of rows that ``manage.py
+    archive_records`` moved out of a live table; see ``archive.py``.
+    """
+    kind = models.CharField(max_length=20)
+    month = models.DateField()  # first day of the month the rows belong to
+    path = models.CharField(max_length=255, unique=True)  # relative to ARCHIVE_ROOT
+    row_count = models.PositiveIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)  # SHA-256 of the file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'last_date', 'first_date'], name='archive_kind_span_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.month:%Y-%m} ({self.row_count} rows)"
+
+
+# Reporting rollups (see ``rollups.py``).  Departments and doctors are kept by
+# id without a foreign key constraint: the figures outlive the rows they
+# describe, and archived appointments are only counted here.
+
+class RevenueRollup(models.Model):
+    """Billing totals per payment day, department, doctor and payment method."""
+    day = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, null=True,
+                                   db_constraint=False, related_name='+')
+    doctor = models.ForeignKey(Doctor, on_delete=models.DO_NOTHING, null=True,
+                               db_constraint=False, related_name='+')
+    payment_method = models.CharField(max_length=10)
+    bills = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department', 'doctor', 'payment_method'],
+                                    name='unique_revenue_rollup'),
+        ]
+
+
+class UtilisationRollup(models.Model):
+    """Appointments per day, department and doctor, by outcome."""
+    day = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, null=True,
+                                   db_constraint=False, related_name='+')
+    doctor = models.ForeignKey(Doctor, on_delete=models.DO_NOTHING, null=True,
+                               db_constraint=False, related_name='+')
+    booked = models.PositiveIntegerField(default=0)  # everything not cancelled
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department', 'doctor'], name='unique_utilisation_rollup'),
+        ]
+
+
+class TurnaroundRollup(models.Model):
+    """Lab tests ordered per day, department and doctor, and how long results took."""
+    day = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, null=True,
+                                   db_constraint=False, related_name='+')
+    doctor = models.ForeignKey(Doctor, on_delete=models.DO_NOTHING, null=True,
+                               db_constraint=False, related_name='+')
+    tests = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)  # with a completed_at time
+    turnaround_seconds = models.BigIntegerField(default=0)  # summed over ``completed``
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department', 'doctor'], name='unique_turnaround_rollup'),
+        ]
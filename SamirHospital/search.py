@@ -0,0 +1,256 @@
+"""
+Full-text search over patients and lab results.
+
+The text clinicians search — a patient's name, address, contact and medical
+history, a lab test's name and result — is copied into ``SearchDocument``
+rows by the receivers in ``signals.py``.  Migration 0007 indexes that table:
+
+* SQLite: an external-content FTS5 table kept in step by triggers, ranked
+  with ``bm25()``;
+* PostgreSQL: a stored ``tsvector`` column with a GIN index, ranked with
+  ``ts_rank()``;
+* anything else: an ``icontains`` scan of the documents table, unranked.
+
+Every word of the query must match, as a prefix: ``diab hyper`` finds
+"diabetic, hypertension".
+
+Given a ``user``, :func:`search` only returns documents whose patient or lab
+test that user could open: the row policies of both models (see
+``VisibleQuerySet``) become an ``object_id IN (...)`` condition per kind.
+"""
+import re
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .caching import bump_version
+from .models import LabTest, Patient, SearchDocument
+
+DOCUMENTS = SearchDocument._meta.db_table
+FTS = 'SamirHospital_searchfts'
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+REBUILD_BATCH_SIZE = 2000
+
+# Snippet markers: control characters that cannot occur in the escaped text.
+_START, _STOP = '\x02', '\x03'
+
+SearchHit = namedtuple('SearchHit', 'kind object_id patient_id title snippet rank')
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(query):
+    """The words of ``query``, stripped of any search-engine syntax."""
+    return _WORD.findall(query.lower())[:16]
+
+
+# ---------------------------------------------------------------------------
+# Documents
+# ---------------------------------------------------------------------------
+
+def _join(*parts):
+    return '\n'.join(part for part in parts if part)
+
+
+def patient_document(patient):
+    return SearchDocument(
+        kind='patient', object_id=patient.pk, patient_id=patient.pk,
+        title=patient.user.get_full_name() or patient.user.username,
+        body=_join(patient.medical_history, patient.address, patient.contact),
+    )
+
+
+def labtest_document(labtest):
+    return SearchDocument(
+        kind='labtest', object_id=labtest.pk, patient_id=labtest.patient_id,
+        title=f'{labtest.test_name} for {labtest.patient.user.get_full_name()}',
+        body=labtest.result or '',
+    )
+
+
+def index_documents(documents):
+    """Insert or replace ``documents``, matched on ``(kind, object_id)``."""
+    SearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['kind', 'object_id'],
+        update_fields=['patient', 'title', 'body', 'updated_at'],
+    )
+
+
+def index_patient(patient):
+    index_documents([patient_document(patient)])
+
+
+def index_labtest(labtest):
+    index_documents([labtest_document(labtest)])
+
+
+def reindex_patient(patient):
+    """Refresh a patient's own document and their lab tests (titles carry the name)."""
+    labtests = patient.labtest_set.select_related('patient__user')
+    index_documents([patient_document(patient)] + [labtest_document(labtest) for labtest in labtests])
+
+
+def remove_document(kind, object_id):
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild_index(batch_size=REBUILD_BATCH_SIZE):
+    """Recreate every document from the live tables; returns the count."""
+    sources = [
+        (Patient.objects.select_related('user'), patient_document),
+        (LabTest.objects.select_related('patient__user'), labtest_document),
+    ]
+    total = 0
+    with transaction.atomic():
+        # A plain DELETE: QuerySet.delete() would load every row to send signals.
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{DOCUMENTS}"')
+        for queryset, build in sources:
+            batch = []
+            for obj in queryset.order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(build(obj))
+                if len(batch) >= batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            SearchDocument.objects.bulk_create(batch)
+            total += len(batch)
+        bump_version(SearchDocument)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO "{FTS}"("{FTS}") VALUES (\'optimize\')')
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+# document kind -> model whose ROW_POLICY decides who may find it
+SOURCES = {'patient': Patient, 'labtest': LabTest}
+
+
+def _visible(user, kind):
+    """
+    ``{kind: queryset}`` of the rows ``user`` may find, or None for no
+    limit; an empty dict means nothing at all.  A kind whose rows are all
+    visible maps to None.
+    """
+    if user is None:
+        return None
+    visible = {}
+    for source, model in SOURCES.items():
+        queryset = model.objects.visible_to(user)
+        if kind not in (None, source) or queryset.query.is_empty():
+            continue
+        visible[source] = queryset.values('pk') if queryset.query.where else None
+    if kind is None and visible == dict.fromkeys(SOURCES):
+        return None
+    return visible
+
+
+def _visible_sql(visible):
+    """``visible`` as an SQL condition on the documents alias ``d``."""
+    parts, params = [], []
+    for source, queryset in visible.items():
+        if queryset is None:
+            parts.append('d.kind = %s')
+            params.append(source)
+        else:
+            sql, sub_params = queryset.query.sql_with_params()
+            parts.append(f'(d.kind = %s AND d.object_id IN ({sql}))')
+            params += [source, *sub_params]
+    return ' AND (' + ' OR '.join(parts) + ')', params
+
+
+def _highlight(snippet):
+    return mark_safe(escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def _search_sqlite(words, kind, limit, visible):
+    match = ' '.join(f'"{word}"*' for word in words)
+    sql = (
+        f'SELECT d.kind, d.object_id, d.patient_id, d.title, '
+        f"snippet(\"{FTS}\", 1, %s, %s, '...', 16), bm25(\"{FTS}\", 5.0, 1.0) AS rank "
+        f'FROM "{FTS}" JOIN "{DOCUMENTS}" d ON d.id = "{FTS}".rowid '
+        f'WHERE "{FTS}" MATCH %s'
+    )
+    params = [_START, _STOP, match]
+    if kind:
+        sql += ' AND d.kind = %s'
+        params.append(kind)
+    if visible is not None:
+        condition, condition_params = _visible_sql(visible)
+        sql += condition
+        params += condition_params
+    sql += ' ORDER BY rank LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_postgresql(words, kind, limit, visible):
+    tsquery = ' & '.join(f'{word}:*' for word in words)
+    sql = (
+        f'SELECT d.kind, d.object_id, d.patient_id, d.title, '
+        f"ts_headline('simple', d.body, q, %s), ts_rank(d.search_vector, q) AS rank "
+        f'FROM "{DOCUMENTS}" d, to_tsquery(\'simple\', %s) q '
+        f'WHERE d.search_vector @@ q'
+    )
+    params = [f'StartSel={_START}, StopSel={_STOP}, MaxWords=16, MinWords=5', tsquery]
+    if kind:
+        sql += ' AND d.kind = %s'
+        params.append(kind)
+    if visible is not None:
+        condition, condition_params = _visible_sql(visible)
+        sql += condition
+        params += condition_params
+    sql += ' ORDER BY rank DESC LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_fallback(words, kind, limit, visible):
+    documents = SearchDocument.objects.all()
+    for word in words:
+        documents = documents.filter(Q(title__icontains=word) | Q(body__icontains=word))
+    if kind:
+        documents = documents.filter(kind=kind)
+    if visible is not None:
+        allowed = Q(pk__in=[])
+        for source, queryset in visible.items():
+            allowed |= Q(kind=source) if queryset is None else Q(kind=source, object_id__in=queryset)
+        documents = documents.filter(allowed)
+    rows = documents.order_by('-updated_at').values_list('kind', 'object_id', 'patient_id', 'title', 'body')
+    return [(*row[:4], row[4][:200], 0.0) for row in rows[:limit]]
+
+
+BACKENDS = {
+    'sqlite': _search_sqlite,
+    'postgresql': _search_postgresql,
+}
+
+
+def search(query, kind=None, limit=DEFAULT_LIMIT, user=None):
+    """
+    Best matches for ``query`` as a list of :class:`SearchHit`, limited to
+    what ``user`` may see when given.
+    """
+    words = terms(query)
+    visible = _visible(user, kind)
+    if not words or visible == {}:
+        return []
+    backend = BACKENDS.get(connection.vendor, _search_fallback)
+    rows = backend(words, kind, max(1, min(limit, MAX_LIMIT)), visible)
+    return [
+        SearchHit(hit_kind, object_id, patient_id, title, _highlight(snippet or ''), rank)
+        for hit_kind, object_id, patient_id, title, snippet, rank in rows
+    ]
@@ -0,0 +1,315 @@
+"""
+Signal receivers that keep derived data in step with the core tables.
+
+Connected from ``SamirhospitalConfig.ready()``.
+"""
+from functools import partial
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import Signal
+
+from . import caching, events, principal, reports, rollups, search, stats
+from .models import Appointment, CustomUser, DoctorSchedule, LabTest, Patient
+from .slots import slot_index
+
+# Sent with ``sender=<model>`` and ``instances=<list>`` after a bulk_create,
+# which bypasses post_save. Everything that listens to post_save for derived
+# data must listen to this as well.
+records_bulk_created = Signal()
+
+# Sent with ``sender=<model>``, ``instances=<list>`` and ``fields=<names>``
+# after a bulk_update, which bypasses post_save too.  The batch API sends it
+# only for models whose dashboard counters do not depend on the row values
+# (see ``api.RESOURCES``), so the counters do not listen to it.
+records_bulk_updated = Signal()
+
+
+# ---------------------------------------------------------------------------
+# Dashboard counters
+# ---------------------------------------------------------------------------
+
+def remember_previous(sender, instance, raw=False, **kwargs):
+    """Stash the stored values of tracked fields before an update."""
+    instance._stats_previous = None
+    if instance.pk and not raw:
+        values = sender.objects.filter(pk=instance.pk).values(*stats.TRACKED_FIELDS[sender]).first()
+        if values is not None:
+            instance._stats_previous = sender(**values)
+
+
+def update_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if created:
+        deltas = stats.instance_deltas(instance)
+    elif previous is not None:
+        deltas = stats.merge_deltas(
+            stats.instance_deltas(instance), stats.instance_deltas(previous, -1)
+        )
+    else:
+        return
+    stats.adjust_counters(deltas)
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    stats.adjust_counters(stats.instance_deltas(instance, -1))
+
+
+def update_counters_on_bulk_create(sender, instances, **kwargs):
+    stats.adjust_counters(stats.merge_deltas(*map(stats.instance_deltas, instances)))
+
+
+for model in stats.COUNT_COUNTERS:
+    if model in stats.TRACKED_FIELDS:
+        pre_save.connect(remember_previous, sender=model, dispatch_uid=f'stats-pre-{model.__name__}')
+    post_save.connect(update_counters_on_save, sender=model, dispatch_uid=f'stats-save-{model.__name__}')
+    post_delete.connect(update_counters_on_delete, sender=model, dispatch_uid=f'stats-delete-{model.__name__}')
+    records_bulk_created.connect(update_counters_on_bulk_create, sender=model, dispatch_uid=f'stats-bulk-{model.__name__}')
+
+
+# ---------------------------------------------------------------------------
+# Appointment slot index
+# ---------------------------------------------------------------------------
+
+def update_slot_index_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created and instance.start_time and instance.status != 'cancelled':
+        transaction.on_commit(partial(
+            slot_index.add_booking, instance.doctor_id, instance.appointment_date,
+            instance.start_time, instance.end_time or instance.start_time,
+        ))
+    else:
+        transaction.on_commit(partial(slot_index.invalidate, instance.doctor_id))
+
+
+def invalidate_slot_index(sender, instance, **kwargs):
+    transaction.on_commit(partial(slot_index.invalidate, instance.doctor_id))
+
+
+post_save.connect(update_slot_index_on_save, sender=Appointment, dispatch_uid='slots-save-appointment')
+post_delete.connect(invalidate_slot_index, sender=Appointment, dispatch_uid='slots-delete-appointment')
+post_save.connect(invalidate_slot_index, sender=DoctorSchedule, dispatch_uid='slots-save-schedule')
+post_delete.connect(invalidate_slot_index, sender=DoctorSchedule, dispatch_uid='slots-delete-schedule')
+
+
+def invalidate_slot_index_on_bulk_create(sender, instances, **kwargs):
+    for doctor_id in {instance.doctor_id for instance in instances}:
+        transaction.on_commit(partial(slot_index.invalidate, doctor_id))
+
+
+records_bulk_created.connect(invalidate_slot_index_on_bulk_create, sender=Appointment, dispatch_uid='slots-bulk-appointment')
+
+
+# ---------------------------------------------------------------------------
+# Full-text search documents
+# ---------------------------------------------------------------------------
+
+# Saves touching only these user fields leave the search text unchanged.
+SEARCHED_USER_FIELDS = {'first_name', 'last_name', 'username'}
+# Lab test fields that feed its search document.
+SEARCHED_LABTEST_FIELDS = {'test_name', 'result', 'patient', 'patient_id'}
+
+
+def index_patient_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_patient(instance)
+
+
+def index_labtest_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_labtest(instance)
+
+
+def remove_labtest_document(sender, instance, **kwargs):
+    search.remove_document('labtest', instance.pk)
+
+
+def reindex_patient_on_user_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.role != 'patient':
+        return
+    if update_fields is not None and not SEARCHED_USER_FIELDS & set(update_fields):
+        return
+    patient = Patient.objects.filter(user=instance).first()
+    if patient is not None:
+        search.reindex_patient(patient)
+
+
+def index_bulk_created_patients(sender, instances, **kwargs):
+    search.index_documents([search.patient_document(patient) for patient in instances])
+
+
+def index_bulk_created_labtests(sender, instances, **kwargs):
+    # Reloaded with the patient names the titles need, in one query.
+    labtests = LabTest.objects.select_related('patient__user').filter(pk__in=[labtest.pk for labtest in instances])
+    search.index_documents([search.labtest_document(labtest) for labtest in labtests])
+
+
+def index_bulk_updated_labtests(sender, instances, fields, **kwargs):
+    if SEARCHED_LABTEST_FIELDS & set(fields):
+        index_bulk_created_labtests(sender, instances)
+
+
+post_save.connect(index_patient_on_save, sender=Patient, dispatch_uid='search-save-patient')
+post_save.connect(index_labtest_on_save, sender=LabTest, dispatch_uid='search-save-labtest')
+post_delete.connect(remove_labtest_document, sender=LabTest, dispatch_uid='search-delete-labtest')
+post_save.connect(reindex_patient_on_user_save, sender=CustomUser, dispatch_uid='search-save-user')
+records_bulk_created.connect(index_bulk_created_patients, sender=Patient, dispatch_uid='search-bulk-patient')
+records_bulk_created.connect(index_bulk_created_labtests, sender=LabTest, dispatch_uid='search-bulk-labtest')
+records_bulk_updated.connect(index_bulk_updated_labtests, sender=LabTest, dispatch_uid='search-bulk-update-labtest')
+
+
+# ---------------------------------------------------------------------------
+# Lab report blob reference counts
+# ---------------------------------------------------------------------------
+
+_UNKNOWN = object()
+
+
+def _report_name(instance):
+    value = instance.__dict__.get('report_file', _UNKNOWN)
+    return getattr(value, 'name', value) or None
+
+
+def remember_report_file(sender, instance, **kwargs):
+    instance._loaded_report_file = _report_name(instance)
+
+
+def count_report_references_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_loaded_report_file', _UNKNOWN)
+    current = _report_name(instance)
+    if previous is _UNKNOWN or current is _UNKNOWN or previous == current:
+        return
+    if current:
+        reports.retain(current)
+    if previous:
+        reports.release(previous)
+    instance._loaded_report_file = current
+
+
+def release_report_on_delete(sender, instance, **kwargs):
+    name = _report_name(instance)
+    if name and name is not _UNKNOWN:
+        reports.release(name)
+
+
+def retain_bulk_created_reports(sender, instances, **kwargs):
+    for instance in instances:
+        name = _report_name(instance)
+        if name and name is not _UNKNOWN:
+            reports.retain(name)
+
+
+post_init.connect(remember_report_file, sender=LabTest, dispatch_uid='blobs-init-labtest')
+post_save.connect(count_report_references_on_save, sender=LabTest, dispatch_uid='blobs-save-labtest')
+post_delete.connect(release_report_on_delete, sender=LabTest, dispatch_uid='blobs-delete-labtest')
+records_bulk_created.connect(retain_bulk_created_reports, sender=LabTest, dispatch_uid='blobs-bulk-labtest')
+
+
+# ---------------------------------------------------------------------------
+# Reporting rollups
+# ---------------------------------------------------------------------------
+
+def remember_rollup_day(sender, instance, **kwargs):
+    instance._rollup_day = rollups.source_day(sender, instance)
+
+
+def refresh_rollups_on_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Also the day the row was loaded with, in case it moved (a rescheduled
+    # appointment, a back-dated payment).
+    day = rollups.source_day(sender, instance)
+    rollups.schedule_refresh(sender, {day, getattr(instance, '_rollup_day', None)})
+    instance._rollup_day = day
+
+
+def refresh_rollups_on_bulk_create(sender, instances, **kwargs):
+    rollups.schedule_refresh(sender, {rollups.source_day(sender, instance) for instance in instances})
+
+
+def refresh_rollups_on_bulk_update(sender, instances, **kwargs):
+    days = {rollups.source_day(sender, instance) for instance in instances}
+    days.update(getattr(instance, '_rollup_day', None) for instance in instances)
+    rollups.schedule_refresh(sender, days)
+
+
+for model in rollups.SOURCE_KINDS:
+    uid = f'rollups-{model.__name__}'
+    post_init.connect(remember_rollup_day, sender=model, dispatch_uid=uid + '-init')
+    post_save.connect(refresh_rollups_on_change, sender=model, dispatch_uid=uid + '-save')
+    post_delete.connect(refresh_rollups_on_change, sender=model, dispatch_uid=uid + '-delete')
+    records_bulk_created.connect(refresh_rollups_on_bulk_create, sender=model, dispatch_uid=uid + '-bulk')
+    records_bulk_updated.connect(refresh_rollups_on_bulk_update, sender=model, dispatch_uid=uid + '-bulk-update')
+
+
+# ---------------------------------------------------------------------------
+# Cached users and principals
+# ---------------------------------------------------------------------------
+
+def _user_id(sender, instance):
+    return instance.pk if sender is CustomUser else instance.user_id
+
+
+def forget_principal(sender, instance, **kwargs):
+    principal.forget(_user_id(sender, instance))
+
+
+def forget_bulk_created_principals(sender, instances, **kwargs):
+    for instance in instances:
+        principal.forget(_user_id(sender, instance))
+
+
+for model in (CustomUser, *principal.PROFILES.values()):
+    uid = f'principal-{model.__name__}'
+    post_save.connect(forget_principal, sender=model, dispatch_uid=uid + '-save')
+    post_delete.connect(forget_principal, sender=model, dispatch_uid=uid + '-delete')
+    records_bulk_created.connect(forget_bulk_created_principals, sender=model, dispatch_uid=uid + '-bulk')
+
+
+# ---------------------------------------------------------------------------
+# Live updates
+# ---------------------------------------------------------------------------
+
+def publish_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        events.publish_on_commit(STREAM_KINDS[sender], [instance])
+
+
+def publish_deleted(sender, instance, **kwargs):
+    events.publish_on_commit(STREAM_KINDS[sender], [instance], action='deleted')
+
+
+def publish_bulk(sender, instances, **kwargs):
+    events.publish_on_commit(STREAM_KINDS[sender], instances)
+
+
+STREAM_KINDS = {model: kind for kind, (model, _) in events.STREAMS.items()}
+
+for model in STREAM_KINDS:
+    uid = f'events-{model.__name__}'
+    post_save.connect(publish_saved, sender=model, dispatch_uid=uid + '-save')
+    post_delete.connect(publish_deleted, sender=model, dispatch_uid=uid + '-delete')
+    records_bulk_created.connect(publish_bulk, sender=model, dispatch_uid=uid + '-bulk')
+    records_bulk_updated.connect(publish_bulk, sender=model, dispatch_uid=uid + '-bulk-update')
+
+
+# ---------------------------------------------------------------------------
+# Cache versions
+# ---------------------------------------------------------------------------
+
+def bump_cache_version(sender, **kwargs):
+    caching.bump_version(sender)
+
+
+for model in apps.get_app_config('SamirHospital').get_models():
+    uid = f'cache-{model.__name__}'
+    post_save.connect(bump_cache_version, sender=model, dispatch_uid=uid + '-save')
+    post_delete.connect(bump_cache_version, sender=model, dispatch_uid=uid + '-delete')
+    records_bulk_created.connect(bump_cache_version, sender=model, dispatch_uid=uid + '-bulk')
+    records_bulk_updated.connect(bump_cache_version, sender=model, dispatch_uid=uid + '-bulk-update')
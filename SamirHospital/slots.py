@@ -0,0 +1,198 @@
+"""
+Appointment slot engine.
+
+Doctors work in fixed-length slots defined by ``DoctorSchedule`` (or
+:data:`DEFAULT_SCHEDULE` when a doctor has none).  Availability is answered
+from :data:`slot_index`, an in-process per-doctor index of booked intervals
+that is loaded with one indexed query per doctor and then kept current by the
+receivers in ``signals.py``.  Booking never trusts the index: the
+``unique_doctor_slot`` constraint on ``Appointment`` is what makes two
+concurrent requests for the same slot impossible.
+"""
+import bisect
+import datetime
+import threading
+import time
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment, Doctor, DoctorSchedule
+
+# (start, end, slot minutes) for Monday..Friday when a doctor has no schedule.
+DEFAULT_HOURS = (datetime.time(9), datetime.time(17), 30)
+DEFAULT_SCHEDULE = {weekday: DEFAULT_HOURS for weekday in range(5)}
+
+# Seconds before a doctor's bookings are reloaded, so that bookings made by
+# other worker processes become visible.
+INDEX_TTL = 60
+
+# How far ahead next_free_slot() looks.
+SEARCH_HORIZON_DAYS = 120
+
+Slot = namedtuple('Slot', 'doctor_id date start end')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def _add_minutes(value, minutes):
+    moment = datetime.datetime.combine(datetime.date.min, value) + datetime.timedelta(minutes=minutes)
+    return moment.time()
+
+
+def slot_label(start, end):
+    return f"{start:%H:%M}-{end:%H:%M}"
+
+
+class _DoctorEntry:
+    """Weekly hours and sorted booked intervals of one doctor."""
+
+    def __init__(self, schedule, bookings):
+        self.schedule = schedule
+        self.bookings = bookings  # {date: sorted [(start, end), ...]}
+        self.loaded_at = time.monotonic()
+
+    def candidate_starts(self, day):
+        hours = self.schedule.get(day.weekday())
+        if hours is None:
+            return
+        start, end, minutes = hours
+        current = start
+        while True:
+            finish = _add_minutes(current, minutes)
+            if finish > end or finish <= current:
+                return
+            yield current, finish
+            current = finish
+
+    def is_free(self, day, start, end):
+        booked = self.bookings.get(day, ())
+        i = bisect.bisect_left(booked, (end,))
+        # Only the booking starting just before ``end`` can overlap.
+        return i == 0 or booked[i - 1][1] <= start
+
+    def open_slots(self, doctor_id, day, not_before=None):
+        for start, end in self.candidate_starts(day):
+            if not_before is not None and start < not_before:
+                continue
+            if self.is_free(day, start, end):
+                yield Slot(doctor_id, day, start, end)
+
+
+class SlotIndex:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _load(self, doctor_id):
+        schedule = {
+            row.weekday: (row.start_time, row.end_time, row.slot_minutes)
+            for row in DoctorSchedule.objects.filter(doctor_id=doctor_id)
+        } or DEFAULT_SCHEDULE
+        bookings = {}
+        rows = (
+            Appointment.objects
+            .filter(doctor_id=doctor_id, appointment_date__gte=timezone.localdate(),
+                    start_time__isnull=False)
+            .exclude(status='cancelled')
+            .values_list('appointment_date', 'start_time', 'end_time')
+        )
+        for day, start, end in rows:
+            bookings.setdefault(day, []).append((start, end or start))
+        for intervals in bookings.values():
+            intervals.sort()
+        return _DoctorEntry(schedule, bookings)
+
+    def entry(self, doctor_id):
+        entry = self._entries.get(doctor_id)
+        if entry is None or time.monotonic() - entry.loaded_at > INDEX_TTL:
+            entry = self._load(doctor_id)
+            with self._lock:
+                self._entries[doctor_id] = entry
+        return entry
+
+    def add_booking(self, doctor_id, day, start, end):
+        with self._lock:
+            entry = self._entries.get(doctor_id)
+            if entry is not None:
+                bisect.insort(entry.bookings.setdefault(day, []), (start, end))
+
+    def invalidate(self, doctor_id=None):
+        with self._lock:
+            if doctor_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(doctor_id, None)
+
+
+slot_index = SlotIndex()
+
+
+def _earliest_start(day):
+    now = timezone.localtime()
+    return now.time() if day == now.date() else None
+
+
+def doctors_in_department(department_id):
+    return list(Doctor.objects.filter(department_id=department_id).values_list('pk', flat=True))
+
+
+def available_slots(doctor_ids, start_date, end_date, limit=None):
+    """Open slots of ``doctor_ids`` between two dates, earliest first."""
+    start_date = max(start_date, timezone.localdate())
+    slots = []
+    day = start_date
+    while day <= end_date:
+        for doctor_id in doctor_ids:
+            entry = slot_index.entry(doctor_id)
+            slots.extend(entry.open_slots(doctor_id, day, _earliest_start(day)))
+        if limit is not None and len(slots) >= limit:
+            break
+        day += datetime.timedelta(days=1)
+    slots.sort(key=lambda slot: (slot.date, slot.start, slot.doctor_id))
+    return slots[:limit] if limit is not None else slots
+
+
+def next_free_slot(doctor_ids, after=None, horizon_days=SEARCH_HORIZON_DAYS):
+    """Earliest open slot among ``doctor_ids``, or ``None`` within the horizon."""
+    day = max(after or timezone.localdate(), timezone.localdate())
+    last = day + datetime.timedelta(days=horizon_days)
+    entries = [(doctor_id, slot_index.entry(doctor_id)) for doctor_id in doctor_ids]
+    while day <= last:
+        best = None
+        for doctor_id, entry in entries:
+            slot = next(entry.open_slots(doctor_id, day, _earliest_start(day)), None)
+            if slot is not None and (best is None or slot.start < best.start):
+                best = slot
+        if best is not None:
+            return best
+        day += datetime.timedelta(days=1)
+    return None
+
+
+def book_appointment(appointment):
+    """
+    Save an unsaved ``appointment`` into the slot starting at its
+    ``start_time``, or raise :class:`SlotUnavailable`.
+    """
+    entry = slot_index.entry(appointment.doctor_id)
+    day, start = appointment.appointment_date, appointment.start_time
+    slot = next((end for begin, end in entry.candidate_starts(day) if begin == start), None)
+    if slot is None:
+        raise SlotUnavailable("The doctor is not available at that time.")
+    not_before = _earliest_start(day)
+    if day < timezone.localdate() or (not_before is not None and start < not_before):
+        raise SlotUnavailable("That slot is in the past.")
+
+    appointment.end_time = slot
+    appointment.time_slot = slot_label(start, slot)
+    appointment.status = 'scheduled'
+    try:
+        with transaction.atomic():
+            appointment.save()
+    except IntegrityError:
+        raise SlotUnavailable("That slot has just been booked. Please pick another one.")
+    return appointment
@@ -0,0 +1,167 @@
+"""
+Dashboard statistics service.
+
+The admin dashboard reads every figure from the ``DashboardCounter`` table in
+a single query.  The counters are adjusted incrementally by the receivers in
+``signals.py``; :func:`rebuild_counters` recomputes all of them from the live
+tables in one round trip (one ``SELECT`` of scalar sub-queries).
+"""
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Case, F, When, DecimalField
+
+from .caching import acached, bump_version, cached
+from .models import (
+    Department, Doctor, Patient, Appointment, LabTest,
+    Medicine, InventoryItem, Billing, DashboardCounter, ArchiveSegment
+)
+
+# counter name -> (model, optional (column, value) filter, summed column or
+# None for a row count)
+COUNTERS = {
+    'department_count': (Department, None, None),
+    'doctor_count': (Doctor, None, None),
+    'patient_count': (Patient, None, None),
+    'appointment_count': (Appointment, None, None),
+    'scheduled_appointments': (Appointment, ('status', 'scheduled'), None),
+    'completed_appointments': (Appointment, ('status', 'completed'), None),
+    'cancelled_appointments': (Appointment, ('status', 'cancelled'), None),
+    'labtest_count': (LabTest, None, None),
+    'medicine_count': (Medicine, None, None),
+    'inventory_count': (InventoryItem, None, None),
+    'bill_count': (Billing, None, None),
+    'revenue_total': (Billing, None, 'total'),
+    'revenue_paid': (Billing, ('payment_status', 'paid'), 'total'),
+    'revenue_pending': (Billing, ('payment_status', 'pending'), 'total'),
+}
+
+# Models whose plain row count is a counter of its own.
+COUNT_COUNTERS = {
+    Department: 'department_count',
+    Doctor: 'doctor_count',
+    Patient: 'patient_count',
+    Appointment: 'appointment_count',
+    LabTest: 'labtest_count',
+    Medicine: 'medicine_count',
+    InventoryItem: 'inventory_count',
+    Billing: 'bill_count',
+}
+
+# Counters that also include rows moved out by ``archive_records``:
+# counter name -> archive kind.  Only completed appointments are archived.
+ARCHIVED_COUNTERS = {
+    'appointment_count': 'appointments',
+    'completed_appointments': 'appointments',
+}
+
+CENTS = Decimal('0.01')
+
+
+def _as_decimal(value):
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def compute_counters():
+    """Compute every counter from the live tables (and archive catalogue) in one query."""
+    qn = connection.ops.quote_name
+    columns, params = [], []
+    for name, (model, where, column) in COUNTERS.items():
+        aggregate = 'SUM(%s)' % qn(column) if column else 'COUNT(*)'
+        sql = 'SELECT COALESCE(%s, 0) FROM %s' % (aggregate, qn(model._meta.db_table))
+        if where:
+            sql += ' WHERE %s = %%s' % qn(where[0])
+            params.append(where[1])
+        sql = '(%s)' % sql
+        if name in ARCHIVED_COUNTERS:
+            sql += ' + (SELECT COALESCE(SUM(%s), 0) FROM %s WHERE %s = %%s)' % (
+                qn('row_count'), qn(ArchiveSegment._meta.db_table), qn('kind'))
+            params.append(ARCHIVED_COUNTERS[name])
+        columns.append(sql)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columns), params)
+        row = cursor.fetchone()
+    return {name: _as_decimal(value) for name, value in zip(COUNTERS, row)}
+
+
+@transaction.atomic
+def rebuild_counters():
+    values = compute_counters()
+    DashboardCounter.objects.bulk_create(
+        [DashboardCounter(name=name, value=value) for name, value in values.items()],
+        update_conflicts=True, unique_fields=['name'], update_fields=['value'],
+    )
+    bump_version(DashboardCounter)
+    return values
+
+
+def adjust_counters(deltas):
+    """Apply ``{name: delta}`` to the stored counters in a single ``UPDATE``."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    DashboardCounter.objects.filter(name__in=deltas).update(
+        value=F('value') + Case(
+            *[When(name=name, then=_as_decimal(delta)) for name, delta in deltas.items()],
+            output_field=DecimalField(max_digits=16, decimal_places=2),
+        )
+    )
+    bump_version(DashboardCounter)
+
+
+def get_counters():
+    """All dashboard figures; counts come back as ``int``, money as ``Decimal``."""
+    return cached('dashboard', [DashboardCounter], _load_counters)
+
+
+async def aget_counters():
+    """Async :func:`get_counters`."""
+    return await acached('dashboard', [DashboardCounter], _aload_counters)
+
+
+def _typed(values):
+    return {
+        name: value if name.startswith('revenue_') else int(value)
+        for name, value in values.items()
+    }
+
+
+def _load_counters():
+    values = dict(DashboardCounter.objects.values_list('name', 'value'))
+    if set(values) != set(COUNTERS):
+        values = rebuild_counters()
+    return _typed(values)
+
+
+async def _aload_counters():
+    values = {name: value async for name, value in DashboardCounter.objects.values_list('name', 'value')}
+    if set(values) != set(COUNTERS):
+        values = await sync_to_async(rebuild_counters)()
+    return _typed(values)
+
+
+# Fields whose old value must be known to adjust counters on update.
+TRACKED_FIELDS = {
+    Appointment: ('status',),
+    Billing: ('total', 'payment_status'),
+}
+
+
+def instance_deltas(instance, sign=1):
+    """Counter deltas contributed by one row (``sign=-1`` to remove it)."""
+    deltas = {COUNT_COUNTERS[type(instance)]: sign}
+    if isinstance(instance, Appointment):
+        deltas[f'{instance.status}_appointments'] = sign
+    elif isinstance(instance, Billing):
+        deltas['revenue_total'] = sign * _as_decimal(instance.total)
+        deltas[f'revenue_{instance.payment_status}'] = sign * _as_decimal(instance.total)
+    return {name: delta for name, delta in deltas.items() if name in COUNTERS}
+
+
+def merge_deltas(*parts):
+    merged = {}
+    for deltas in parts:
+        for name, delta in deltas.items():
+            merged[name] = merged.get(name, 0) + delta
+    return merged
@@ -0,0 +1,112 @@
+"""
+Expiry and low-stock watch for medicines and inventory.
+
+:func:`check_stock` runs one query per watched model.  The query selects
+every row that has expired, expires within the horizon, or has fallen to
+its ``reorder_level``.  It is a ``UNION`` of two halves, each answered
+from its own index:
+
+* the expiry date index, read as a range scan, and
+* a partial index over just the low-stock rows (``stock <=
+  reorder_level``), which stays as small as the problem it tracks.
+
+A plain ``OR`` of the two conditions would make SQLite scan the table.
+
+Findings are upserted into :class:`StockAlert`, one row per item and
+reason, so repeated runs refresh ``last_seen`` instead of piling up
+duplicates.  Open alerts that a run no longer finds are resolved.  The
+admin page lists open alerts from a partial index over unresolved rows.
+"""
+import datetime
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump_version
+from .models import InventoryItem, Medicine, StockAlert
+
+DEFAULT_HORIZON_DAYS = 30
+
+# item type -> (model, quantity column)
+WATCHED = {
+    'medicine': (Medicine, 'stock'),
+    'inventory': (InventoryItem, 'quantity'),
+}
+
+
+@dataclass
+class StockReport:
+    open: int = 0
+    raised: int = 0
+    resolved: int = 0
+
+    def __str__(self):
+        return f'{self.open} open stock alerts ({self.raised} new, {self.resolved} resolved).'
+
+
+def watch_queryset(model, quantity_field, horizon):
+    """
+    ``(pk, name, expiry_date, quantity, reorder_level)`` of every ``model``
+    row expiring by ``horizon`` or at or below its reorder level, as one
+    ``UNION`` query.
+    """
+    rows = model.objects.values_list('pk', 'name', 'expiry_date', quantity_field, 'reorder_level')
+    expiring = rows.filter(expiry_date__lte=horizon)
+    low = rows.filter(**{f'{quantity_field}__lte': F('reorder_level')})
+    return expiring.union(low)
+
+
+def findings(today, days=DEFAULT_HORIZON_DAYS):
+    """Unsaved :class:`StockAlert` objects for everything that needs attention."""
+    horizon = today + datetime.timedelta(days=days)
+    alerts = []
+    for item_type, (model, quantity_field) in WATCHED.items():
+        for pk, name, expiry_date, quantity, reorder_level in watch_queryset(model, quantity_field, horizon):
+            found = dict(item_type=item_type, item_id=pk, item_name=name[:100])
+            # Medicines are sold up to the day before they expire (see pharmacy.py).
+            if expiry_date is not None and expiry_date <= today:
+                alerts.append(StockAlert(reason='expired', due_date=expiry_date,
+                                         detail=f'Expired on {expiry_date:%Y-%m-%d}', **found))
+            elif expiry_date is not None and expiry_date <= horizon:
+                alerts.append(StockAlert(reason='expiring', due_date=expiry_date,
+                                         detail=f'Expires on {expiry_date:%Y-%m-%d}', **found))
+            if quantity <= reorder_level:
+                alerts.append(StockAlert(reason='low_stock', due_date=today,
+                                         detail=f'{quantity} left, reorder at {reorder_level}', **found))
+    return alerts
+
+
+def check_stock(days=DEFAULT_HORIZON_DAYS, today=None):
+    """Raise, refresh and resolve stock alerts; returns a :class:`StockReport`."""
+    today = today or timezone.localdate()
+    now = timezone.now()
+    alerts = findings(today, days)
+    for alert in alerts:
+        alert.first_seen = alert.last_seen = now
+    with transaction.atomic():
+        open_before = set(
+            StockAlert.objects.filter(resolved_at__isnull=True)
+            .values_list('item_type', 'item_id', 'reason')
+        )
+        # An alert seen before keeps its first_seen; a resolved one reopens.
+        # A low-stock alert still open also keeps its due_date, the day the
+        # stock ran low.
+        refreshed, still_low = [], []
+        for alert in alerts:
+            key = (alert.item_type, alert.item_id, alert.reason)
+            (still_low if alert.reason == 'low_stock' and key in open_before else refreshed).append(alert)
+        fields = ['item_name', 'detail', 'due_date', 'last_seen', 'resolved_at']
+        for group, update_fields in (
+            (refreshed, fields),
+            (still_low, [field for field in fields if field != 'due_date']),
+        ):
+            StockAlert.objects.bulk_create(
+                group, update_conflicts=True, unique_fields=['item_type', 'item_id', 'reason'],
+                update_fields=update_fields,
+            )
+        resolved = StockAlert.objects.filter(resolved_at__isnull=True, last_seen__lt=now).update(resolved_at=now)
+        bump_version(StockAlert)
+    found = {(alert.item_type, alert.item_id, alert.reason) for alert in alerts}
+    return StockReport(open=len(found), raised=len(found - open_before), resolved=resolved)
@@ -0,0 +1,71 @@
+"""
+Content-addressed, deduplicated storage for lab report files.
+
+:class:`ContentAddressedStorage` hashes an upload while copying it to disk
+and files it under its SHA-256 digest::
+
+    lab_reports/blobs/3f/3f2a...9c.pdf
+
+The same report uploaded twice is stored once.  Reference counting and
+garbage collection of blobs live in ``reports.py``.
+
+Names stored before this backend existed (``lab_reports/<file>``) still open
+normally.  They are simply not reference-counted.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'lab_reports/blobs'
+CHUNK_SIZE = 64 * 1024
+
+_BLOB_NAME = re.compile(r'^%s/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.[\w]+)?$' % re.escape(BLOB_DIR))
+
+
+def blob_digest(name):
+    """The SHA-256 of a blob name, or ``None`` for any other file."""
+    match = _BLOB_NAME.match(name or '')
+    return match.group('digest') if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """``FileSystemStorage`` that names every file after its content."""
+
+    def get_available_name(self, name, max_length=None):
+        # The real name is only known once the content is hashed in _save().
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()[:10]
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    temp.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = f'{BLOB_DIR}/{hexdigest[:2]}/{hexdigest}{extension}'
+            path = self.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # Replace even an existing copy (same bytes): the fresh mtime tells
+            # gc_reports the blob is in use again.
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+def report_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,471 @@
+"""
+Reproducible synthetic hospital data for load tests and benchmarks.
+
+:class:`SyntheticHospital` fills every table from a seeded random generator.
+The same ``seed`` and ``today`` always produce the same rows.  Rows are
+written with ``bulk_create`` in batches, one transaction per batch.  Derived
+data (dashboard counters, the search index, cache versions and the slot
+index) is rebuilt once at the end rather than per batch.
+
+The distributions aim to look like a real hospital:
+
+* doctors per department follow a Zipf curve, so a few departments are big
+* appointments fill the weekday slots of each doctor's schedule, and popular
+  doctors are booked more; no doctor is double-booked
+* past appointments are mostly completed, future ones scheduled
+* most completed appointments are billed, some get a lab test or a pharmacy
+  sale, and a few patients visit far more often than the rest
+* entry logs vary per day around the requested mean, with quieter weekends
+"""
+import datetime
+import math
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups, search
+from .caching import bump_version
+from .models import (
+    CustomUser, Department, Doctor, DoctorSchedule, Patient, Appointment, LabTest,
+    Medicine, MedicineSale, InventoryItem, SecurityStaff, EntryLog, Billing,
+)
+from .slots import DEFAULT_SCHEDULE, slot_index, slot_label
+from .stats import rebuild_counters
+
+DEFAULT_BATCH_SIZE = 5000
+CENTS = Decimal('0.01')
+
+DEFAULT_COUNTS = {
+    'departments': 12,
+    'doctors': 120,
+    'patients': 5000,
+    'appointments': 50000,
+    'medicines': 400,
+    'inventory': 300,
+    'guards': 20,
+}
+
+# Share of a doctor's slots that are booked, before popularity weighting.
+SLOT_FILL = 0.6
+# Weekdays of already-booked future appointments, at most a tenth of the range.
+FUTURE_WEEKDAYS = 20
+BILLED_SHARE = 0.9
+LAB_TEST_SHARE = 0.3
+PHARMACY_SHARE = 0.4
+VAT_RATE = Decimal('0.13')
+
+FIRST_NAMES = [
+    'Aarav', 'Anjali', 'Bikash', 'Binita', 'Deepak', 'Gita', 'Hari', 'Kabita', 'Kiran', 'Manisha',
+    'Nabin', 'Nisha', 'Prakash', 'Priya', 'Rajesh', 'Rita', 'Sagar', 'Sarita', 'Suman', 'Sunita',
+]
+LAST_NAMES = [
+    'Adhikari', 'Bhandari', 'Gurung', 'KC', 'Karki', 'Khadka', 'Lama', 'Magar', 'Maharjan',
+    'Pandey', 'Poudel', 'Rai', 'Shah', 'Sharma', 'Shrestha', 'Tamang', 'Thapa', 'Yadav',
+]
+CITIES = ['Kathmandu', 'Lalitpur', 'Bhaktapur', 'Pokhara', 'Biratnagar', 'Chitwan', 'Butwal', 'Dharan']
+DEPARTMENTS = [
+    'General Medicine', 'Cardiology', 'Orthopaedics', 'Paediatrics', 'Gynaecology', 'Dermatology',
+    'Neurology', 'ENT', 'Ophthalmology', 'Psychiatry', 'Nephrology', 'Oncology', 'Urology',
+    'Gastroenterology', 'Pulmonology', 'Endocrinology',
+]
+# (value, weight)
+BLOOD_GROUPS = [('O+', 37), ('A+', 28), ('B+', 22), ('AB+', 6), ('O-', 3), ('A-', 2), ('B-', 1), ('AB-', 1)]
+REASONS = [
+    ('Follow-up visit', 30), ('Fever and cough', 15), ('Routine checkup', 15), ('Chest pain', 6),
+    ('Back pain', 8), ('Headache', 8), ('Skin rash', 6), ('Diabetes review', 7), ('Hypertension review', 5),
+]
+LAB_TESTS = [
+    ('CBC', 30), ('Lipid profile', 12), ('HbA1c', 10), ('Liver function test', 10),
+    ('Kidney function test', 10), ('Urine routine', 12), ('Thyroid profile', 8), ('X-ray chest', 8),
+]
+LAB_RESULTS = ['Within normal limits.', 'Mildly raised; repeat in 3 months.', 'Abnormal; refer to specialist.']
+MEDICINES = [
+    'Paracetamol 500mg', 'Amoxicillin 250mg', 'Metformin 500mg', 'Amlodipine 5mg', 'Omeprazole 20mg',
+    'Cetirizine 10mg', 'Azithromycin 500mg', 'Ibuprofen 400mg', 'Atorvastatin 10mg', 'Salbutamol inhaler',
+]
+MANUFACTURERS = ['Deurali-Janta', 'Lomus', 'Asian', 'Nepal Pharma', 'Cipla', 'Sun Pharma']
+INVENTORY = [
+    ('Gloves (box)', 'Disposable', True), ('Syringe 5ml', 'Disposable', True), ('Gauze roll', 'Disposable', True),
+    ('Bed sheet', 'Linen', False), ('Glucose strips', 'Reagent', True), ('Wheelchair', 'Equipment', False),
+    ('IV set', 'Disposable', True), ('Thermometer', 'Equipment', False),
+]
+PAYMENT_METHODS = [('cash', 45), ('esewa', 25), ('fonepay', 20), ('card', 10)]
+ENTRY_PURPOSES = [
+    ('Visiting patient', 45), ('Appointment', 30), ('Pharmacy', 10), ('Delivery', 8),
+    ('Maintenance', 4), ('Emergency', 3),
+]
+GATES = ['Main gate', 'Emergency gate', 'OPD gate', 'Service gate']
+
+
+def _weighted(pairs):
+    values, weights = zip(*pairs)
+    return list(values), list(weights)
+
+
+def _money(value):
+    return Decimal(value).quantize(CENTS)
+
+
+@contextmanager
+def historical_dates():
+    """Let bulk_create keep the generated dates of ``auto_now_add`` fields."""
+    fields = [
+        LabTest._meta.get_field('test_date'),
+        MedicineSale._meta.get_field('sale_date'),
+        InventoryItem._meta.get_field('added_date'),
+        EntryLog._meta.get_field('time_in'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class SyntheticHospital:
+    """
+    One seeding run.  Every username starts with ``prefix``, so a run can be
+    spotted, and a second run with a different prefix adds to the first.
+    """
+
+    def __init__(self, seed=42, prefix='synth', today=None, batch_size=DEFAULT_BATCH_SIZE,
+                 password=None, entries_per_day=150, entry_days=365, log=None):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.today = today or timezone.localdate()
+        self.batch_size = batch_size
+        self.password = make_password(password)  # hashed once, shared by every account
+        self.entries_per_day = entries_per_day
+        self.entry_days = entry_days
+        self.log = log or (lambda message: None)
+        self.created = {}
+        self.fees = {}
+
+    def already_seeded(self):
+        return CustomUser.objects.filter(username__startswith=f'{self.prefix}_').exists()
+
+    def run(self, **counts):
+        counts = {**DEFAULT_COUNTS, **{name: value for name, value in counts.items() if value is not None}}
+        with historical_dates():
+            self._user('admin', role='admin', first_name='Synthetic', last_name='Admin').save()
+            departments = self.create_departments(counts['departments'])
+            doctors = self.create_doctors(counts['doctors'], departments)
+            patient_ids = self.create_patients(counts['patients'])
+            medicines = self.create_medicines(counts['medicines'])
+            self.create_inventory(counts['inventory'])
+            guard_ids = self.create_guards(counts['guards'])
+            if doctors and patient_ids:
+                self.create_appointments(counts['appointments'], doctors, patient_ids, medicines)
+            if guard_ids:
+                self.create_entry_logs(guard_ids)
+        self.rebuild_derived()
+        return self.created
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+
+    def _timed(self, label, started, count):
+        self.created[label] = self.created.get(label, 0) + count
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.log(f'{label}: {count} rows in {elapsed:.1f}s ({rate:.0f}/s)')
+
+    def _batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def _user(self, username, role, first_name, last_name):
+        return CustomUser(
+            username=f'{self.prefix}_{username}', role=role, password=self.password,
+            first_name=first_name, last_name=last_name,
+        )
+
+    def _moment(self, day, clock):
+        return timezone.make_aware(datetime.datetime.combine(day, clock))
+
+    def _create_people(self, model, label, count, role, build):
+        """bulk_create ``count`` users plus the ``model`` profile ``build(user, n)`` returns for each."""
+        started = time.perf_counter()
+        ids = []
+        for batch in self._batches(range(count)):
+            with transaction.atomic():
+                users = CustomUser.objects.bulk_create([
+                    self._user(f'{label}{n}', role, *self._name()) for n in batch
+                ])
+                profiles = model.objects.bulk_create([build(user, n) for user, n in zip(users, batch)])
+                ids += [profile.pk for profile in profiles]
+        self._timed(str(model._meta.verbose_name_plural), started, count)
+        return ids
+
+    # ------------------------------------------------------------------
+    # Reference data
+    # ------------------------------------------------------------------
+
+    def create_departments(self, count):
+        started = time.perf_counter()
+        names = [DEPARTMENTS[n % len(DEPARTMENTS)] + (f' {n // len(DEPARTMENTS) + 1}' if n >= len(DEPARTMENTS) else '')
+                 for n in range(count)]
+        departments = Department.objects.bulk_create([Department(name=name) for name in names])
+        # Consultation fee per department, used when billing its appointments.
+        self.fees.update({department.pk: self.rng.choice([500, 800, 1000, 1500]) for department in departments})
+        self._timed('departments', started, count)
+        return departments
+
+    def create_doctors(self, count, departments):
+        if not departments:
+            return []
+        # Zipf: the k-th department gets a share proportional to 1/k.
+        weights = [1 / rank for rank in range(1, len(departments) + 1)]
+        assigned = self.rng.choices(departments, weights, k=count)
+
+        def build(user, n):
+            department = assigned[n]
+            return Doctor(
+                user=user, department=department, specialization=department.name,
+                phone=f'98{self.rng.randrange(10 ** 8):08d}', qualification=self.rng.choice(['MBBS', 'MD', 'MS']),
+                experience_years=self.rng.randint(1, 35),
+            )
+
+        ids = self._create_people(Doctor, 'doc', count, 'doctor', build)
+        started = time.perf_counter()
+        for batch in self._batches(ids):
+            DoctorSchedule.objects.bulk_create([
+                DoctorSchedule(doctor_id=doctor_id, weekday=weekday, start_time=start, end_time=end,
+                               slot_minutes=minutes)
+                for doctor_id in batch for weekday, (start, end, minutes) in DEFAULT_SCHEDULE.items()
+            ])
+        self._timed('doctor schedules', started, len(ids) * len(DEFAULT_SCHEDULE))
+        departments_by_doctor = {doctor_id: assigned[n].pk for n, doctor_id in enumerate(ids)}
+        return [(doctor_id, departments_by_doctor[doctor_id]) for doctor_id in ids]
+
+    def create_patients(self, count):
+        blood_groups, blood_weights = _weighted(BLOOD_GROUPS)
+
+        def build(user, n):
+            age = min(95, max(0, int(self.rng.gauss(42, 18))))
+            return Patient(
+                user=user, gender=self.rng.choice(['F', 'M']),
+                date_of_birth=self.today - datetime.timedelta(days=age * 365 + self.rng.randrange(365)),
+                contact=f'97{n:08d}', address=self.rng.choice(CITIES),
+                blood_group=self.rng.choices(blood_groups, blood_weights)[0],
+                medical_history=self.rng.choice(['', '', 'Diabetes', 'Hypertension', 'Asthma', 'Allergic to penicillin']),
+            )
+
+        return self._create_people(Patient, 'pat', count, 'patient', build)
+
+    def create_medicines(self, count):
+        started = time.perf_counter()
+        medicines = []
+        for batch in self._batches(range(count)):
+            medicines += Medicine.objects.bulk_create([
+                Medicine(
+                    name=MEDICINES[n % len(MEDICINES)], manufacturer=self.rng.choice(MANUFACTURERS),
+                    price=_money(self.rng.uniform(5, 500)),
+                    expiry_date=self.today + datetime.timedelta(days=self.rng.randint(-60, 900)),
+                    stock=int(self.rng.expovariate(1 / 200)),
+                )
+                for n in batch
+            ])
+        self._timed('medicines', started, count)
+        return [(medicine.pk, medicine.price) for medicine in medicines]
+
+    def create_inventory(self, count):
+        started = time.perf_counter()
+        for batch in self._batches(range(count)):
+            items = []
+            for n in batch:
+                name, category, expires = INVENTORY[n % len(INVENTORY)]
+                items.append(InventoryItem(
+                    name=name, category=category, quantity=int(self.rng.expovariate(1 / 100)),
+                    added_date=self.today - datetime.timedelta(days=self.rng.randrange(self.entry_days or 1)),
+                    expiry_date=(self.today + datetime.timedelta(days=self.rng.randint(-30, 720))) if expires else None,
+                ))
+            InventoryItem.objects.bulk_create(items)
+        self._timed('inventory items', started, count)
+
+    def create_guards(self, count):
+        shifts = [(datetime.time(6), datetime.time(14)), (datetime.time(14), datetime.time(22))]
+
+        def build(user, n):
+            start, end = shifts[n % len(shifts)]
+            return SecurityStaff(
+                user=user, shift_start=start, shift_end=end, phone=f'96{n:08d}',
+                assigned_gate=GATES[n % len(GATES)],
+            )
+
+        # Guards log in with the nurse role, like the rest of the non-clinical staff.
+        return self._create_people(SecurityStaff, 'guard', count, 'nurse', build)
+
+    # ------------------------------------------------------------------
+    # Appointments and what follows from them
+    # ------------------------------------------------------------------
+
+    def _slot_times(self):
+        start, end, minutes = DEFAULT_SCHEDULE[0]
+        step = datetime.timedelta(minutes=minutes)
+        clock, last = (datetime.datetime.combine(self.today, value) for value in (start, end))
+        times = []
+        while clock + step <= last:
+            times.append((clock.time(), (clock + step).time()))
+            clock += step
+        return times
+
+    def _bookings(self, target, doctors):
+        """
+        Yield ``(doctor_id, department_id, day, start, end)`` for ``target``
+        bookings, oldest first.  Each doctor slot is visited once, so nobody is
+        double-booked; busier doctors fill a bigger share of their slots.
+        """
+        times = self._slot_times()
+        popularity = [self.rng.paretovariate(2.5) for _ in doctors]
+        mean = sum(popularity) / len(popularity)
+        fill = [min(1.0, SLOT_FILL * weight / mean) for weight in popularity]
+        per_weekday = sum(fill) * len(times)
+        weekdays = math.ceil(target / per_weekday)
+        # Walk back from today to the first day of the range.
+        day, remaining = self.today, weekdays - min(FUTURE_WEEKDAYS, weekdays // 10)
+        while remaining > 0:
+            day -= datetime.timedelta(days=1)
+            if day.weekday() in DEFAULT_SCHEDULE:
+                remaining -= 1
+        produced = 0
+        while produced < target:
+            if day.weekday() in DEFAULT_SCHEDULE:
+                for (doctor_id, department_id), chance in zip(doctors, fill):
+                    for start, end in times:
+                        if self.rng.random() < chance:
+                            yield doctor_id, department_id, day, start, end
+                            produced += 1
+                            if produced == target:
+                                return
+            day += datetime.timedelta(days=1)
+
+    def _status(self, day):
+        roll = self.rng.random()
+        if day < self.today:
+            return 'completed' if roll < 0.85 else 'cancelled' if roll < 0.95 else 'scheduled'
+        return 'scheduled' if roll < 0.95 else 'cancelled'
+
+    def create_appointments(self, count, doctors, patient_ids, medicines):
+        reasons, reason_weights = _weighted(REASONS)
+        tests, test_weights = _weighted(LAB_TESTS)
+        methods, method_weights = _weighted(PAYMENT_METHODS)
+        started = time.perf_counter()
+        totals = {'bills': 0, 'lab tests': 0, 'medicine sales': 0}
+        for batch in self._batches(self._bookings(count, doctors)):
+            appointments = [
+                Appointment(
+                    # Squaring skews towards the first patients: a few frequent visitors.
+                    patient_id=patient_ids[int(len(patient_ids) * self.rng.random() ** 2)],
+                    doctor_id=doctor_id, appointment_date=day, start_time=start, end_time=end,
+                    time_slot=slot_label(start, end), status=self._status(day),
+                    reason=self.rng.choices(reasons, reason_weights)[0],
+                )
+                for doctor_id, _, day, start, end in batch
+            ]
+            bills, labtests, sales = [], [], []
+            with transaction.atomic():
+                Appointment.objects.bulk_create(appointments)
+                for appointment, (_, department_id, day, _, end) in zip(appointments, batch):
+                    if appointment.status != 'completed':
+                        continue
+                    paid_at = self._moment(day, end)
+                    if self.rng.random() < BILLED_SHARE:
+                        amount = _money(self.fees[department_id] + 100 * self.rng.randint(0, 5))
+                        tax = _money(amount * VAT_RATE)
+                        discount = Decimal('0.00')
+                        if self.rng.random() < 0.1:
+                            discount = _money(amount * self.rng.choice([Decimal('0.05'), Decimal('0.1'), Decimal('0.2')]))
+                        recent = day >= self.today - datetime.timedelta(days=7)
+                        bills.append(Billing(
+                            patient_id=appointment.patient_id, appointment=appointment,
+                            amount=amount, tax=tax, discount=discount,
+                            # bulk_create skips Billing.save(), which normally computes this.
+                            total=amount + tax - discount,
+                            payment_method=self.rng.choices(methods, method_weights)[0],
+                            payment_status='pending' if recent and self.rng.random() < 0.5 else 'paid',
+                            payment_date=paid_at, description=f'Consultation on {day:%Y-%m-%d}',
+                        ))
+                    if self.rng.random() < LAB_TEST_SHARE:
+                        done = day < self.today - datetime.timedelta(days=2)
+                        labtests.append(LabTest(
+                            patient_id=appointment.patient_id, doctor_id=appointment.doctor_id,
+                            test_name=self.rng.choices(tests, test_weights)[0], test_date=day,
+                            status='completed' if done else 'pending',
+                            result=self.rng.choice(LAB_RESULTS) if done else '',
+                            completed_at=paid_at + datetime.timedelta(days=1) if done else None,
+                        ))
+                    if medicines and self.rng.random() < PHARMACY_SHARE:
+                        for _ in range(self.rng.randint(1, 3)):
+                            medicine_id, price = self.rng.choice(medicines)
+                            sales.append(MedicineSale(
+                                patient_id=appointment.patient_id, medicine_id=medicine_id,
+                                quantity=self.rng.randint(1, 3), unit_price=price, sale_date=paid_at,
+                            ))
+                Billing.objects.bulk_create(bills)
+                LabTest.objects.bulk_create(labtests)
+                MedicineSale.objects.bulk_create(sales)
+            totals['bills'] += len(bills)
+            totals['lab tests'] += len(labtests)
+            totals['medicine sales'] += len(sales)
+        self._timed('appointments', started, count)
+        self.created.update(totals)
+
+    def create_entry_logs(self, guard_ids):
+        purposes, purpose_weights = _weighted(ENTRY_PURPOSES)
+        started = time.perf_counter()
+
+        def rows():
+            for offset in range(self.entry_days, -1, -1):
+                day = self.today - datetime.timedelta(days=offset)
+                mean = self.entries_per_day * (0.6 if day.weekday() >= 5 else 1.0)
+                visits = max(0, round(self.rng.gauss(mean, math.sqrt(mean)))) if mean else 0
+                for _ in range(visits):
+                    time_in = self._moment(day, datetime.time(self.rng.randint(6, 21), self.rng.randrange(60)))
+                    yield EntryLog(
+                        person_name=' '.join(self._name()),
+                        purpose=self.rng.choices(purposes, purpose_weights)[0],
+                        time_in=time_in,
+                        time_out=time_in + datetime.timedelta(minutes=self.rng.randint(10, 180)),
+                        handled_by_id=self.rng.choice(guard_ids),
+                    )
+
+        count = 0
+        for batch in self._batches(rows()):
+            EntryLog.objects.bulk_create(batch)
+            count += len(batch)
+        self._timed('entry logs', started, count)
+
+    # ------------------------------------------------------------------
+    # Derived data
+    # ------------------------------------------------------------------
+
+    def rebuild_derived(self):
+        started = time.perf_counter()
+        rebuild_counters()
+        documents = search.rebuild_index()
+        for kind in rollups.ROLLUPS:
+            rollups.refresh(kind)
+        for model in apps.get_app_config('SamirHospital').get_models():
+            bump_version(model)
+        slot_index.invalidate()
+        self.log(f'derived data: counters, rollups and {documents} search documents in '
+                 f'{time.perf_counter() - started:.1f}s')
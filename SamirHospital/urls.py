@@ -29,19 +29,25 @@ urlpatterns = [
 
     # APPOINTMENT
     path('appointments/', views.appointment_list, name='appointment_list'),
+    path('appointments/history/', views.appointment_history, name='appointment_history'),
     path('appointments/book/', views.appointment_create, name='appointment_create'),
+    path('appointments/availability/', views.appointment_availability, name='appointment_availability'),
+    path('appointments/next-slot/', views.appointment_next_slot, name='appointment_next_slot'),
 
     # LAB TEST
     path('labtests/', views.labtest_list, name='labtest_list'),
     path('labtests/add/', views.labtest_create, name='labtest_create'),
+    path('labtests/<int:pk>/report/', views.labtest_report, name='labtest_report'),
 
     # MEDICINE
     path('medicines/', views.medicine_list, name='medicine_list'),
     path('medicines/add/', views.medicine_create, name='medicine_create'),
+    path('medicines/sell/', views.medicine_sale_create, name='medicine_sale_create'),
 
     # INVENTORY
     path('inventory/', views.inventory_list, name='inventory_list'),
     path('inventory/add/', views.inventory_create, name='inventory_create'),
+    path('stock/alerts/', views.stock_alerts, name='stock_alerts'),
 
     # SECURITY STAFF
     path('security/', views.security_list, name='security_list'),
@@ -49,10 +55,40 @@ urlpatterns = [
 
     # ENTRY LOG
     path('entrylogs/', views.entrylog_list, name='entrylog_list'),
+    path('entrylogs/history/', views.entrylog_history, name='entrylog_history'),
     path('entrylogs/add/', views.entrylog_create, name='entrylog_create'),
 
+    # LEDGER EXPORT
+    path('exports/<str:kind>.<str:fmt>', views.ledger_export, name='ledger_export'),
+
+    # BULK IMPORT
+    path('import/', views.import_records_upload, name='import_records'),
+
+    # SEARCH
+    path('search/', views.search_records, name='search'),
+
+    # ASYNC JSON API
+    path('api/v1/dashboard/', views.api_dashboard, name='api_dashboard'),
+    path('api/v1/<str:kind>/', views.api_list, name='api_list'),
+    path('api/v1/<str:kind>/batch/', views.api_batch, name='api_batch'),
+
+    # LIVE UPDATES
+    path('events/', views.live_events, name='live_events'),
+
+    # AUTOCOMPLETE
+    path('autocomplete/<str:kind>/', views.autocomplete, name='autocomplete'),
+
+    # REPORTING ROLLUPS
+    path('reports/<str:kind>/', views.rollup_chart, name='rollup_chart'),
+
+    # PERFORMANCE METRICS
+    path('metrics/', views.metrics_report, name='metrics_report'),
+
     # BILLING
     path('billing/', views.billing_list, name='billing_list'),
     path('billing/create/', views.billing_create, name='billing_create'),
+    path('billing/generate/', views.billing_generate, name='billing_generate'),
+    path('billing/fees/', views.feeschedule_list, name='feeschedule_list'),
+    path('billing/fees/add/', views.feeschedule_create, name='feeschedule_create'),
 ]
 
@@ -1,21 +1,105 @@
+import datetime
+import hmac
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import authenticate, login , logout
-from django.http import HttpResponseForbidden
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_http_methods
+from django.utils import timezone
+from django.utils.text import slugify
 from django.contrib import messages
+from django.db import transaction
 from .models import (
     Department, Doctor, Patient, Appointment, LabTest,
     Medicine, MedicineSale, InventoryItem, SecurityStaff,
-    EntryLog, Billing
+    EntryLog, Billing, FeeSchedule, StockAlert
 )
 from .forms import (
     CustomUserForm, DepartmentForm, DoctorForm, PatientForm, 
     AppointmentForm, LabTestForm, MedicineForm, 
-    MedicineSaleForm, InventoryItemForm, SecurityStaffForm, 
-    EntryLogForm, BillingForm
+    InventoryItemForm, SecurityStaffForm, 
+    EntryLogForm, BillingForm, ImportRecordsForm, FeeScheduleForm, GenerateBillsForm,
+    MedicineCheckoutForm, MedicineCartFormSet
+)
+from .budget import query_budget
+from .api import RESOURCES, BatchError, apage, batch_create, batch_update, writable
+from .listing import arender_list, render_list
+from .archive import render_range
+from . import events, rollups
+from .stats import aget_counters
+from .caching import stats as cache_stats
+from .metrics import registry as metrics_registry
+from .importers import import_records, guess_format
+from .invoicing import generate_bills
+from .exports import FORMATS, LEDGERS, ledger_rows
+from .pharmacy import SaleError, checkout
+from .reports import queue_report_processing, report_response
+from .autocomplete import ALLOWED_ROLES, DEFAULT_LIMIT, SEARCHES, search
+from . import search as full_text
+from .slots import (
+    SlotUnavailable, available_slots, book_appointment, doctors_in_department,
+    next_free_slot,
 )
 
+# Queries a list page may run on top of authentication: one keyset page fetch,
+# with every relation the template touches joined in.
+LIST_QUERY_BUDGET = 1
+
+# A history page (live plus archived rows) adds the archive catalogue and one
+# query per relation level for the archived rows on the page.  The signed-in
+# doctor's or patient's id comes from the cached principal.
+HISTORY_QUERY_BUDGET = 7
+
+
+async def _request_user(request):
+    """
+    Load the user without blocking the event loop.  Also primes the cache
+    behind ``request.user`` so templates can read it in an async view.
+    """
+    user = await request.auser()
+    request._cached_user = user
+    return user
+
+
+def _date_param(request, name):
+    """?<name>= as a date (YYYY-MM-DD) or None if absent; ValueError for bad dates."""
+    value = request.GET.get(name, '')
+    date = parse_date(value)
+    if value and date is None:
+        raise ValueError(f'{name} is not a YYYY-MM-DD date.')
+    return date
+
+
+def _date_range(request):
+    """``(from, to)`` from ?from= and ?to=; ValueError for bad dates."""
+    return _date_param(request, 'from'), _date_param(request, 'to')
+
+
+async def _personal_counts(user):
+    """Open work for a doctor's or patient's dashboard, counted with ``acount()``."""
+    today = timezone.localdate()
+    if user.role not in ('doctor', 'patient'):
+        return {}
+    counts = {
+        'upcoming_appointments': await Appointment.objects.visible_to(user).filter(
+            appointment_date__gte=today, status='scheduled').acount(),
+        'pending_labtests': await LabTest.objects.visible_to(user).filter(status='pending').acount(),
+    }
+    if user.role == 'patient':
+        counts['unpaid_bills'] = await Billing.objects.visible_to(user).filter(payment_status='pending').acount()
+    return counts
+
 def login_dashboard(request):
     # If already logged in, redirect based on role
     if request.user.is_authenticated:
@@ -44,23 +128,20 @@ def register_user(request):
     return render(request, 'hospital/register.html', {'form': form})
 
 @login_required
-def dashboard(request):
-    return render(request, 'hospital/dashboard.html')
+async def dashboard(request):
+    user = await _request_user(request)
+    return render(request, 'hospital/dashboard.html', {'counts': await _personal_counts(user)})
 
 @login_required
-def admin_dashboard(request):
-    if not request.user.is_superuser and request.user.role != 'admin':
+@query_budget(1)
+async def admin_dashboard(request):
+    user = await _request_user(request)
+    if not user.is_superuser and user.role != 'admin':
         return HttpResponseForbidden("Access denied.")
 
-    context = {
-        'total_patients': Patient.objects.count(),
-        'total_doctors': Doctor.objects.count(),
-        'total_appointments': Appointment.objects.count(),
-        'total_labtests': LabTest.objects.count(),
-        'total_medicines': Medicine.objects.count(),
-        'total_inventory': InventoryItem.objects.count(),
-        'total_bills': Billing.objects.count(),
-    }
+    # Every figure comes from the materialised counter table in one query
+    # (none while it is cached).
+    context = dict(await aget_counters(), cache_stats=cache_stats.snapshot())
     return render(request, 'hospital/admin_dashboard.html', context)
 
 @login_required
@@ -83,9 +164,10 @@ def create_admin_user(request):
 # ========== DEPARTMENT ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def department_list(request):
     departments = Department.objects.all()
-    return render(request, 'hospital/department_list.html', {'departments': departments})
+    return render_list(request, 'hospital/department_list.html', 'departments', departments)
 
 @login_required
 def department_create(request):
@@ -101,9 +183,10 @@ def department_create(request):
 # ========== DOCTOR ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def doctor_list(request):
     doctors = Doctor.objects.all()
-    return render(request, 'hospital/doctor_list.html', {'doctors': doctors})
+    return render_list(request, 'hospital/doctor_list.html', 'doctors', doctors)
 
 @login_required
 def doctor_create(request):
@@ -118,9 +201,10 @@ def doctor_create(request):
 # ========== PATIENT ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def patient_list(request):
-    patients = Patient.objects.all()
-    return render(request, 'hospital/patients_list.html', {'patients': patients})
+    patients = Patient.objects.visible_to(request.user)
+    return render_list(request, 'hospital/patients_list.html', 'patients', patients)
 
 @login_required
 def patient_create(request):
@@ -136,14 +220,33 @@ def patient_create(request):
 # ========== APPOINTMENT ==========
 
 @login_required
-def appointment_list(request):
-    if request.user.role == 'doctor':
-        appointments = Appointment.objects.filter(doctor__user=request.user)
-    elif request.user.role == 'patient':
-        appointments = Appointment.objects.filter(patient__user=request.user)
-    else:
-        appointments = Appointment.objects.all()
-    return render(request, 'hospital/appointment_list.html', {'appointments': appointments})
+@query_budget(LIST_QUERY_BUDGET)
+async def appointment_list(request):
+    appointments = Appointment.objects.visible_to(await _request_user(request))
+    if request.GET.get('status'):
+        appointments = appointments.filter(status=request.GET['status'])
+    # Reception screens for one doctor or department; live updates take the same filters.
+    if request.GET.get('doctor', '').isdigit():
+        appointments = appointments.filter(doctor_id=request.GET['doctor'])
+    if request.GET.get('department', '').isdigit():
+        appointments = appointments.filter(doctor__department_id=request.GET['department'])
+    return await arender_list(request, 'hospital/appointment_list.html', 'appointments', appointments,
+                              ordering=('-appointment_date', '-id'))
+
+@login_required
+@query_budget(HISTORY_QUERY_BUDGET)
+def appointment_history(request):
+    """Appointments in a date range, including completed ones already archived."""
+    try:
+        date_from, date_to = _date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("from and to must be valid dates.")
+    filters = Appointment.objects.owner_filters(request.user)
+    if request.GET.get('status'):
+        filters['status'] = request.GET['status']
+    return render_range(request, 'hospital/appointment_list.html', 'appointments', 'appointments',
+                        Appointment.objects.all(), date_from, date_to, filters,
+                        extra_context={'history': True, 'date_from': date_from, 'date_to': date_to})
 
 @login_required
 def appointment_create(request):
@@ -156,9 +259,15 @@ def appointment_create(request):
         if form.is_valid():
             appointment = form.save(commit=False)
             # Auto-assign the logged-in patient
-            appointment.patient = Patient.objects.get(user=request.user)
-            appointment.save()
-            return redirect('appointment_list')
+            appointment.patient_id = request.principal.patient_id
+            if appointment.patient_id is None:
+                return HttpResponseForbidden("Your account has no patient record.")
+            try:
+                book_appointment(appointment)
+            except SlotUnavailable as exc:
+                form.add_error('start_time', str(exc))
+            else:
+                return redirect('appointment_list')
     else:
         form = AppointmentForm()
 
@@ -166,28 +275,108 @@ def appointment_create(request):
 
 
 
+def _slot_json(slot):
+    return {
+        'doctor': slot.doctor_id,
+        'date': slot.date.isoformat(),
+        'start': slot.start.strftime('%H:%M'),
+        'end': slot.end.strftime('%H:%M'),
+    }
+
+def _requested_doctors(request):
+    """Doctor ids for ?doctor= or ?department=; Http404 if there is no such doctor or department."""
+    if request.GET.get('doctor'):
+        doctor_id = int(request.GET['doctor'])
+        if not Doctor.objects.filter(pk=doctor_id).exists():
+            raise Http404("Unknown doctor.")
+        return [doctor_id]
+    if request.GET.get('department'):
+        department_id = int(request.GET['department'])
+        doctor_ids = doctors_in_department(department_id)
+        if not doctor_ids and not Department.objects.filter(pk=department_id).exists():
+            raise Http404("Unknown department.")
+        return doctor_ids
+    return None
+
+@login_required
+def appointment_availability(request):
+    """Open slots for ?doctor= or ?department= between ?start= and ?end=."""
+    try:
+        doctor_ids = _requested_doctors(request)
+    except ValueError:
+        doctor_ids = None
+    if doctor_ids is None:
+        return JsonResponse({'error': 'Pass a doctor or department id.'}, status=400)
+    try:
+        start = _date_param(request, 'start') or timezone.localdate()
+        end = _date_param(request, 'end') or start + datetime.timedelta(days=6)
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be valid dates.'}, status=400)
+    if (end - start).days > 92:
+        return JsonResponse({'error': 'Date range is limited to 92 days.'}, status=400)
+    slots = available_slots(doctor_ids, start, end, limit=500)
+    return JsonResponse({'slots': [_slot_json(slot) for slot in slots]})
+
+@login_required
+def appointment_next_slot(request):
+    """Earliest open slot for ?doctor= or ?department=."""
+    try:
+        doctor_ids = _requested_doctors(request)
+    except ValueError:
+        doctor_ids = None
+    if doctor_ids is None:
+        return JsonResponse({'error': 'Pass a doctor or department id.'}, status=400)
+    try:
+        after = _date_param(request, 'after')
+    except ValueError:
+        return JsonResponse({'error': 'after must be a valid date.'}, status=400)
+    slot = next_free_slot(doctor_ids, after)
+    return JsonResponse({'slot': _slot_json(slot) if slot else None})
+
+
 # ========== LAB TEST ==========
 
 @login_required
-def labtest_list(request):
-    labtests = LabTest.objects.all()
-    return render(request, 'hospital/labtest_list.html', {'labtests': labtests})
+@query_budget(LIST_QUERY_BUDGET)
+async def labtest_list(request):
+    labtests = LabTest.objects.visible_to(await _request_user(request))
+    if request.GET.get('status'):
+        labtests = labtests.filter(status=request.GET['status'])
+    return await arender_list(request, 'hospital/labtest_list.html', 'labtests', labtests,
+                              ordering=('-test_date', '-id'))
 
 @login_required
 def labtest_create(request):
+    # Uploads above FILE_UPLOAD_MAX_MEMORY_SIZE were already streamed to a
+    # temporary file, which storage moves into place; checksum, text
+    # extraction and thumbnail happen in a background job.
     form = LabTestForm(request.POST or None, request.FILES or None)
     if form.is_valid():
-        form.save()
+        with transaction.atomic():
+            labtest = form.save()
+            if labtest.report_file:
+                queue_report_processing(labtest)
         return redirect('labtest_list')
     return render(request, 'hospital/forms.html', {'form': form, 'title': 'Add Lab Test'})
 
 
+@login_required
+def labtest_report(request, pk):
+    """Download a lab report the user may see (a 404 for anyone else's)."""
+    labtest = get_object_or_404(LabTest.objects.visible_to(request.user), pk=pk)
+    if not labtest.report_file or not labtest.report_file.storage.exists(labtest.report_file.name):
+        raise Http404("No report uploaded for this test.")
+    extension = os.path.splitext(labtest.report_file.name)[1]
+    return report_response(request, labtest.report_file, f'{slugify(labtest.test_name) or "report"}-{labtest.pk}{extension}')
+
+
 # ========== MEDICINE ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def medicine_list(request):
     medicines = Medicine.objects.all()
-    return render(request, 'hospital/medicine_list.html', {'medicines': medicines})
+    return render_list(request, 'hospital/medicine_list.html', 'medicines', medicines)
 
 @login_required
 def medicine_create(request):
@@ -199,13 +388,36 @@ def medicine_create(request):
         return redirect('medicine_list')
     return render(request, 'hospital/forms.html', {'form': form, 'title': 'Add Medicine'})
 
+@login_required
+def medicine_sale_create(request):
+    if request.user.role not in ('admin', 'nurse'):
+        return HttpResponseForbidden("Only pharmacy staff can sell medicines.")
+    form = MedicineCheckoutForm(request.POST or None)
+    cart = MedicineCartFormSet(request.POST or None, prefix='cart')
+    if form.is_valid() and cart.is_valid():
+        lines = [
+            (line['medicine'].pk, line['quantity'])
+            for line in cart.cleaned_data if line.get('medicine') and line.get('quantity')
+        ]
+        try:
+            billing, sales = checkout(
+                form.cleaned_data['patient'], lines, form.cleaned_data['payment_method']
+            )
+        except SaleError as exc:
+            form.add_error(None, str(exc))
+        else:
+            messages.success(request, f"Sale recorded on bill #{billing.pk} (Rs. {billing.total}).")
+            return redirect('billing_list')
+    return render(request, 'hospital/medicine_sale.html', {'form': form, 'cart': cart})
+
 
 # ========== INVENTORY ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def inventory_list(request):
     items = InventoryItem.objects.all()
-    return render(request, 'hospital/inventory_list.html', {'items': items})
+    return render_list(request, 'hospital/inventory_list.html', 'items', items)
 
 @login_required
 def inventory_create(request):
@@ -217,13 +429,23 @@ def inventory_create(request):
         return redirect('inventory_list')
     return render(request, 'hospital/forms.html', {'form': form, 'title': 'Add Inventory Item'})
 
+@login_required
+@query_budget(LIST_QUERY_BUDGET)
+def stock_alerts(request):
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can view stock alerts.")
+    # Open alerts only, soonest first, straight from stockalert_open_idx.
+    alerts = StockAlert.objects.filter(resolved_at__isnull=True)
+    return render_list(request, 'hospital/stockalert_list.html', 'alerts', alerts, ordering=('due_date', 'pk'))
+
 
 # ========== SECURITY ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def security_list(request):
     staff = SecurityStaff.objects.all()
-    return render(request, 'hospital/security_list.html', {'staff': staff})
+    return render_list(request, 'hospital/security_list.html', 'staff', staff)
 
 @login_required
 def security_create(request):
@@ -239,9 +461,23 @@ def security_create(request):
 # ========== ENTRY LOG ==========
 
 @login_required
+@query_budget(LIST_QUERY_BUDGET)
 def entrylog_list(request):
     logs = EntryLog.objects.all()
-    return render(request, 'hospital/entrylog_list.html', {'logs': logs})
+    return render_list(request, 'hospital/entrylog_list.html', 'logs', logs,
+                       ordering=('-time_in', '-id'))
+
+@login_required
+@query_budget(HISTORY_QUERY_BUDGET)
+def entrylog_history(request):
+    """Entry logs in a date range, including archived ones."""
+    try:
+        date_from, date_to = _date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("from and to must be valid dates.")
+    return render_range(request, 'hospital/entrylog_list.html', 'logs', 'entrylogs',
+                        EntryLog.objects.all(), date_from, date_to,
+                        extra_context={'history': True, 'date_from': date_from, 'date_to': date_to})
 
 @login_required
 def entrylog_create(request):
@@ -257,9 +493,13 @@ def entrylog_create(request):
 # ========== BILLING ==========
 
 @login_required
-def billing_list(request):
-    billings = Billing.objects.all()
-    return render(request, 'hospital/billing_list.html', {'billings': billings})
+@query_budget(LIST_QUERY_BUDGET)
+async def billing_list(request):
+    billings = Billing.objects.visible_to(await _request_user(request))
+    if request.GET.get('status'):
+        billings = billings.filter(payment_status=request.GET['status'])
+    return await arender_list(request, 'hospital/billing_list.html', 'billings', billings,
+                              ordering=('-payment_date', '-id'))
 
 @login_required
 def billing_create(request):
@@ -270,6 +510,244 @@ def billing_create(request):
         form.save()
         return redirect('billing_list')
     return render(request, 'hospital/forms.html', {'form': form, 'title': 'Create Bill'})
+
+@login_required
+def billing_generate(request):
+    """Bill every completed, unbilled appointment from the fee schedule."""
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can generate bills.")
+    form = GenerateBillsForm(request.POST or None)
+    if form.is_valid():
+        report = generate_bills(form.cleaned_data['until'], payment_method=form.cleaned_data['payment_method'])
+        messages.success(request, str(report))
+        return redirect('billing_list')
+    return render(request, 'hospital/forms.html', {'form': form, 'title': 'Generate Bills'})
+
+@login_required
+@query_budget(LIST_QUERY_BUDGET)
+def feeschedule_list(request):
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can view the fee schedule.")
+    rules = FeeSchedule.objects.all()
+    return render_list(request, 'hospital/feeschedule_list.html', 'rules', rules)
+
+@login_required
+def feeschedule_create(request):
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can change the fee schedule.")
+    form = FeeScheduleForm(request.POST or None)
+    if form.is_valid():
+        form.save()
+        return redirect('feeschedule_list')
+    return render(request, 'hospital/forms.html', {'form': form, 'title': 'Add Fee Rule'})
+
+
+# ========== JSON API (v1) ==========
+
+@login_required
+@query_budget(LIST_QUERY_BUDGET)
+async def api_list(request, kind):
+    """A page of appointments, lab tests or bills the user may see, as JSON."""
+    if kind not in RESOURCES:
+        raise Http404("Unknown resource.")
+    user = await _request_user(request)
+    try:
+        page = await apage(request, kind, RESOURCES[kind]['model'].objects.visible_to(user))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(page)
+
+@login_required
+@require_http_methods(['POST', 'PATCH'])
+def api_batch(request, kind):
+    """
+    Create (POST) or update (PATCH) a batch of records in one transaction.
+    The body is ``{"records": [...]}``; updates carry each record's ``id``.
+    """
+    if kind not in RESOURCES:
+        raise Http404("Unknown resource.")
+    if not writable(kind, request.user):
+        return JsonResponse({'error': 'You cannot write these records.'}, status=403)
+    try:
+        records = json.loads(request.body).get('records')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'The body must be a JSON object with a "records" list.'}, status=400)
+    try:
+        if request.method == 'POST':
+            return JsonResponse({'created': batch_create(kind, request.user, records)}, status=201)
+        return JsonResponse({'updated': batch_update(kind, request.user, records)})
+    except BatchError as exc:
+        return JsonResponse({'errors': exc.errors}, status=400)
+
+@login_required
+@query_budget(3)
+async def api_dashboard(request):
+    """Hospital-wide counters for admins, the user's own open work otherwise."""
+    user = await _request_user(request)
+    if user.is_superuser or user.role == 'admin':
+        return JsonResponse(await aget_counters())
+    return JsonResponse(await _personal_counts(user))
+
+
+
+# ========== LIVE UPDATES ==========
+
+@login_required
+async def live_events(request):
+    """
+    Server-Sent Events stream of appointment, lab test and entry log changes
+    (see events.py).  Needs an ASGI server; filters: ``kinds``, ``doctor``,
+    ``department``.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would have to buffer the endless stream; 204 tells
+        # EventSource not to reconnect, and the page works without updates.
+        return HttpResponse(status=204)
+    user = await _request_user(request)
+    try:
+        subscription, replay = await events.open_stream(user, request.GET, request.headers.get('Last-Event-ID'))
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    if subscription is None:
+        return HttpResponseForbidden("You cannot follow these updates.")
+    response = StreamingHttpResponse(events.EventStream(subscription, replay), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: pass each event on at once
+    return response
+
+# ========== LEDGER EXPORT ==========
+
+@login_required
+def ledger_export(request, kind, fmt):
+    """
+    Stream the ``kind`` ledger as CSV or XLSX. Accepts ?from=, ?to=
+    (YYYY-MM-DD), ?status= and ?after=<id> to resume an interrupted download.
+    """
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can export ledgers.")
+    if kind not in LEDGERS or fmt not in FORMATS:
+        raise Http404("Unknown export.")
+    try:
+        after = int(request.GET.get('after') or 0)
+    except ValueError:
+        return HttpResponseBadRequest("after must be a record id.")
+    try:
+        date_from, date_to = _date_range(request)
+    except ValueError:
+        return HttpResponseBadRequest("from and to must be valid dates.")
+
+    rows = ledger_rows(kind, date_from, date_to, request.GET.get('status'), after)
+    stream, content_type = FORMATS[fmt]
+    response = StreamingHttpResponse(stream(rows), content_type=content_type)
+    suffix = f'-after-{after}' if after else ''
+    response['Content-Disposition'] = f'attachment; filename="{kind}-ledger{suffix}.{fmt}"'
+    return response
+
+# ========== BULK IMPORT ==========
+
+@login_required
+def import_records_upload(request):
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can import records.")
+    form = ImportRecordsForm(request.POST or None, request.FILES or None)
+    if form.is_valid():
+        upload = form.cleaned_data['file']
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        report = import_records(form.cleaned_data['kind'], stream, guess_format(upload.name))
+        return render(request, 'hospital/import_result.html', {'report': report})
+    return render(request, 'hospital/forms.html', {'form': form, 'title': 'Import Records'})
+
+# ========== FULL-TEXT SEARCH ==========
+
+SEARCH_ROLES = {'admin', 'doctor', 'nurse'}
+
+@login_required
+def search_records(request):
+    """Ranked matches for ?q= in patient records and lab results; ?format=json for JSON."""
+    if request.user.role not in SEARCH_ROLES:
+        return HttpResponseForbidden("Only clinical staff can search records.")
+    query = request.GET.get('q', '')
+    kind = request.GET.get('kind') or None
+    if kind not in (None, 'patient', 'labtest'):
+        return HttpResponseBadRequest("kind must be patient or labtest.")
+    hits = full_text.search(query, kind=kind, user=request.user)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'results': [
+            {'kind': hit.kind, 'id': hit.object_id, 'patient': hit.patient_id,
+             'title': hit.title, 'snippet': str(hit.snippet), 'rank': hit.rank}
+            for hit in hits
+        ]})
+    return render(request, 'hospital/search.html', {'query': query, 'kind': kind, 'hits': hits})
+
+# ========== AUTOCOMPLETE ==========
+
+@login_required
+def autocomplete(request, kind):
+    """Prefix matches for ?q= as ``{"results": [{"id", "text"}, ...]}``."""
+    if kind not in SEARCHES:
+        raise Http404("Unknown lookup.")
+    allowed = ALLOWED_ROLES.get(kind)
+    if allowed is not None and request.user.role not in allowed:
+        return HttpResponseForbidden("You cannot search these records.")
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a number.")
+    return JsonResponse({'results': search(kind, request.GET.get('q', ''), limit, user=request.user)})
+
+# ========== REPORTING ==========
+
+REPORT_DEFAULT_DAYS = 30
+
+@login_required
+def rollup_chart(request, kind):
+    """
+    Chart-ready JSON from the reporting rollups.  Accepts ?measure=,
+    ?from= / ?to= (YYYY-MM-DD, default the last 30 days), ?grain=day|week|month
+    and ?by=department|doctor|payment_method.
+    """
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can view reports.")
+    if kind not in rollups.ROLLUPS:
+        raise Http404("Unknown report.")
+    try:
+        date_from, date_to = _date_range(request)
+        date_to = date_to or timezone.localdate()
+        date_from = date_from or date_to - datetime.timedelta(days=REPORT_DEFAULT_DAYS - 1)
+        data = rollups.chart(
+            kind, request.GET.get('measure') or next(iter(rollups.MEASURES[kind])),
+            date_from, date_to, request.GET.get('grain', 'day'), request.GET.get('by') or None,
+        )
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return JsonResponse(data)
+
+# ========== METRICS ==========
+
+def _is_scraper(request):
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+def metrics_export(request):
+    """Prometheus scrape target: this process's request histograms as text."""
+    user = request.user
+    is_admin = user.is_authenticated and (user.is_superuser or user.role == 'admin')
+    if not is_admin and not _is_scraper(request):
+        return HttpResponseForbidden("Metrics are only available to admins and the scraper.")
+    return HttpResponse(metrics_registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required
+def metrics_report(request):
+    """p50/p95/p99 latency, SQL and template cost per view, slowest first."""
+    if not request.user.is_superuser and request.user.role != 'admin':
+        return HttpResponseForbidden("Only admin can view performance metrics.")
+    return render(request, 'hospital/metrics.html', {
+        'rows': metrics_registry.report(),
+        'n_plus_one_threshold': settings.METRICS_N_PLUS_ONE_THRESHOLD,
+    })
+
 # Login view
 def login_view(request):
     form = AuthenticationForm(request, data=request.POST or None)
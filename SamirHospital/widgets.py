@@ -0,0 +1,38 @@
+"""
+Form widgets.
+
+:class:`AutocompleteSelect` replaces a ``<select>`` listing every patient or
+user with one that renders only the current value; the script in
+``base.html`` fills it from the ``autocomplete`` endpoint as the user types.
+"""
+from django import forms
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """``<select>`` whose options are looked up with ``autocomplete/<kind>/``."""
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse('autocomplete', args=[self.kind])
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        """Render the empty choice and the selected value(s) only."""
+        field = self.choices.field
+        selected = [v for v in value if v not in ('', None)]
+        options = []
+        if field.empty_label is not None:
+            options.append(self.create_option(name, '', field.empty_label, not selected, 0))
+        if selected:
+            try:
+                objects = list(self.choices.queryset.filter(pk__in=selected))
+            except (TypeError, ValueError):
+                objects = []
+            for index, obj in enumerate(objects, start=len(options)):
+                options.append(self.create_option(name, obj.pk, field.label_from_instance(obj), True, index))
+        return [(None, options, 0)]
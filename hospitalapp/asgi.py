@@ -3,14 +3,47 @@ ASGI config for hospitalapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Live updates (``/hospital/events/``, see SamirHospital/events.py) are long-lived
+streams and need this entry point, e.g. ``uvicorn hospitalapp.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
+import contextvars
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospitalapp.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+EVENTS_PATH = '/hospital/events/'
+
+# Django gives every request its own thread for sync code (middleware, ORM)
+# and keeps it until the response ends, so each open live-update stream
+# would park an idle thread.  Streams share this one context instead.  It is
+# entered once, in a task of its own, and never exited: its single thread
+# lives as long as the process.  Each stream then runs in a copy of that
+# task's context, where Django's per-request context is a no-op.
+events_context = ThreadSensitiveContext()
+_events_vars = None
+
+
+async def _enter_events_context():
+    await events_context.__aenter__()
+    return contextvars.copy_context()
+
+
+async def application(scope, receive, send):
+    global _events_vars
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        if _events_vars is None:
+            _events_vars = await asyncio.ensure_future(_enter_events_context())
+        # A task runs in a copy of the context it is created in.
+        await _events_vars.run(asyncio.ensure_future, django_application(scope, receive, send))
+        return
+    await django_application(scope, receive, send)
@@ -19,7 +19,10 @@ from django.urls import path , include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from SamirHospital.views import metrics_export
+
 urlpatterns = [
     path('admin/', admin.site.urls),
    path('hospital/', include('SamirHospital.urls')),
+    path('metrics', metrics_export, name='metrics'),
 ]+ static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)